@@ -1,16 +1,23 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response
 from datetime import datetime, timedelta
 import os
+import hashlib
 import json
-import logging
-import traceback
-from werkzeug.security import generate_password_hash, check_password_hash
-from pupdb.core import PupDB
+from storage import (CachedStorage, FileStorage, QueuedStorage, SearchIndex, TaskCache, TaskNotFound, TimedStorage,
+                     create_storage)
+from storage.base import date_key
+from storage.migrate import migrate_legacy
 from flask_cors import CORS
+from date_views import in_bounds, range_from_args
+from pagination import encode_cursor, page_args
+from task_ids import new_task_id
+from logging_config import dropped_records, setup_logging
+from metrics import REGISTRY, instrument_app
+from json_provider import install_json
+from password_hashing import HashPoolFull, PasswordHasher
 
 # Configure logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+logger = setup_logging('app')
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-123'
@@ -31,11 +38,11 @@ CORS(app,
          "origins": "*",
          "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
          "allow_headers": ["Content-Type", "Authorization"],
-         "expose_headers": ["Content-Type", "Authorization"],
+         "expose_headers": ["Content-Type", "Authorization", "X-Next-Cursor", "ETag", "X-Task-Version"],
          "supports_credentials": True
      }},
      allow_headers=["Content-Type", "Authorization"],
-     expose_headers=["Content-Type", "Authorization"],
+     expose_headers=["Content-Type", "Authorization", "X-Next-Cursor", "ETag", "X-Task-Version"],
      max_age=600)
 
 @app.after_request
@@ -45,64 +52,89 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
-# Initialize PupDB with error handling
+# Per-route request metrics, served with the storage timings at /metrics
+instrument_app(app)
+# Large task listings are encoded with orjson when it is installed
+install_json(app)
+
+# Initialize storage (STORAGE_BACKEND=file|sqlite); the first start imports
+# the legacy tasks.db / users.db / *.json files
+logger.info("Initializing databases...")
+backend = create_storage()
 try:
-    logger.info("Initializing databases...")
-    users_db = PupDB('users.db')
-    tasks_db = PupDB('tasks.db')
-    
-    # Initialize tasks database if empty
-    if not tasks_db.get('tasks'):
-        logger.info("Initializing empty tasks database")
-        tasks_db.set('tasks', {})
+    migrate_legacy(backend, 'tasks.db', 'tasks.json', 'users.db', 'users.json',
+                   task_root=None if isinstance(backend, FileStorage) else os.getenv('TASK_STORE_DIR', 'task_shards'))
 except Exception as e:
-    logger.error(f"Error initializing database: {str(e)}")
-    logger.error(traceback.format_exc())
-    # Create new database files if they don't exist
-    users_db = PupDB('users.db')
-    tasks_db = PupDB('tasks.db')
-    tasks_db.set('tasks', {})
+    logger.exception("Error migrating legacy data: %s", e)
+
+# Per-user task maps are served from an in-process LRU; writes go through it
+task_cache = TaskCache(
+    max_entries=int(os.getenv('TASK_CACHE_ENTRIES', '1024')),
+    max_bytes=int(os.getenv('TASK_CACHE_BYTES', str(64 * 1024 * 1024))) or None,
+)
+# All task writes funnel through one commit thread, which groups the writes
+# arriving within the window into a single write per user
+store = QueuedStorage(
+    CachedStorage(TimedStorage(backend, os.getenv('STORAGE_BACKEND', 'file')), task_cache),
+    window=float(os.getenv('STORAGE_COMMIT_WINDOW_MS', '2')) / 1000,
+    max_batch=int(os.getenv('STORAGE_COMMIT_MAX_BATCH', '256')),
+)
+
+REGISTRY.gauge('task_cache_hits', 'Task cache hits since start.', lambda: task_cache.stats()['hits'])
+REGISTRY.gauge('task_cache_misses', 'Task cache misses since start.', lambda: task_cache.stats()['misses'])
+REGISTRY.gauge('commit_queue_depth', 'Task writes waiting for the commit thread.', lambda: store.stats()['queued'])
+REGISTRY.gauge('log_records_dropped', 'Log records dropped because the log queue was full.', dropped_records)
+
+# Inverted index for /api/tasks/search, kept current by the write handlers
+search_index = SearchIndex(max_users=int(os.getenv('SEARCH_INDEX_USERS', '1024')))
+
+# Most operations accepted by one POST /api/tasks/batch
+MAX_BATCH_OPS = int(os.getenv('MAX_BATCH_OPS', '1000'))
 
 def get_user(email):
     try:
-        user = users_db.get(email)
+        user = store.get_user(email)
         if user and 'email' not in user:
             user['email'] = email
             save_user(email, user)
         return user
     except Exception as e:
-        logger.error(f"Error getting user: {str(e)}")
+        logger.error("Error getting user: %s", e)
         return None
 
 def save_user(email, user_data):
     try:
-        users_db.set(email, user_data)
+        store.save_user(email, user_data)
     except Exception as e:
-        logger.error(f"Error saving user: {str(e)}")
+        logger.error("Error saving user: %s", e)
         raise
 
 def get_user_tasks(user_id):
     try:
-        tasks = tasks_db.get('tasks', {})
-        return {task_id: task for task_id, task in tasks.items() 
-                if task.get('user_id') == user_id}
+        return store.get_user_tasks(user_id)
     except Exception as e:
-        logger.error(f"Error getting user tasks: {str(e)}")
+        logger.error("Error getting user tasks: %s", e)
         return {}
 
+def reindex_tasks(user_id, task_ids):
+    # Index the tasks as the store committed them, not as the request sent them
+    for task_id in task_ids:
+        task = store.get_task(user_id, task_id)
+        if task is None:
+            search_index.remove(user_id, task_id)
+        else:
+            search_index.add(user_id, task)
+
 def save_task(task_id, task_data):
     try:
-        tasks = tasks_db.get('tasks', {})
-        tasks[task_id] = task_data
-        tasks_db.set('tasks', tasks)
+        store.save_task(task_data['user_id'], task_id, task_data)
     except Exception as e:
-        logger.error(f"Error saving task: {str(e)}")
+        logger.error("Error saving task: %s", e)
         raise
 
 @app.route('/')
 def index():
-    logger.info(f"Index route accessed. Session: {session}")
-    logger.info(f"Request headers: {request.headers}")
+    logger.debug("Index route accessed by %s", session.get('user_id'))
     
     if 'user_id' not in session:
         logger.warning("No user_id in session, redirecting to login")
@@ -110,29 +142,39 @@ def index():
     
     user = get_user(session['user_id'])
     if not user:
-        logger.warning(f"User {session['user_id']} not found, clearing session")
+        logger.warning("User %s not found, clearing session", session['user_id'])
         session.clear()
         return redirect(url_for('login'))
         
-    logger.info(f"User {session['user_id']} accessing index page")
+    logger.debug("User %s accessing index page", session['user_id'])
     return render_template('index.html', user=user)
 
+# Hashes passwords in worker processes; a burst of logins gets 503s instead
+# of every request thread while task pages wait
+password_hasher = PasswordHasher()
+
+@app.errorhandler(HashPoolFull)
+def hashing_busy(e):
+    logger.warning("Password hashing at capacity; retry in %ss", e.retry_after)
+    template = 'register.html' if request.endpoint == 'register' else 'login.html'
+    return (render_template(template, error='Too many sign-ins right now, please try again in a few seconds'), 503,
+            {'Retry-After': str(e.retry_after)})
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
-    logger.info(f"Login route accessed. Method: {request.method}")
-    logger.info(f"Current session: {session}")
+    logger.debug("Login route accessed. Method: %s", request.method)
     
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
         
-        logger.info(f"Login attempt for email: {email}")
+        logger.info("Login attempt for email: %s", email)
         user = get_user(email)
-        if user and check_password_hash(user['password'], password):
+        if user and password_hasher.check(user['password'], password):
             session.clear()  # Xóa session cũ
             session['user_id'] = email
             session.permanent = True
-            logger.info(f"User {email} logged in successfully. Session: {session}")
+            logger.info("User %s logged in successfully", email)
             
             # Tạo response với cookie session
             response = make_response(redirect(url_for('index')))
@@ -143,10 +185,9 @@ def login():
                 samesite='Lax',
                 max_age=86400
             )
-            logger.info(f"Response headers: {response.headers}")
             return response
             
-        logger.warning(f"Failed login attempt for email: {email}")
+        logger.warning("Failed login attempt for email: %s", email)
         return render_template('login.html', error='Invalid email or password')
     
     return render_template('login.html')
@@ -158,71 +199,155 @@ def register():
         password = request.form.get('password')
         name = request.form.get('name')
         
-        logger.info(f"Registration attempt for email: {email}")
+        logger.info("Registration attempt for email: %s", email)
         if get_user(email):
-            logger.warning(f"Registration failed - Email already exists: {email}")
+            logger.warning("Registration failed - Email already exists: %s", email)
             return render_template('register.html', error='Email already exists')
         
         user_data = {
             'name': name,
             'email': email,
-            'password': generate_password_hash(password)
+            'password': password_hasher.generate(password)
         }
         save_user(email, user_data)
         session['user_id'] = email
-        logger.info(f"User {email} registered successfully")
+        logger.info("User %s registered successfully", email)
         return redirect(url_for('index'))
     
     return render_template('register.html')
 
 @app.route('/logout')
 def logout():
-    logger.info(f"Logging out user. Session before logout: {session}")
+    logger.info("Logging out user %s", session.get('user_id'))
     session.clear()
-    logger.info("Session cleared")
+    logger.debug("Session cleared")
     return redirect(url_for('login'))
 
+def _with_etag(response, etag, version):
+    response.set_etag(etag)
+    # Where a client starts following /api/tasks/changes from
+    response.headers['X-Task-Version'] = str(version)
+    # Cacheable by the browser only, and always revalidated with If-None-Match
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    logger.info(f"GET /api/tasks - Session: {session}")
+    logger.debug("GET /api/tasks for user %s", session.get('user_id'))
     if 'user_id' not in session:
         logger.warning("Unauthorized access attempt to get_tasks")
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        logger.info(f"Fetching tasks for user: {session['user_id']}")
-        tasks = tasks_db.get('tasks')
-        logger.debug(f"Raw tasks from database: {tasks}")
-        
-        if not tasks:
-            logger.info("No tasks found, returning empty object")
-            return jsonify({})
-            
-        if not isinstance(tasks, dict):
-            logger.warning("Tasks is not a dictionary, resetting to empty dict")
-            tasks = {}
-            
-        user_tasks = {task_id: task for task_id, task in tasks.items() 
-                     if task.get('user_id') == session['user_id']}
-        logger.info(f"Found {len(user_tasks)} tasks for user")
-        logger.debug(f"User tasks: {user_tasks}")
+        date_range = range_from_args(request.args)
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        logger.warning("Invalid task view requested: %s", e)
+        return jsonify({'error': str(e)}), 400
+    if date_range is None and (limit or after):
+        # Pages are always cut from the date-ordered listing
+        date_range = (None, None)
+
+    # The user's version changes on every write, so version + query pins the body
+    version = store.get_version(session['user_id'])
+    digest = hashlib.sha1(f"{session['user_id']}|{version}|{request.query_string.decode()}".encode()).hexdigest()
+    etag = f"{version}-{digest[:16]}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    try:
+        logger.debug("Fetching tasks for user: %s", session['user_id'])
+        if date_range is not None:
+            # Date views come back as a list already sorted by (date, id)
+            user_tasks = store.get_user_tasks_by_date(
+                session['user_id'], *date_range, after=after,
+                limit=limit + 1 if limit else None)
+            next_cursor = None
+            if limit and len(user_tasks) > limit:
+                user_tasks = user_tasks[:limit]
+                next_cursor = encode_cursor(list(date_key(user_tasks[-1])))
+            logger.debug("Found %s tasks for user in %s", len(user_tasks), date_range)
+            response = jsonify(user_tasks)
+            if next_cursor:
+                response.headers['X-Next-Cursor'] = next_cursor
+            return _with_etag(response, etag, version)
+
+        user_tasks = store.get_user_tasks(session['user_id'])
+        logger.debug("Found %s tasks for user", len(user_tasks))
         
-        return jsonify(user_tasks)
+        return _with_etag(jsonify(user_tasks), etag, version)
     except Exception as e:
-        logger.error(f"Error getting tasks: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error getting tasks: %s", e)
         return jsonify({})
 
+@app.route('/api/tasks/changes', methods=['GET'])
+def get_task_changes():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    since = request.args.get('since', '')
+    if not since.isdigit():
+        return jsonify({'error': 'since must be a non-negative integer'}), 400
+    try:
+        date_range = range_from_args(request.args) or (None, None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        user_id = session['user_id']
+        result = store.get_changes(user_id, int(since))
+        if result is None:
+            # Too far behind (or a version we never issued): reload everything
+            return jsonify({'error': 'Resync required', 'version': store.get_version(user_id)}), 410
+        version, changed = result
+        changes = []
+        for task_id, task in changed:
+            # With a view, tasks moved out of its range read as deletes too
+            if task is not None and in_bounds(task.get('date'), *date_range):
+                changes.append({'op': 'upsert', 'id': task_id, 'task': task})
+            else:
+                changes.append({'op': 'delete', 'id': task_id})
+        return jsonify({'version': version, 'changes': changes})
+    except Exception as e:
+        logger.exception("Error getting task changes: %s", e)
+        return jsonify({'error': 'Failed to get task changes'}), 500
+
+@app.route('/api/tasks/search', methods=['GET'])
+def search_tasks():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    query = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    try:
+        user_id = session['user_id']
+        matches = search_index.search(user_id, query, limit, store.get_user_tasks)
+        results = []
+        for score, task_id in matches:
+            task = store.get_task(user_id, task_id)
+            if task is not None:
+                results.append({**task, 'score': score})
+        return jsonify(results)
+    except Exception as e:
+        logger.exception("Error searching tasks: %s", e)
+        return jsonify({'error': 'Failed to search tasks'}), 500
+
 @app.route('/api/tasks', methods=['POST'])
 def add_task():
-    logger.info(f"POST /api/tasks - Session: {session}")
+    logger.debug("POST /api/tasks for user %s", session.get('user_id'))
     if 'user_id' not in session:
         logger.warning("Unauthorized access attempt to add_task")
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
         task = request.json
-        logger.debug(f"Received task data: {task}")
+        logger.debug("Received task data: %s", task)
         
         if not task:
             logger.warning("No task data received")
@@ -236,18 +361,8 @@ def add_task():
             logger.warning("No task date provided")
             return jsonify({'error': 'Task date is required'}), 400
 
-        # Get current tasks
-        try:
-            tasks = tasks_db.get('tasks')
-            if not isinstance(tasks, dict):
-                logger.warning("Tasks is not a dictionary, resetting to empty dict")
-                tasks = {}
-        except Exception as e:
-            logger.error(f"Error getting tasks from database: {str(e)}")
-            tasks = {}
-
         # Generate task ID
-        task_id = str(int(datetime.now().timestamp() * 1000))
+        task_id = new_task_id()
         
         # Create task data
         task_data = {
@@ -259,94 +374,155 @@ def add_task():
             'timestamp': datetime.now().timestamp()
         }
         
-        logger.info(f"Adding new task: {task_data}")
+        logger.debug("Adding new task: %s", task_data)
         
-        # Add new task
-        tasks[task_id] = task_data
-        
-        # Save to database
+        # Save to the user's shard
         try:
-            tasks_db.set('tasks', tasks)
-            logger.info("Task saved successfully")
+            save_task(task_id, task_data)
+            search_index.add(session['user_id'], task_data)
+            logger.debug("Task %s saved", task_id)
             return jsonify(task_data)
         except Exception as e:
-            logger.error(f"Error saving task to database: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error saving task to database: %s", e)
             return jsonify({'error': 'Failed to save task to database'}), 500
             
     except Exception as e:
-        logger.error(f"Error adding task: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error adding task: %s", e)
         return jsonify({'error': 'Failed to add task'}), 500
 
+@app.route('/api/tasks/batch', methods=['POST'])
+def batch_tasks():
+    """Apply ``[{op: create|update|delete, id?, task?}]`` all-or-nothing.
+
+    The whole batch is one storage write. Each operation gets a result in
+    the same position; if any of them is invalid nothing is applied.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    ops = request.get_json(silent=True)
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'Expected a non-empty array of operations'}), 400
+    if len(ops) > MAX_BATCH_OPS:
+        return jsonify({'error': f'At most {MAX_BATCH_OPS} operations per batch'}), 400
+
+    user_id = session['user_id']
+    writes = {}
+    results = []
+    failed = False
+    try:
+        for op in ops:
+            kind = op.get('op') if isinstance(op, dict) else None
+            task = op.get('task') if isinstance(op, dict) else None
+            task_id = str(op.get('id', '')) if isinstance(op, dict) else ''
+            if kind not in ('create', 'update', 'delete'):
+                result = {'status': 400, 'error': 'op must be create, update or delete'}
+            elif kind != 'delete' and not isinstance(task, dict):
+                result = {'status': 400, 'error': 'task is required'}
+            elif kind == 'create' and ('text' not in task or 'date' not in task):
+                result = {'status': 400, 'error': 'Task text and date are required'}
+            elif kind != 'create' and (writes[task_id] if task_id in writes
+                                       else store.get_task(user_id, task_id)) is None:
+                result = {'status': 404, 'error': 'Task not found'}
+            elif kind == 'create':
+                task_id = new_task_id()
+                writes[task_id] = {
+                    'id': task_id,
+                    'text': task['text'],
+                    'date': task['date'],
+                    'completed': task.get('completed', False),
+                    'user_id': user_id,
+                    'timestamp': datetime.now().timestamp()
+                }
+                result = {'status': 201, 'task': writes[task_id]}
+            elif kind == 'update':
+                writes[task_id] = {**task, 'user_id': user_id, 'id': task_id}
+                result = {'status': 200, 'task': writes[task_id]}
+            else:
+                writes[task_id] = None
+                result = {'status': 200, 'id': task_id}
+            failed = failed or result['status'] >= 400
+            results.append(result)
+
+        if failed:
+            results = [result if result['status'] >= 400 else {'status': 424, 'error': 'Not applied'}
+                       for result in results]
+            return jsonify({'error': 'Batch rejected; nothing was applied', 'results': results}), 400
+
+        try:
+            # Re-checked at commit time, so a concurrent delete can't be undone
+            version = store.write_tasks(user_id, writes, require=[
+                str(op['id']) for op in ops if op['op'] != 'create'])
+        except TaskNotFound as e:
+            missing = set(e.args[0])
+            results = [{'status': 404, 'error': 'Task not found'}
+                       if op['op'] != 'create' and str(op['id']) in missing
+                       else {'status': 424, 'error': 'Not applied'} for op in ops]
+            return jsonify({'error': 'Batch rejected; nothing was applied', 'results': results}), 400
+        reindex_tasks(user_id, writes)
+        logger.info("Applied batch of %s operations for user %s", len(ops), user_id)
+        return jsonify({'version': version, 'results': results})
+    except Exception as e:
+        logger.exception("Error applying task batch: %s", e)
+        return jsonify({'error': 'Failed to apply batch'}), 500
+
 @app.route('/api/tasks/<task_id>', methods=['PUT'])
 def update_task(task_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        tasks = tasks_db.get('tasks', {})
-        if task_id in tasks and tasks[task_id].get('user_id') == session['user_id']:
-            task = request.json
-            task['user_id'] = session['user_id']
-            task['id'] = task_id  # Ensure ID is preserved
-            tasks[task_id] = task
-            tasks_db.set('tasks', tasks)
-            return jsonify(task)
+        task = request.json
+        task['user_id'] = session['user_id']
+        task['id'] = task_id  # Ensure ID is preserved
+        # Only applied if the task still exists when the write commits
+        store.write_tasks(session['user_id'], {task_id: task}, require=[task_id])
+        reindex_tasks(session['user_id'], [task_id])
+        return jsonify(task)
+    except TaskNotFound:
         return jsonify({'error': 'Task not found'}), 404
     except Exception as e:
-        logger.error(f"Error updating task: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error updating task: %s", e)
         return jsonify({'error': 'Failed to update task'}), 500
 
 @app.route('/api/tasks/<task_id>', methods=['DELETE'])
 def delete_task(task_id):
-    logger.info(f"DELETE /api/tasks/{task_id} - Session: {session}")
+    logger.debug("DELETE /api/tasks/%s for user %s", task_id, session.get('user_id'))
     if 'user_id' not in session:
         logger.warning("Unauthorized access attempt to delete_task")
         return jsonify({'error': 'Unauthorized'}), 401
     
     try:
-        # Get current tasks
-        tasks = tasks_db.get('tasks')
-        logger.debug(f"Current tasks: {tasks}")
-        
-        if not tasks:
-            logger.warning("No tasks found in database")
-            return jsonify({'error': 'No tasks found'}), 404
-            
-        if not isinstance(tasks, dict):
-            logger.warning("Tasks is not a dictionary, resetting to empty dict")
-            tasks = {}
-            
         # Check if task exists and belongs to user
-        if task_id not in tasks:
-            logger.warning(f"Task {task_id} not found")
+        owner = store.get_owner(task_id)
+        if owner is None:
+            logger.warning("Task %s not found", task_id)
             return jsonify({'error': 'Task not found'}), 404
             
-        if tasks[task_id].get('user_id') != session['user_id']:
-            logger.warning(f"Task {task_id} does not belong to user {session['user_id']}")
+        if owner != session['user_id']:
+            logger.warning("Task %s does not belong to user %s", task_id, session['user_id'])
             return jsonify({'error': 'Unauthorized'}), 401
             
         # Delete the task
         try:
-            del tasks[task_id]
-            tasks_db.set('tasks', tasks)
-            logger.info(f"Task {task_id} deleted successfully")
+            if store.delete_task(session['user_id'], task_id) is None:
+                # Deleted by a concurrent request since the owner check
+                return jsonify({'error': 'Task not found'}), 404
+            search_index.remove(session['user_id'], task_id)
+            logger.info("Task %s deleted successfully", task_id)
             return jsonify({'message': 'Task deleted successfully'})
         except Exception as e:
-            logger.error(f"Error saving tasks after deletion: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("Error saving tasks after deletion: %s", e)
             return jsonify({'error': 'Failed to save changes'}), 500
             
     except Exception as e:
-        logger.error(f"Error deleting task: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error deleting task: %s", e)
         return jsonify({'error': 'Failed to delete task'}), 500
 
 @app.route('/health')
 def health_check():
-    return {"status": "healthy"}, 200
+    return {"status": "healthy", "task_cache": task_cache.stats(), "commit_queue": store.stats(),
+            "log_records_dropped": dropped_records()}, 200
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True) 
\ No newline at end of file
@@ -0,0 +1,64 @@
+from datetime import date, datetime, timedelta
+
+# Sections of the UI that map onto a date range
+VIEWS = ('myDay', 'thisWeek', 'thisMonth', 'range', 'other')
+
+
+def parse_day(value):
+    """Parse ``YYYY-MM-DD`` (or the date part of an ISO datetime)."""
+    return datetime.strptime(value[:10], '%Y-%m-%d').date()
+
+
+def resolve_range(view, start=None, end=None, today=None):
+    """Return the inclusive ``(first_day, last_day)`` for a view.
+
+    Either bound may be None, meaning unbounded. ``today`` anchors the
+    relative views and defaults to the server's date; clients in another
+    time zone should send their own.
+    """
+    today = parse_day(today) if today else date.today()
+    view = view or 'range'
+    if view == 'myDay':
+        return today, today
+    if view == 'thisWeek':
+        monday = today - timedelta(days=today.weekday())
+        return monday, monday + timedelta(days=6)
+    if view == 'thisMonth':
+        first = today.replace(day=1)
+        next_month = (first + timedelta(days=32)).replace(day=1)
+        return first, next_month - timedelta(days=1)
+    if view == 'range':
+        first = parse_day(start) if start else None
+        last = parse_day(end) if end else None
+        if first and last and first > last:
+            raise ValueError('from must not be after to')
+        return first, last
+    if view == 'other':
+        return None, None
+    raise ValueError(f'Unknown view: {view}')
+
+
+def date_bounds(first, last):
+    """Turn an inclusive day range into ``(lower, upper)`` string bounds.
+
+    Task dates are stored as ``YYYY-MM-DD`` or full ISO datetimes, so the
+    upper bound is exclusive (the day after ``last``) to cover both.
+    ``lower <= task['date'] < upper``; None means unbounded.
+    """
+    lower = first.isoformat() if first else None
+    upper = (last + timedelta(days=1)).isoformat() if last else None
+    return lower, upper
+
+
+def in_bounds(value, lower, upper):
+    value = value or ''
+    return (lower is None or value >= lower) and (upper is None or value < upper)
+
+
+def range_from_args(args):
+    """Resolve ``view``/``from``/``to``/``today`` query args, or None if absent."""
+    view = args.get('view')
+    start, end = args.get('from'), args.get('to')
+    if not (view or start or end):
+        return None
+    return date_bounds(*resolve_range(view, start, end, args.get('today')))
@@ -0,0 +1,72 @@
+"""JSON encoding shared by the Flask apps, fast for large lists of documents.
+
+``install_json(app)`` makes ``jsonify`` and ``flask.json.dumps`` encode, at
+any depth and without touching the documents:
+
+* ``ObjectId`` as its hex string, so Mongo documents go out as they are read
+* ``datetime`` and ``date`` in ISO 8601 (``2025-01-01T09:30:00.250000``,
+  ``2025-01-01``) rather than Flask's HTTP date. Formatting an HTTP date
+  in Python took most of the time spent encoding a page of tasks.
+* ``bytes`` as base64
+
+When orjson is installed it does the encoding, dates included, several
+times faster than the stdlib encoder. Without it, or for pretty-printed
+output (``indent``), or for anything orjson rejects (integers beyond 64
+bits), the stdlib encoder is used and produces the same values. orjson
+writes non-ASCII text as UTF-8 rather than ``\\u`` escapes; both decode
+the same.
+
+``stress_test/bench_json.py`` compares the encoders on 10k-task payloads.
+"""
+import base64
+from datetime import date
+
+from flask import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+
+def _to_json(o):
+    """JSON-ready form of the types the stdlib encoder can't handle, or TypeError."""
+    if ObjectId is not None and isinstance(o, ObjectId):
+        return str(o)
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (bytes, bytearray, memoryview)):
+        return base64.b64encode(o).decode('ascii')
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class FastJSONEncoder(json.JSONEncoder):
+    """Flask's encoder plus ObjectId, ISO dates and bytes; encodes with orjson when it can."""
+
+    def default(self, o):
+        try:
+            return _to_json(o)
+        except TypeError:
+            return super().default(o)
+
+    def encode(self, o):
+        if orjson is None or self.indent is not None:
+            return super().encode(o)
+        option = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            return super().encode(o)
+
+
+def install_json(app):
+    """Encode ``app``'s JSON responses with :class:`FastJSONEncoder`."""
+    app.json_encoder = FastJSONEncoder
+    return app
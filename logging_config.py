@@ -1,34 +1,175 @@
+"""Non-blocking JSON logging shared by the monolith and the services.
+
+Request threads only put the LogRecord on a bounded in-memory queue; a
+background listener thread formats it as one JSON object per line and
+writes it to the console and to ``logs/<service>.log``. Messages are
+formatted on the listener thread, so log with lazy arguments
+(``logger.info("Saved %s", task_id)``), not f-strings, and pass values that
+are not mutated afterwards. If the queue is full the record is dropped
+rather than blocking the request.
+
+High-volume debug events can be sampled per logger before they are queued:
+``LOG_SAMPLE_RATES="app=0.01,werkzeug=0.1"`` keeps 1% of the DEBUG records
+of ``app`` (and its child loggers) and 10% of ``werkzeug``'s. Kept records
+carry their ``sample_rate``.
+
+Environment: ``LOG_LEVEL`` (INFO), ``LOG_CONSOLE_LEVEL`` (LOG_LEVEL),
+``LOG_DIR`` (logs), ``LOG_QUEUE_SIZE`` (10000), ``LOG_SAMPLE_RATES``.
+"""
+import atexit
+import json
 import logging
 import logging.handlers
 import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, service_name):
+        super().__init__()
+        self.service_name = service_name
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'service': self.service_name,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records at or below ``max_level``, per logger.
+
+    ``rates`` maps logger names to the fraction kept; a logger without an
+    entry uses its nearest configured ancestor's rate, or keeps everything.
+    """
+
+    def __init__(self, rates, max_level=logging.DEBUG):
+        super().__init__()
+        self.rates = dict(rates)
+        self.max_level = max_level
+        self._resolved = {}
+
+    def rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            probe = name
+            while probe not in self.rates and '.' in probe:
+                probe = probe.rsplit('.', 1)[0]
+            rate = self._resolved[name] = self.rates.get(probe, 1.0)
+        return rate
+
+    def filter(self, record):
+        if record.levelno > self.max_level:
+            return True
+        rate = self.rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records untouched; formatting is left to the listener."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for item in (spec or '').split(','):
+        if item.strip():
+            name, _, rate = item.partition('=')
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+_listener = None
+_queue_handler = None
+_setup_lock = threading.Lock()
+
 
 def setup_logging(service_name):
-    # Create logs directory if it doesn't exist
-    if not os.path.exists('logs'):
-        os.makedirs('logs')
-
-    # Configure logging
-    logger = logging.getLogger(service_name)
-    logger.setLevel(logging.DEBUG)
-
-    # Console handler
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    console_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(console_format)
-
-    # File handler with rotation
-    file_handler = logging.handlers.RotatingFileHandler(
-        f'logs/{service_name}.log',
-        maxBytes=10485760,  # 10MB
-        backupCount=5
-    )
-    file_handler.setLevel(logging.DEBUG)
-    file_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(file_format)
-
-    # Add handlers
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
-
-    return logger 
\ No newline at end of file
+    """Route all logging through the background JSON pipeline; returns the service logger.
+
+    Safe to call more than once per process: the pipeline is set up on the
+    first call and shared afterwards.
+    """
+    global _listener, _queue_handler
+    with _setup_lock:
+        if _listener is None:
+            level = logging.getLevelName(os.getenv('LOG_LEVEL', 'INFO').upper())
+            log_dir = os.getenv('LOG_DIR', 'logs')
+            os.makedirs(log_dir, exist_ok=True)
+            formatter = JsonFormatter(service_name)
+
+            console_handler = logging.StreamHandler()
+            console_handler.setLevel(logging.getLevelName(os.getenv('LOG_CONSOLE_LEVEL', logging.getLevelName(level)).upper()))
+            console_handler.setFormatter(formatter)
+
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir, f'{service_name}.log'),
+                maxBytes=10485760,  # 10MB
+                backupCount=5
+            )
+            file_handler.setFormatter(formatter)
+
+            log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+            _queue_handler = NonBlockingQueueHandler(log_queue)
+            _queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.getenv('LOG_SAMPLE_RATES'))))
+            _listener = logging.handlers.QueueListener(log_queue, console_handler, file_handler,
+                                                       respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown_logging)
+
+            root = logging.getLogger()
+            for handler in list(root.handlers):
+                root.removeHandler(handler)
+            root.addHandler(_queue_handler)
+            root.setLevel(level)
+
+    return logging.getLogger(service_name)
+
+
+def shutdown_logging():
+    """Write out everything still queued and stop the listener thread."""
+    with _setup_lock:
+        if _listener is not None and _listener._thread is not None:
+            _listener.stop()
+
+
+def dropped_records():
+    """Records dropped because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
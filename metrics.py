@@ -0,0 +1,309 @@
+"""In-process request, storage and upstream metrics in Prometheus text format.
+
+``instrument_app(app)`` counts and times every request per route and serves
+everything recorded in the process at ``/metrics``:
+
+* ``http_requests_total{method,route,status}``,
+  ``http_request_errors_total{method,route}`` (5xx) and
+  ``http_request_duration_seconds{method,route}``
+* ``storage_operation_duration_seconds{backend,operation}`` and
+  ``storage_operation_errors_total{backend,operation}``, fed by
+  :func:`time_storage` and by :func:`mongo_command_listener` for pymongo
+* ``upstream_request_duration_seconds{upstream,method}`` and
+  ``upstream_requests_total{upstream,method,status}``, fed by
+  :func:`upstream_request`
+
+Routes are labelled by their URL rule (``/api/tasks/<task_id>``), never by
+the raw path, so the number of series stays bounded. Recording is a dict
+lookup, a bisect and a short per-series lock; text is only rendered when
+``/metrics`` is scraped. Each process keeps its own numbers, so scrape every
+worker (or run one worker per container).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, request
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _CounterChild:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class _Family:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Family):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f'{self.name}{_label_text(self.labelnames, values)} {_number(child.value)}'
+
+
+class Histogram(_Family):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                yield f'{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}'
+            labels = _label_text(self.labelnames, values)
+            yield f'{self.name}_sum{labels} {_number(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class Gauge(_Family):
+    """A value read from ``callback`` at scrape time, so nothing is recorded on the hot path.
+
+    With ``labelnames`` the callback returns ``{label_values_tuple: value}``.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, callback, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _samples(self):
+        if not self.labelnames:
+            yield f'{self.name} {_number(self.callback())}'
+            return
+        for values, value in self.callback().items():
+            yield f'{self.name}{_label_text(self.labelnames, values)} {_number(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _register(self, family):
+        with self._lock:
+            existing = self._families.get(family.name)
+            if existing is not None:
+                if type(existing) is not type(family) or existing.labelnames != family.labelnames:
+                    raise ValueError(f'Metric {family.name} is already registered differently')
+                if isinstance(family, Gauge):
+                    existing.callback = family.callback
+                return existing
+            self._families[family.name] = family
+            return family
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation, callback, labelnames=()):
+        return self._register(Gauge(name, documentation, callback, labelnames))
+
+    def expose(self):
+        lines = []
+        for family in list(self._families.values()):
+            try:
+                lines.extend(family.render())
+            except Exception:
+                # One broken gauge callback shouldn't take down the scrape
+                continue
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter('http_requests_total', 'HTTP requests handled.', ('method', 'route', 'status'))
+REQUEST_ERRORS = REGISTRY.counter('http_request_errors_total', 'HTTP requests answered with a 5xx status.',
+                                  ('method', 'route'))
+REQUEST_LATENCY = REGISTRY.histogram('http_request_duration_seconds', 'Time spent handling HTTP requests.',
+                                     ('method', 'route'))
+STORAGE_LATENCY = REGISTRY.histogram('storage_operation_duration_seconds', 'Time spent in storage calls.',
+                                     ('backend', 'operation'))
+STORAGE_ERRORS = REGISTRY.counter('storage_operation_errors_total', 'Storage calls that raised or failed.',
+                                  ('backend', 'operation'))
+UPSTREAM_LATENCY = REGISTRY.histogram('upstream_request_duration_seconds', 'Time spent in outbound HTTP calls.',
+                                      ('upstream', 'method'))
+UPSTREAM_REQUESTS = REGISTRY.counter('upstream_requests_total',
+                                     'Outbound HTTP calls by status ("error" if no response arrived).',
+                                     ('upstream', 'method', 'status'))
+
+
+def instrument_app(app, path='/metrics', registry=REGISTRY):
+    """Record every request of ``app`` and serve ``registry`` at ``path``."""
+
+    @app.before_request
+    def _start_request_timer():
+        request.environ['metrics.start'] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = request.environ.get('metrics.start')
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+            if response.status_code >= 500:
+                REQUEST_ERRORS.labels(request.method, route).inc()
+        return response
+
+    def metrics_view():
+        return Response(registry.expose(), content_type=CONTENT_TYPE)
+
+    app.add_url_rule(path, 'metrics', metrics_view, methods=['GET'])
+    return app
+
+
+@contextmanager
+def time_storage(backend, operation):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STORAGE_ERRORS.labels(backend, operation).inc()
+        raise
+    finally:
+        STORAGE_LATENCY.labels(backend, operation).observe(time.perf_counter() - start)
+
+
+def mongo_command_listener(backend='mongodb'):
+    """A pymongo command listener timing every command (find, insert, update, ...).
+
+    Pass it to ``MongoClient(..., event_listeners=[...])``. pymongo measures
+    the durations itself, so nothing wraps the collection calls.
+    """
+    from pymongo import monitoring
+
+    class MongoCommandTimer(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            STORAGE_LATENCY.labels(backend, event.command_name).observe(event.duration_micros / 1e6)
+
+        def failed(self, event):
+            STORAGE_LATENCY.labels(backend, event.command_name).observe(event.duration_micros / 1e6)
+            STORAGE_ERRORS.labels(backend, event.command_name).inc()
+
+    return MongoCommandTimer()
+
+
+def upstream_request(upstream, method, url, session=None, **kwargs):
+    """``requests.request`` (or ``session.request``), timed under ``upstream``."""
+    if session is None:
+        import requests as session
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        response = session.request(method, url, **kwargs)
+        status = str(response.status_code)
+        return response
+    finally:
+        UPSTREAM_LATENCY.labels(upstream, method).observe(time.perf_counter() - start)
+        UPSTREAM_REQUESTS.labels(upstream, method, status).inc()
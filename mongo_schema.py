@@ -0,0 +1,47 @@
+"""Indexes of the Mongo-backed services, created when a service starts.
+
+``INDEXES`` lists each collection's indexes next to the queries they serve.
+:func:`ensure_indexes` creates them. ``create_index`` does nothing for an
+index that already exists with the same keys and options, so every service
+instance can run it at startup. An index that can't be built is logged and
+skipped, and the service still starts. One common cause is duplicate emails
+already in ``users``; until they are cleaned up, email lookups scan.
+
+``stress_test/explain_queries.py`` checks with ``explain`` that the hot
+queries use these indexes rather than a collection scan.
+"""
+from pymongo import ASCENDING, TEXT
+
+INDEXES = {
+    'tasks': [
+        # Date views: {user_id, date range} sorted by (date, _id)
+        ([('user_id', ASCENDING), ('date', ASCENDING), ('_id', ASCENDING)], {}),
+        # Listings and cursor pages by id: {user_id, _id > cursor} sorted by _id
+        ([('user_id', ASCENDING), ('_id', ASCENDING)], {}),
+        # /tasks/changes: {user_id, version > since}
+        ([('user_id', ASCENDING), ('version', ASCENDING)], {}),
+        # /tasks/search
+        ([('text', TEXT)], {'name': 'text_search', 'default_language': 'none'}),
+    ],
+    'task_tombstones': [
+        ([('user_id', ASCENDING), ('task_id', ASCENDING)], {'unique': True}),
+        ([('user_id', ASCENDING), ('version', ASCENDING)], {}),
+    ],
+    'users': [
+        # Login and registration look users up by email, and emails are unique
+        ([('email', ASCENDING)], {'unique': True}),
+    ],
+}
+
+
+def ensure_indexes(db, collections, logger):
+    """Create the ``INDEXES`` of ``collections`` in ``db``; returns ``(collection, keys)`` of those that failed."""
+    failed = []
+    for name in collections:
+        for keys, options in INDEXES[name]:
+            try:
+                db[name].create_index(keys, **options)
+            except Exception as e:
+                logger.error("Error creating index %s on %s: %s", keys, name, e)
+                failed.append((name, keys))
+    return failed
@@ -0,0 +1,60 @@
+import base64
+import json
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+MAX_LIMIT = 500
+
+
+def encode_cursor(key):
+    """Opaque cursor for the last item of a page (a JSON-able sort key)."""
+    raw = json.dumps(key, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(key, list):
+        raise ValueError('Invalid cursor')
+    return key
+
+
+def page_args(args, max_limit=MAX_LIMIT):
+    """Parse ``limit``/``cursor`` query args into ``(limit, after_key)``.
+
+    Both are None when the client did not ask for pagination.
+    """
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        limit = min(limit, max_limit)
+    cursor = args.get('cursor')
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def id_after(value):
+    """Mongo filter for task ``_id`` values after the cursor's ``value``, in ``_id`` order.
+
+    New tasks have string (snowflake) ids, older ones ObjectIds. Mongo sorts
+    strings before ObjectIds, but ``$gt`` only matches values of the same type.
+    """
+    if ObjectId is not None and ObjectId.is_valid(value):
+        return {'_id': {'$gt': ObjectId(value)}}
+    return {'$or': [{'_id': {'$gt': value}}, {'_id': {'$type': 'objectId'}}]}
+
+
+def wants_ndjson(request):
+    return (request.args.get('format') == 'ndjson' or
+            request.accept_mimetypes.best == 'application/x-ndjson')
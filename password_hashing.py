@@ -0,0 +1,161 @@
+"""Password hashing in a pool of worker processes, with a bounded queue.
+
+A werkzeug password hash (pbkdf2-sha256, 260000 iterations) takes a CPU
+core for a few hundred milliseconds. Done in the request thread, a burst of
+logins takes every request thread (every process, with gunicorn's sync
+workers) for as long as the hashes run, and requests that only read tasks
+wait for one to come free. :class:`PasswordHasher` hashes in a process pool
+instead, so hashing uses every core and the queue of hashes is bounded.
+
+The pool has ``PASSWORD_HASH_WORKERS`` processes (one per CPU). At most
+``PASSWORD_HASH_MAX_QUEUE`` hashes (4 per worker) wait for a worker. When
+the queue is full, and when a hash has waited ``PASSWORD_HASH_TIMEOUT``
+seconds (10) or past the caller's deadline, the call raises
+:class:`HashPoolFull`. Services answer it with 503 and ``Retry-After``: an
+estimate of how long the queue ahead takes to clear. A rejected login
+costs a client a retry, not a request stuck behind a minute of hashing.
+``PASSWORD_HASH_WORKERS=0`` hashes in the calling thread, as before.
+
+Workers are started on the first hash, in the process that serves
+requests, so a server that forks workers after import gets one pool per
+worker. Recorded at ``/metrics``:
+
+* ``password_hash_duration_seconds{operation}``: time a worker spent hashing
+* ``password_hash_wait_seconds{operation}``: time a hash waited for a worker
+* ``password_hash_queue_depth``: hashes waiting for a worker
+* ``password_hash_in_flight``: hashes waiting or running
+* ``password_hash_rejected_total{operation}``: hashes refused with
+  :class:`HashPoolFull`
+"""
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import REGISTRY
+
+HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HASH_DURATION = REGISTRY.histogram('password_hash_duration_seconds', 'Time a worker spent hashing a password.',
+                                   ('operation',), buckets=HASH_BUCKETS)
+HASH_WAIT = REGISTRY.histogram('password_hash_wait_seconds', 'Time a password hash waited for a worker.',
+                               ('operation',), buckets=(0.001,) + HASH_BUCKETS)
+HASH_REJECTED = REGISTRY.counter('password_hash_rejected_total',
+                                 'Password hashes refused because the hashing queue was full.', ('operation',))
+
+
+class HashPoolFull(Exception):
+    """No worker can take the hash in time; ``retry_after`` is whole seconds until the queue should have room."""
+
+    def __init__(self, retry_after):
+        super().__init__('password hashing is at capacity')
+        self.retry_after = retry_after
+
+
+def _timed(function, *args):
+    # Runs in a worker process
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+class PasswordHasher:
+    def __init__(self, workers=None, max_queue=None, timeout=None):
+        if workers is None:
+            workers = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 1)))
+        self.workers = workers
+        self.max_queue = max_queue if max_queue is not None else int(
+            os.getenv('PASSWORD_HASH_MAX_QUEUE', str(4 * max(workers, 1))))
+        self.timeout = timeout if timeout is not None else float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        # Moving average of one hash, for Retry-After
+        self._hash_seconds = 0.3
+        _hashers.append(self)
+
+    def generate(self, password, timeout=None):
+        """``generate_password_hash(password)``, computed in the pool."""
+        return self._run('generate', generate_password_hash, (password,), timeout)
+
+    def check(self, pwhash, password, timeout=None):
+        """``check_password_hash(pwhash, password)``, computed in the pool."""
+        return self._run('check', check_password_hash, (pwhash, password), timeout)
+
+    @property
+    def queued(self):
+        return max(0, self.in_flight - self.workers)
+
+    def retry_after(self):
+        """Seconds until the hashes queued now should be done, at least 1."""
+        return max(1, math.ceil((self.queued + 1) * self._hash_seconds / max(self.workers, 1)))
+
+    def _run(self, operation, function, args, timeout):
+        if self.workers <= 0:
+            result, elapsed = _timed(function, *args)
+            HASH_DURATION.labels(operation).observe(elapsed)
+            return result
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                HASH_REJECTED.labels(operation).inc()
+                raise HashPoolFull(self.retry_after())
+            self.in_flight += 1
+            pool = self._pool()
+        try:
+            future = pool.submit(_timed, function, *args)
+        except BaseException:
+            with self._lock:
+                self.in_flight -= 1
+                self._discard_broken_pool()
+            raise
+        future.add_done_callback(self._finished)
+        start = time.perf_counter()
+        wait = self.timeout if timeout is None else min(self.timeout, max(0.0, timeout))
+        try:
+            result, elapsed = future.result(wait)
+        except FutureTimeout:
+            # Still queued: drop it. Already hashing: let it finish unused.
+            future.cancel()
+            HASH_REJECTED.labels(operation).inc()
+            raise HashPoolFull(self.retry_after())
+        except BrokenProcessPool:
+            with self._lock:
+                self._discard_broken_pool()
+            raise
+        HASH_DURATION.labels(operation).observe(elapsed)
+        HASH_WAIT.labels(operation).observe(max(0.0, time.perf_counter() - start - elapsed))
+        self._hash_seconds += 0.1 * (elapsed - self._hash_seconds)
+        return result
+
+    def _pool(self):
+        # Called with the lock held. A pool inherited across fork() has no
+        # workers in this process, so each process starts its own.
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _discard_broken_pool(self):
+        # Called with the lock held. A worker that dies (killed, out of
+        # memory) breaks the whole pool; the next hash starts a new one.
+        if self._executor is not None and self._executor._broken:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _finished(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+
+_hashers = []
+
+REGISTRY.gauge('password_hash_queue_depth', 'Password hashes waiting for a worker.',
+               lambda: sum(hasher.queued for hasher in list(_hashers)))
+REGISTRY.gauge('password_hash_in_flight', 'Password hashes waiting for or running on a worker.',
+               lambda: sum(hasher.in_flight for hasher in list(_hashers)))
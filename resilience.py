@@ -0,0 +1,252 @@
+"""Circuit breakers, retries and request deadlines for calls between services.
+
+**Circuit breakers.** Every upstream has a :class:`CircuitBreaker`. After
+``<NAME>_BREAKER_FAILURES`` / ``UPSTREAM_BREAKER_FAILURES`` (5) failures in
+a row it opens: calls fail at once with :class:`CircuitOpenError` instead
+of tying up a thread on an upstream that is down. The breaker stays open
+for ``UPSTREAM_BREAKER_RESET_TIMEOUT`` seconds (10). After that it lets one
+trial call through: success closes the breaker and failure opens it again.
+A failure is a connection error, a timeout or a 502/503/504 answer.
+
+**Retries.** :class:`RetryPolicy` retries idempotent calls (RFC 7231:
+GET, HEAD, OPTIONS, PUT, DELETE) that failed that way, up to
+``UPSTREAM_RETRIES`` (2) times. The wait before each retry is drawn at
+random from 0 to ``UPSTREAM_RETRY_BACKOFF`` * 2^n seconds (0.05, at most
+``UPSTREAM_RETRY_BACKOFF_MAX``, 1). This is "full jitter": callers that
+failed together don't come back together. All upstreams share one
+:class:`RetryBudget`, so retries add at most ``RETRY_BUDGET_RATIO`` (0.1)
+to the call volume, plus ``RETRY_BUDGET_MIN_PER_SECOND`` (5) so a quiet
+process can still retry. When an upstream is struggling, retries stop
+instead of multiplying its load.
+
+**Deadlines.** A request handled with :func:`install_deadline` has a
+deadline. It comes from the ``X-Deadline-Ms`` header (milliseconds the
+caller will still wait) or from ``default``, whichever is sooner.
+:func:`current_deadline` makes it available to the upstream client, which
+caps its timeouts by the time left. The client passes the remaining
+milliseconds on in the same header and gives up with
+:class:`DeadlineExceeded` rather than call past the deadline. A service
+that gets a request already past its deadline answers 504 straight away.
+Deadlines are sent as durations, not timestamps, so clocks need not agree
+between hosts. Services that take requests from outside (api-gateway,
+api_service) give every request ``REQUEST_DEADLINE`` seconds (10) at most.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+DEADLINE_HEADER = 'X-Deadline-Ms'
+
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '10'))
+
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'))
+
+# Upstream answers that count as failures and may be retried
+RETRY_STATUSES = frozenset((502, 503, 504))
+
+UPSTREAM_RETRIES = REGISTRY.counter('upstream_retries_total', 'Upstream calls sent again after a failure.',
+                                    ('upstream',))
+RETRY_BUDGET_EXHAUSTED = REGISTRY.counter('upstream_retry_budget_exhausted_total',
+                                          'Retries skipped because the retry budget was spent.', ('upstream',))
+CIRCUIT_REJECTED = REGISTRY.counter('upstream_circuit_rejected_total',
+                                    'Upstream calls refused because the circuit breaker was open.', ('upstream',))
+DEADLINE_EXCEEDED = REGISTRY.counter('deadline_exceeded_total',
+                                     'Work abandoned because the caller\'s deadline had passed.', ('where',))
+
+
+class CircuitOpenError(Exception):
+    """The upstream's circuit breaker is open; ``retry_after`` is seconds until the next trial call."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f'{upstream} is unavailable (circuit open)')
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before the upstream call could be made or finished."""
+
+
+def _setting(name, key, default, cast):
+    # upstream_client.upstream_setting, without the import cycle
+    value = os.getenv(f'{name.upper()}_{key}', os.getenv(f'UPSTREAM_{key}'))
+    return cast(value) if value is not None else default
+
+
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = (failure_threshold if failure_threshold is not None
+                                  else _setting(name, 'BREAKER_FAILURES', 5, int))
+        self.reset_timeout = (reset_timeout if reset_timeout is not None
+                              else _setting(name, 'BREAKER_RESET_TIMEOUT', 10.0, float))
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+        _breakers.append(self)
+
+    def check(self):
+        """Raise :class:`CircuitOpenError` unless a call may go out now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.trial_in_flight = False
+            # A trial call that never reported back doesn't block the next one forever
+            if self.state == self.HALF_OPEN and (not self.trial_in_flight
+                                                 or now - self.opened_at >= self.reset_timeout):
+                self.trial_in_flight = True
+                self.opened_at = now
+                return
+            retry_after = max(1, round(self.reset_timeout - (now - self.opened_at)))
+        CIRCUIT_REJECTED.labels(self.name).inc()
+        raise CircuitOpenError(self.name, retry_after)
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+
+
+class RetryBudget:
+    """Tokens for retries: each call earns ``ratio`` of one, time earns ``min_per_second``."""
+
+    def __init__(self, ratio=None, min_per_second=None):
+        self.ratio = ratio if ratio is not None else float(os.getenv('RETRY_BUDGET_RATIO', '0.1'))
+        self.min_per_second = (min_per_second if min_per_second is not None
+                               else float(os.getenv('RETRY_BUDGET_MIN_PER_SECOND', '5')))
+        # Saved-up tokens are capped so a long quiet spell can't fund a retry storm
+        self.capacity = max(1.0, self.min_per_second * 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.min_per_second)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+RETRY_BUDGET = RetryBudget()
+
+
+class RetryPolicy:
+    def __init__(self, name, max_retries=None, backoff=None, backoff_max=None, budget=RETRY_BUDGET):
+        self.name = name
+        self.max_retries = max_retries if max_retries is not None else _setting(name, 'RETRIES', 2, int)
+        self.backoff = backoff if backoff is not None else _setting(name, 'RETRY_BACKOFF', 0.05, float)
+        self.backoff_max = backoff_max if backoff_max is not None else _setting(name, 'RETRY_BACKOFF_MAX', 1.0, float)
+        self.budget = budget
+
+    def delay(self, attempt, deadline=None):
+        """Seconds to wait before retry number ``attempt + 1``, or None to give up."""
+        if attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        left = time_left(deadline)
+        if left is not None and delay >= left:
+            return None
+        if not self.budget.try_spend():
+            RETRY_BUDGET_EXHAUSTED.labels(self.name).inc()
+            return None
+        UPSTREAM_RETRIES.labels(self.name).inc()
+        return delay
+
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+def current_deadline():
+    """The deadline (a ``time.monotonic()`` value) of the request being handled, or None."""
+    return _deadline.get()
+
+
+def time_left(deadline):
+    """Seconds until ``deadline`` (possibly negative), or None without one."""
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_from_headers(headers, default=None):
+    """The deadline a request carries in ``X-Deadline-Ms``, capped at ``default`` seconds from now."""
+    now = time.monotonic()
+    deadline = now + default if default else None
+    value = headers.get(DEADLINE_HEADER, '')
+    if value.isdigit():
+        carried = now + int(value) / 1000
+        deadline = carried if deadline is None else min(deadline, carried)
+    return deadline
+
+
+def deadline_header(deadline):
+    """``X-Deadline-Ms`` for a call made now on behalf of a request with ``deadline``."""
+    return str(max(0, int(time_left(deadline) * 1000)))
+
+
+@contextmanager
+def deadline_after(seconds):
+    """Run the block with a deadline ``seconds`` from now, for calls made outside a request."""
+    token = _deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def install_deadline(app, default=None):
+    """Give each of ``app``'s requests a deadline (see the module docstring).
+
+    ``default`` is the most seconds a request may take; None means only
+    deadlines sent by the caller apply.
+    """
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def _start_deadline():
+        deadline = deadline_from_headers(request.headers, default)
+        g._deadline_token = _deadline.set(deadline)
+        if deadline is not None and time_left(deadline) <= 0:
+            DEADLINE_EXCEEDED.labels('request').inc()
+            return jsonify({'error': 'Deadline exceeded'}), 504
+
+    @app.teardown_request
+    def _end_deadline(exc):
+        token = g.pop('_deadline_token', None)
+        if token is not None:
+            _deadline.reset(token)
+
+
+_breakers = []
+
+REGISTRY.gauge('upstream_circuit_state', 'Circuit breaker state per upstream: 0 closed, 1 half-open, 2 open.',
+               lambda: {(breaker.name,): breaker.state for breaker in list(_breakers)}, ('upstream',))
+REGISTRY.gauge('retry_budget_tokens', 'Retry tokens left in the shared retry budget.',
+               lambda: RETRY_BUDGET.tokens)
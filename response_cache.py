@@ -0,0 +1,277 @@
+"""Short-lived cache of upstream GET responses, per caller identity.
+
+Entries are keyed by ``(identity, key)``; ``identity`` is the verified
+user id the response was for (never the raw credentials: a user holding
+several tokens has one set of entries) and ``key`` the request path with its query string plus anything else the
+response depends on. Any write by an identity (:meth:`ResponseCache.invalidate`)
+drops all of its entries at once. Call it both before the write is forwarded
+and after it returns, so that a GET still in flight can't store what it
+read from before the write.
+
+Upstream ``Cache-Control`` is honoured:
+
+* ``no-store`` responses are never stored
+* ``max-age=N`` caps the entry's lifetime at N seconds (``RESPONSE_CACHE_TTL``
+  caps it in any case)
+* ``no-cache`` (or ``max-age=0``) responses are stored, but every reuse
+  must be revalidated upstream with ``If-None-Match``; a 304 answer costs
+  the upstream a version check instead of a full listing
+* ``private`` is fine: entries are only ever served to the same identity
+
+Responses with ``Set-Cookie`` or ``Vary: *``, non-200 responses and bodies
+over ``RESPONSE_CACHE_MAX_ENTRY_BYTES`` are not stored. The cache as a whole
+holds at most ``RESPONSE_CACHE_MAX_BYTES`` of bodies and evicts the least
+recently used entries beyond that. ``RESPONSE_CACHE_TTL=0`` turns it off.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import REGISTRY
+
+WRITE_METHODS = frozenset(('POST', 'PUT', 'PATCH', 'DELETE'))
+
+
+class CacheEntry:
+    __slots__ = ('identity', 'key', 'status', 'headers', 'body', 'expires', 'etag', 'revalidate', 'size')
+
+    def __init__(self, identity, key, status, headers, body, expires, etag, revalidate):
+        self.identity = identity
+        self.key = key
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        self.etag = etag
+        self.revalidate = revalidate
+        self.size = len(body)
+
+
+class CachedResponse:
+    """A cache entry in the shape of a ``requests`` response, for code that made the call itself."""
+
+    def __init__(self, entry):
+        self.status_code = entry.status
+        self.headers = dict(entry.headers)
+        self.content = entry.body
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def parse_cache_control(value):
+    directives = {}
+    for item in (value or '').split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip().strip('"')
+    return directives
+
+
+class ResponseCache:
+    def __init__(self, name, ttl=None, max_bytes=None, max_entry_bytes=None):
+        self.name = name
+        self.ttl = ttl if ttl is not None else float(os.getenv('RESPONSE_CACHE_TTL', '2'))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv('RESPONSE_CACHE_MAX_BYTES',
+                                                                               str(32 * 1024 * 1024)))
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else int(
+            os.getenv('RESPONSE_CACHE_MAX_ENTRY_BYTES', str(1024 * 1024)))
+        self._entries = OrderedDict()
+        self._by_identity = {}
+        # Write sequence numbers per identity; identities without one are at _floor
+        self._generations = {}
+        self._seq = 0
+        self._floor = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.evictions = 0
+        _caches.append(self)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def lookup(self, identity, key):
+        """The live entry for ``(identity, key)``, or None.
+
+        An entry with ``revalidate`` set may only be served after the
+        upstream confirmed its ``etag``; report the outcome with
+        :meth:`revalidation`. Any other entry is served as is and already
+        counted as a hit.
+        """
+        with self._lock:
+            entry = self._entries.get((identity, key))
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires <= time.monotonic():
+                self._remove(entry)
+                self.misses += 1
+                return None
+            self._entries.move_to_end((identity, key))
+            if not entry.revalidate:
+                self.hits += 1
+            return entry
+
+    def revalidation(self, confirmed):
+        with self._lock:
+            if confirmed:
+                self.revalidated += 1
+            else:
+                self.misses += 1
+
+    def generation(self, identity):
+        """Pass to :meth:`store`; a write by ``identity`` in between makes the store a no-op."""
+        with self._lock:
+            return self._generations.get(identity, self._floor)
+
+    def cacheable(self, status, headers):
+        """Lifetime and revalidation flag for a response, or None if it must not be stored."""
+        if not self.enabled or status != 200:
+            return None
+        lowered = {name.lower(): value for name, value in headers}
+        if 'set-cookie' in lowered or lowered.get('vary', '').strip() == '*':
+            return None
+        length = lowered.get('content-length')
+        if length is not None and length.isdigit() and int(length) > self.max_entry_bytes:
+            return None
+        directives = parse_cache_control(lowered.get('cache-control'))
+        if 'no-store' in directives:
+            return None
+        ttl = self.ttl
+        max_age = directives.get('max-age')
+        if max_age is not None and max_age.isdigit():
+            ttl = min(ttl, int(max_age))
+        revalidate = 'no-cache' in directives or ttl == 0
+        if revalidate:
+            if not lowered.get('etag'):
+                return None
+            # Kept for the whole TTL: each use is confirmed upstream anyway
+            ttl = self.ttl
+        return ttl, revalidate, lowered.get('etag')
+
+    def store(self, identity, key, generation, status, headers, body):
+        policy = self.cacheable(status, headers)
+        if policy is None or len(body) > self.max_entry_bytes:
+            return False
+        ttl, revalidate, etag = policy
+        entry = CacheEntry(identity, key, status, list(headers), body, time.monotonic() + ttl, etag, revalidate)
+        with self._lock:
+            if self._generations.get(identity, self._floor) != generation:
+                return False
+            old = self._entries.get((identity, key))
+            if old is not None:
+                self._remove(old)
+            self._entries[(identity, key)] = entry
+            self._by_identity.setdefault(identity, set()).add(key)
+            self._bytes += entry.size
+            self.stores += 1
+            while self._bytes > self.max_bytes and self._entries:
+                self._remove(next(iter(self._entries.values())))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, identity):
+        """Forget everything cached for ``identity``."""
+        with self._lock:
+            self._seq += 1
+            self._generations[identity] = self._seq
+            keys = self._by_identity.pop(identity, ())
+            for key in keys:
+                entry = self._entries.pop((identity, key))
+                self._bytes -= entry.size
+            if keys:
+                self.invalidations += 1
+            if len(self._generations) > 100000:
+                # Forget them all: everyone moves up to the latest number, so
+                # a GET in flight at worst fails to store, never stores stale
+                self._floor = self._seq
+                self._generations = {}
+
+    def _remove(self, entry):
+        del self._entries[(entry.identity, entry.key)]
+        keys = self._by_identity.get(entry.identity)
+        if keys is not None:
+            keys.discard(entry.key)
+            if not keys:
+                del self._by_identity[entry.identity]
+        self._bytes -= entry.size
+
+    def recorder(self, identity, key, generation, status, headers):
+        """Collects a streamed response body and stores it when complete, if it is cacheable.
+
+        ``generation`` is :meth:`generation` from before the request was sent.
+        """
+        if identity is None or self.cacheable(status, headers) is None:
+            return None
+        return _Recorder(self, identity, key, generation, status, headers)
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.revalidated
+            lookups = served + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'hit_ratio': round(served / lookups, 4) if lookups else 0.0,
+                'stores': self.stores,
+                'invalidations': self.invalidations,
+                'evictions': self.evictions,
+            }
+
+
+class _Recorder:
+    def __init__(self, cache, identity, key, generation, status, headers):
+        self.cache = cache
+        self.identity = identity
+        self.key = key
+        self.generation = generation
+        self.status = status
+        self.headers = list(headers)
+        self.chunks = []
+        self.size = 0
+
+    def feed(self, chunk):
+        if self.chunks is None:
+            return
+        self.size += len(chunk)
+        if self.size > self.cache.max_entry_bytes:
+            self.chunks = None
+        else:
+            self.chunks.append(chunk)
+
+    def finish(self):
+        if self.chunks is not None:
+            self.cache.store(self.identity, self.key, self.generation, self.status, self.headers,
+                             b''.join(self.chunks))
+
+
+_caches = []
+
+
+def _cache_stat(key):
+    return lambda: {(cache.name,): cache.stats()[key] for cache in list(_caches)}
+
+
+REGISTRY.gauge('response_cache_entries', 'Responses cached.', _cache_stat('entries'), ('cache',))
+REGISTRY.gauge('response_cache_bytes', 'Bytes of cached response bodies.', _cache_stat('bytes'), ('cache',))
+REGISTRY.gauge('response_cache_hits', 'Responses served from the cache without asking upstream.',
+               _cache_stat('hits'), ('cache',))
+REGISTRY.gauge('response_cache_revalidated', 'Cached responses served after an upstream 304.',
+               _cache_stat('revalidated'), ('cache',))
+REGISTRY.gauge('response_cache_misses', 'Cache lookups that went upstream for the full response.',
+               _cache_stat('misses'), ('cache',))
+REGISTRY.gauge('response_cache_hit_ratio', 'Share of lookups answered from the cache (hits + revalidated).',
+               _cache_stat('hit_ratio'), ('cache',))
+REGISTRY.gauge('response_cache_invalidations', 'Writes that dropped cached responses.',
+               _cache_stat('invalidations'), ('cache',))
@@ -1,56 +1,140 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from flask import Flask, Response, request, jsonify
 import requests
+from flask_cors import CORS
 import os
+import sys
 from dotenv import load_dotenv
 
+# Before the shared modules, which read their settings at import time
 load_dotenv()
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from metrics import instrument_app
+from upstream_client import get_client
+from response_cache import WRITE_METHODS, ResponseCache
+from resilience import REQUEST_DEADLINE, CircuitOpenError, DeadlineExceeded, install_deadline
+from token_cache import TokenVerifier
+from internal_auth import IDENTITY_HEADER
+from proxy import (CHUNK_SIZE, METHODS, ROUTES, UPSTREAM_URLS, BodyStream, authenticate, cache_key, match_route,
+                   request_headers, response_headers, use_response_cache)
+
 app = Flask(__name__)
 CORS(app)
+instrument_app(app)
+install_deadline(app, default=REQUEST_DEADLINE)
 
-# Service URLs
-AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', 'http://localhost:5001')
-TASK_SERVICE_URL = os.getenv('TASK_SERVICE_URL', 'http://localhost:5002')
-
-@app.route('/auth/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-def auth_service(path):
-    url = f'{AUTH_SERVICE_URL}/auth/{path}'
-    response = requests.request(
-        method=request.method,
-        url=url,
-        headers={key: value for key, value in request.headers if key != 'Host'},
-        data=request.get_data(),
-        cookies=request.cookies,
-        allow_redirects=False
-    )
-    return response.content, response.status_code, response.headers.items()
-
-@app.route('/tasks/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
-def task_service(path):
-    url = f'{TASK_SERVICE_URL}/tasks/{path}'
-    response = requests.request(
-        method=request.method,
-        url=url,
-        headers={key: value for key, value in request.headers if key != 'Host'},
-        data=request.get_data(),
-        cookies=request.cookies,
-        allow_redirects=False
-    )
-    return response.content, response.status_code, response.headers.items()
-
-@app.route('/tasks', methods=['GET', 'POST'])
-def tasks():
-    url = f'{TASK_SERVICE_URL}/tasks'
-    response = requests.request(
-        method=request.method,
-        url=url,
-        headers={key: value for key, value in request.headers if key != 'Host'},
-        data=request.get_data(),
-        cookies=request.cookies,
-        allow_redirects=False
+# One pooled keep-alive session per upstream (see proxy.UPSTREAM_URLS),
+# shared by all request threads
+upstreams = {name: get_client(name, url) for name, url in UPSTREAM_URLS.items()}
+
+# Short-lived GET responses per user, dropped on any write by that user
+response_cache = ResponseCache('gateway')
+
+# Tokens are verified here, once per request, for every authenticated upstream
+token_verifier = TokenVerifier(os.getenv('JWT_SECRET', 'your-secret-key'), ['HS256'], name='gateway')
+
+@app.errorhandler(requests.exceptions.Timeout)
+def upstream_timeout(e):
+    return jsonify({'error': 'Upstream service timed out'}), 504
+
+@app.errorhandler(requests.exceptions.ConnectionError)
+def upstream_unreachable(e):
+    return jsonify({'error': 'Upstream service unavailable'}), 502
+
+@app.errorhandler(CircuitOpenError)
+def upstream_circuit_open(e):
+    return jsonify({'error': 'Upstream service unavailable'}), 503, {'Retry-After': str(e.retry_after)}
+
+@app.errorhandler(DeadlineExceeded)
+def upstream_deadline_exceeded(e):
+    return jsonify({'error': 'Upstream service timed out'}), 504
+
+def _request_body():
+    if request.content_length is not None:
+        return BodyStream(request.stream, request.content_length) if request.content_length else None
+    if request.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        return iter(lambda: request.stream.read(CHUNK_SIZE), b'')
+    return None
+
+def _cached_response(entry, outcome):
+    return Response(entry.body, status=entry.status, headers=entry.headers + [('X-Cache', outcome)])
+
+def proxy(rest=None):
+    upstream_name = match_route(request.path)
+    identity, identity_header, auth_error = authenticate(upstream_name, request.headers, token_verifier)
+    if auth_error:
+        return jsonify({'error': auth_error}), 401
+    upstream = upstreams[upstream_name]
+    path = request.full_path if request.query_string else request.path
+    # None drops the session's own defaults: the client's headers decide
+    # (an upstream asked for gzip by the gateway would send gzip to a
+    # client that can't read it)
+    headers = {'Accept': None, 'Accept-Encoding': None, 'User-Agent': None}
+    for name, value in request_headers(request.headers.items(), request.remote_addr, request.scheme):
+        headers[name] = f'{headers[name]}, {value}' if headers.get(name) else value
+    if identity_header:
+        headers[IDENTITY_HEADER] = identity_header
+
+    cached = None
+    cacheable = identity is not None and response_cache.enabled and use_response_cache(request.method, request.headers)
+    if cacheable:
+        key = cache_key(path, request.headers)
+        generation = response_cache.generation(identity)
+        cached = response_cache.lookup(identity, key)
+        if cached is not None:
+            if not cached.revalidate:
+                return _cached_response(cached, 'HIT')
+            headers['If-None-Match'] = cached.etag
+    elif identity is not None and request.method in WRITE_METHODS:
+        response_cache.invalidate(identity)
+
+    response = upstream.request(
+        request.method,
+        path,
+        headers=headers,
+        data=_request_body(),
+        allow_redirects=False,
+        stream=True
     )
-    return response.content, response.status_code, response.headers.items()
+    if identity is not None and request.method in WRITE_METHODS:
+        response_cache.invalidate(identity)
+    if cached is not None:
+        response_cache.revalidation(response.status_code == 304)
+        if response.status_code == 304:
+            response.close()
+            return _cached_response(cached, 'REVALIDATED')
+
+    # raw.headers keeps repeated headers (Set-Cookie) apart
+    reply_headers = response_headers(response.raw.headers.items())
+    recorder = response_cache.recorder(identity, key, generation, response.status_code,
+                                       reply_headers) if cacheable else None
+
+    def body():
+        try:
+            for chunk in response.raw.stream(CHUNK_SIZE, decode_content=False):
+                if recorder is not None:
+                    recorder.feed(chunk)
+                yield chunk
+            if recorder is not None:
+                recorder.finish()
+        finally:
+            response.close()
+
+    if cacheable:
+        reply_headers.append(('X-Cache', 'MISS'))
+    return Response(body(), status=response.status_code, headers=reply_headers, direct_passthrough=True)
+
+# One URL rule pair per route table entry; the path is forwarded unchanged
+for prefix, _ in ROUTES:
+    app.add_url_rule(prefix, 'proxy', proxy, methods=METHODS)
+    app.add_url_rule(f'{prefix}/<path:rest>', 'proxy', proxy, methods=METHODS)
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
+    # GATEWAY_MODE=async serves the same routes from the asyncio front end
+    # in async_app.py; the default is this threaded Flask app
+    port = int(os.getenv('PORT', '5000'))
+    if os.getenv('GATEWAY_MODE', 'sync') == 'async':
+        from async_app import run
+        run(host='0.0.0.0', port=port)
+    else:
+        app.run(host='0.0.0.0', port=port) 
\ No newline at end of file
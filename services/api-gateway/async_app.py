@@ -0,0 +1,329 @@
+"""asyncio front end for the gateway (``GATEWAY_MODE=async``).
+
+Serves the same route table as the Flask gateway (see :mod:`proxy`) on
+one event loop. A request waiting on a slow upstream costs a coroutine
+instead of a worker thread, so thousands can be in flight at once.
+
+Each upstream has its own:
+
+* limit on concurrent calls: ``<NAME>_MAX_CONCURRENCY`` /
+  ``UPSTREAM_MAX_CONCURRENCY`` (1000). Callers over the limit wait up to
+  ``UPSTREAM_QUEUE_TIMEOUT`` seconds (1) and then get a 503, so one slow
+  upstream can't take the whole gateway down with it.
+* connection pool: ``<NAME>_POOL_SIZE`` / ``UPSTREAM_POOL_SIZE``, by
+  default as large as the concurrency limit
+* connect and read timeouts: ``UPSTREAM_CONNECT_TIMEOUT`` (2) and
+  ``UPSTREAM_READ_TIMEOUT`` (10). Exceeding them returns a 504; a refused
+  connection returns a 502.
+* circuit breaker and retry policy (see :mod:`resilience`): an open breaker
+  answers 503 with Retry-After; GETs and other bodiless idempotent calls
+  are retried on a refused connection, a timeout or a 502/503/504
+
+Every request gets ``REQUEST_DEADLINE`` seconds, or less if the client sent
+``X-Deadline-Ms``. Upstream timeouts are capped by what is left of it and
+the remainder is forwarded in ``X-Deadline-Ms``.
+
+Metrics are served at ``/metrics`` as in the Flask gateway.
+"""
+import asyncio
+import os
+import sys
+import time
+
+from aiohttp import ClientConnectionError, ClientSession, ClientTimeout, TCPConnector, web
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from metrics import (CONTENT_TYPE, REGISTRY, REQUEST_ERRORS, REQUEST_LATENCY, REQUESTS, UPSTREAM_LATENCY,
+                     UPSTREAM_REQUESTS)
+from response_cache import WRITE_METHODS, ResponseCache
+from resilience import (DEADLINE_EXCEEDED, DEADLINE_HEADER, IDEMPOTENT_METHODS, REQUEST_DEADLINE, RETRY_STATUSES,
+                        CircuitBreaker, CircuitOpenError, RetryPolicy, deadline_from_headers, deadline_header,
+                        time_left)
+from upstream_client import upstream_setting
+from token_cache import TokenVerifier
+from internal_auth import IDENTITY_HEADER
+from proxy import (CHUNK_SIZE, METHODS, ROUTES, UPSTREAM_URLS, authenticate, cache_key, match_route,
+                   request_headers, response_headers, use_response_cache)
+
+UPSTREAM_REJECTED = REGISTRY.counter('upstream_concurrency_rejected_total',
+                                     'Calls refused because the upstream was at its concurrency limit.',
+                                     ('upstream',))
+
+
+class AsyncUpstream:
+    def __init__(self, name, base_url):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.max_concurrency = upstream_setting(name, 'MAX_CONCURRENCY', 1000, int)
+        self.pool_size = upstream_setting(name, 'POOL_SIZE', self.max_concurrency, int)
+        self.queue_timeout = upstream_setting(name, 'QUEUE_TIMEOUT', 1.0, float)
+        self.timeout = ClientTimeout(
+            total=None,
+            sock_connect=upstream_setting(name, 'CONNECT_TIMEOUT', 2.0, float),
+            sock_read=upstream_setting(name, 'READ_TIMEOUT', 10.0, float),
+        )
+        self.breaker = CircuitBreaker(name)
+        self.retries = RetryPolicy(name)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._slots = None
+        self.session = None
+
+    async def start(self):
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        # auto_decompress=False: bodies pass through exactly as the upstream sent them
+        self.session = ClientSession(
+            connector=TCPConnector(limit=self.pool_size, keepalive_timeout=30),
+            timeout=self.timeout,
+            auto_decompress=False,
+            skip_auto_headers=('Accept', 'Accept-Encoding', 'User-Agent'),
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            UPSTREAM_REJECTED.labels(self.name).inc()
+            return False
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+
+def _error(status, message):
+    return web.json_response({'error': message}, status=status)
+
+
+def _cached_response(entry, outcome):
+    response = web.Response(body=entry.body, status=entry.status)
+    for name, value in entry.headers:
+        if name.lower() != 'content-length':
+            response.headers.add(name, value)
+    response.headers['X-Cache'] = outcome
+    return response
+
+
+async def proxy(request):
+    upstream_name = match_route(request.path)
+    identity, identity_header, auth_error = authenticate(upstream_name, request.headers, request.app['token_verifier'])
+    if auth_error:
+        return _error(401, auth_error)
+    upstream = request.app['upstreams'][upstream_name]
+    # Counted from arrival, so time spent queueing for the upstream uses it up too
+    deadline = deadline_from_headers(request.headers, REQUEST_DEADLINE)
+    cache = request.app['response_cache']
+    cached = None
+    cacheable = identity is not None and cache.enabled and use_response_cache(request.method, request.headers)
+    if cacheable:
+        key = cache_key(request.raw_path, request.headers)
+        generation = cache.generation(identity)
+        cached = cache.lookup(identity, key)
+        if cached is not None and not cached.revalidate:
+            return _cached_response(cached, 'HIT')
+    elif identity is not None and request.method in WRITE_METHODS:
+        cache.invalidate(identity)
+
+    if not await upstream.acquire():
+        return _error(503, 'Upstream service busy')
+    try:
+        return await _forward(request, upstream, cache, identity, cached,
+                              (key, generation) if cacheable else None, deadline, identity_header)
+    except CircuitOpenError as e:
+        return web.json_response({'error': 'Upstream service unavailable'}, status=503,
+                                 headers={'Retry-After': str(e.retry_after)})
+    finally:
+        upstream.release()
+        if identity is not None and request.method in WRITE_METHODS:
+            cache.invalidate(identity)
+
+
+async def _send(request, upstream, headers, data, deadline):
+    """One call to ``upstream``; the response is open until released."""
+    timeout = upstream.timeout
+    left = time_left(deadline)
+    if left is not None:
+        timeout = ClientTimeout(total=None, sock_connect=min(timeout.sock_connect, left),
+                                sock_read=min(timeout.sock_read, left))
+        headers = headers + [(DEADLINE_HEADER, deadline_header(deadline))]
+    start = time.perf_counter()
+    status = 'error'
+    try:
+        response = await upstream.session.request(request.method, upstream.base_url + request.raw_path,
+                                                  headers=headers, data=data, allow_redirects=False,
+                                                  timeout=timeout)
+        status = str(response.status)
+        return response
+    finally:
+        UPSTREAM_LATENCY.labels(upstream.name, request.method).observe(time.perf_counter() - start)
+        UPSTREAM_REQUESTS.labels(upstream.name, request.method, status).inc()
+
+
+async def _forward(request, upstream, cache, identity, cached, cache_slot, deadline, identity_header):
+    peer = request.transport.get_extra_info('peername') if request.transport else None
+    headers = request_headers(request.headers.items(), peer[0] if peer else None, request.scheme)
+    headers = [(name, value) for name, value in headers if name.lower() != DEADLINE_HEADER.lower()]
+    if request.content_length is not None:
+        headers.append(('Content-Length', str(request.content_length)))
+    if cached is not None:
+        headers.append(('If-None-Match', cached.etag))
+    if identity_header:
+        headers.append((IDENTITY_HEADER, identity_header))
+    data = request.content if request.body_exists else None
+    # A streamed request body can only be sent once
+    retryable = request.method in IDEMPOTENT_METHODS and data is None
+
+    upstream.retries.budget.record_call()
+    attempt = 0
+    while True:
+        left = time_left(deadline)
+        if left is not None and left <= 0:
+            DEADLINE_EXCEEDED.labels(upstream.name).inc()
+            return _error(504, 'Upstream service timed out')
+        upstream.breaker.check()
+        try:
+            response = await _send(request, upstream, headers, data, deadline)
+        except (asyncio.TimeoutError, ClientConnectionError) as e:
+            upstream.breaker.record_failure()
+            delay = upstream.retries.delay(attempt, deadline) if retryable else None
+            if delay is None:
+                if isinstance(e, asyncio.TimeoutError):
+                    return _error(504, 'Upstream service timed out')
+                return _error(502, 'Upstream service unavailable')
+        else:
+            if response.status not in RETRY_STATUSES:
+                upstream.breaker.record_success()
+                break
+            upstream.breaker.record_failure()
+            delay = upstream.retries.delay(attempt, deadline) if retryable else None
+            if delay is None:
+                break
+            response.release()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+    try:
+        if cached is not None:
+            cache.revalidation(response.status == 304)
+            if response.status == 304:
+                return _cached_response(cached, 'REVALIDATED')
+        raw = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in response.raw_headers]
+        reply_headers = response_headers(raw)
+        recorder = cache.recorder(identity, cache_slot[0], cache_slot[1], response.status,
+                                  reply_headers) if cache_slot else None
+        reply = web.StreamResponse(status=response.status, reason=response.reason)
+        for name, value in reply_headers:
+            reply.headers.add(name, value)
+        if cache_slot:
+            reply.headers['X-Cache'] = 'MISS'
+        await reply.prepare(request)
+        # Headers are out: a failure from here on can only cut the connection
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            if recorder is not None:
+                recorder.feed(chunk)
+            await reply.write(chunk)
+        await reply.write_eof()
+        if recorder is not None:
+            recorder.finish()
+        return reply
+    finally:
+        response.release()
+
+
+@web.middleware
+async def metrics_middleware(request, handler):
+    start = time.perf_counter()
+    route = request.match_info.route.resource.canonical if request.match_info.route.resource else 'unmatched'
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        REQUEST_LATENCY.labels(request.method, route).observe(time.perf_counter() - start)
+        REQUESTS.labels(request.method, route, str(status)).inc()
+        if status >= 500:
+            REQUEST_ERRORS.labels(request.method, route).inc()
+
+
+# Same policy as flask_cors' defaults in the Flask gateway
+
+@web.middleware
+async def cors_preflight_middleware(request, handler):
+    if request.method == 'OPTIONS' and 'Access-Control-Request-Method' in request.headers:
+        response = web.Response(status=200)
+        response.headers['Access-Control-Allow-Methods'] = ', '.join(METHODS + ('OPTIONS',))
+        if 'Access-Control-Request-Headers' in request.headers:
+            response.headers['Access-Control-Allow-Headers'] = request.headers['Access-Control-Request-Headers']
+        return response
+    return await handler(request)
+
+
+async def add_cors_origin(request, response):
+    # Runs just before the headers go out, streamed responses included
+    response.headers.setdefault('Access-Control-Allow-Origin', '*')
+
+
+async def metrics_view(request):
+    return web.Response(body=REGISTRY.expose().encode('utf-8'), headers={'Content-Type': CONTENT_TYPE})
+
+
+def _in_flight_stat(key):
+    return lambda: {(upstream.name,): getattr(upstream, key) for upstream in _upstreams}
+
+
+_upstreams = []
+
+REGISTRY.gauge('upstream_concurrency_in_flight', 'Calls in flight per upstream.', _in_flight_stat('in_flight'),
+               ('upstream',))
+REGISTRY.gauge('upstream_concurrency_max_in_flight', 'Most calls in flight at once per upstream since start.',
+               _in_flight_stat('max_in_flight'), ('upstream',))
+REGISTRY.gauge('upstream_concurrency_limit', 'Concurrent calls allowed per upstream.',
+               _in_flight_stat('max_concurrency'), ('upstream',))
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_preflight_middleware, metrics_middleware])
+    app.on_response_prepare.append(add_cors_origin)
+    app['upstreams'] = {name: AsyncUpstream(name, url) for name, url in UPSTREAM_URLS.items()}
+    _upstreams[:] = app['upstreams'].values()
+    # Short-lived GET responses per user, dropped on any write by that user
+    app['response_cache'] = ResponseCache('gateway')
+    # Tokens are verified here, once per request, for every authenticated upstream
+    app['token_verifier'] = TokenVerifier(os.getenv('JWT_SECRET', 'your-secret-key'), ['HS256'], name='gateway')
+
+    async def start_upstreams(app):
+        for upstream in app['upstreams'].values():
+            await upstream.start()
+
+    async def close_upstreams(app):
+        for upstream in app['upstreams'].values():
+            await upstream.close()
+
+    app.on_startup.append(start_upstreams)
+    app.on_cleanup.append(close_upstreams)
+
+    app.router.add_get('/metrics', metrics_view)
+    for prefix, _ in ROUTES:
+        for path in (prefix, prefix + '/{rest:.*}'):
+            for method in METHODS:
+                app.router.add_route(method, path, proxy)
+    return app
+
+
+def run(host='0.0.0.0', port=5000):
+    web.run_app(create_app(), host=host, port=port, access_log=None)
+
+
+if __name__ == '__main__':
+    run(port=int(os.getenv('PORT', '5000')))
@@ -0,0 +1,159 @@
+"""Reverse proxy core shared by the gateway front ends.
+
+``ROUTES`` maps a path prefix to the upstream that serves it; paths are
+forwarded unchanged, query string included. Bodies are streamed in
+``CHUNK_SIZE`` pieces both ways, so the gateway never holds a whole request
+or response, and upstream bytes are passed on undecoded (a gzip body stays
+gzip, and its Content-Length stays right).
+
+Hop-by-hop headers (RFC 7230 section 6.1: ``Connection``, ``Keep-Alive``,
+``Transfer-Encoding``, ... plus whatever ``Connection`` itself lists) only
+describe one connection, so they are dropped in both directions; each side
+of the gateway frames its own messages.
+
+Requests to ``AUTHENTICATED_UPSTREAMS`` need a valid token, checked here
+once: a missing or invalid one is answered with a 401 without calling the
+upstream. Other upstreams get the request either way. Whenever the token
+is valid, the verified identity is passed on in a signed header (see
+:mod:`internal_auth`), so the upstream can skip decoding the token again.
+"""
+import os
+
+import jwt
+
+from internal_auth import IDENTITY_HEADER, INTERNAL_AUTH_SECRET, sign_identity
+
+CHUNK_SIZE = int(os.getenv('PROXY_CHUNK_SIZE', '65536'))
+
+UPSTREAM_URLS = {
+    'auth_service': os.getenv('AUTH_SERVICE_URL', 'http://localhost:5001'),
+    'task_service': os.getenv('TASK_SERVICE_URL', 'http://localhost:5002'),
+}
+
+# Path prefix -> upstream; a prefix matches itself and anything below it
+ROUTES = (
+    ('/auth', 'auth_service'),
+    ('/tasks', 'task_service'),
+)
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# Upstreams where every route needs a token (auth_service issues them)
+AUTHENTICATED_UPSTREAMS = frozenset(('task_service',))
+
+HOP_BY_HOP = frozenset((
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade',
+))
+
+
+def match_route(path):
+    """The upstream serving ``path``, or None."""
+    for prefix, upstream in ROUTES:
+        if path == prefix or path.startswith(prefix + '/'):
+            return upstream
+    return None
+
+
+def end_to_end_headers(headers, drop=()):
+    """``(name, value)`` pairs from ``headers`` without hop-by-hop headers or ``drop``."""
+    headers = list(headers)
+    listed = set()
+    for name, value in headers:
+        if name.lower() == 'connection':
+            listed.update(token.strip().lower() for token in value.split(','))
+    skip = HOP_BY_HOP | listed | {name.lower() for name in drop}
+    return [(name, value) for name, value in headers if name.lower() not in skip]
+
+
+def request_headers(headers, client_addr, scheme):
+    """Headers to send upstream for a client request.
+
+    ``Host`` and ``Content-Length`` are set again by the HTTP client for
+    the upstream connection. ``X-Forwarded-*`` tell the upstream who the
+    original client was.
+    """
+    headers = list(headers)
+    # Only the gateway itself may vouch for an identity
+    forwarded = end_to_end_headers(headers, drop=('host', 'content-length', 'x-forwarded-proto',
+                                                  'x-forwarded-host', IDENTITY_HEADER))
+    host = next((value for name, value in headers if name.lower() == 'host'), None)
+    prior = [value for name, value in forwarded if name.lower() == 'x-forwarded-for']
+    forwarded = [(name, value) for name, value in forwarded if name.lower() != 'x-forwarded-for']
+    chain = prior + [client_addr] if client_addr else prior
+    if chain:
+        forwarded.append(('X-Forwarded-For', ', '.join(chain)))
+    forwarded.append(('X-Forwarded-Proto', scheme))
+    if host:
+        forwarded.append(('X-Forwarded-Host', host))
+    return forwarded
+
+
+def authenticate(upstream, headers, verifier):
+    """``(user id, identity header value, error)`` for a request to ``upstream``.
+
+    ``error`` is the 401 message when the request must be refused. The user
+    id is the verified token's, and None when there is no valid token; the
+    response cache keys on it. The identity header value is None when there
+    is nothing to vouch for (no valid token, or no ``INTERNAL_AUTH_SECRET``).
+    """
+    token = headers.get('Authorization')
+    required = upstream in AUTHENTICATED_UPSTREAMS
+    if not token:
+        return None, None, 'No token provided' if required else None
+    try:
+        payload = verifier.verify(token)
+    except jwt.InvalidTokenError:
+        # A public upstream answers for a bad token itself (/auth/verify says why)
+        return None, None, 'Invalid token' if required else None
+    return payload.get('user_id'), (sign_identity(payload, token) if INTERNAL_AUTH_SECRET else None), None
+
+
+def response_headers(headers):
+    """Headers to return to the client for an upstream response."""
+    return end_to_end_headers(headers)
+
+
+def cache_key(path_qs, headers):
+    """What a cached GET response depends on besides the caller's identity.
+
+    ``Accept`` picks the format: the task services answer the same path
+    with JSON or, for ``application/x-ndjson``, a stream of lines.
+    """
+    return path_qs, headers.get('Accept', ''), headers.get('Accept-Encoding', '')
+
+
+def use_response_cache(method, headers):
+    """Whether a request may be answered from, and fill, the response cache.
+
+    Conditional and range requests go straight through (the upstream
+    answers those cheaply anyway), as do callers who ask for a fresh copy.
+    """
+    if method != 'GET' or 'If-None-Match' in headers or 'If-Modified-Since' in headers or 'Range' in headers:
+        return False
+    directives = headers.get('Cache-Control', '').lower()
+    return 'no-cache' not in directives and 'no-store' not in directives
+
+
+class BodyStream:
+    """A request body read in chunks from ``stream``.
+
+    Its ``len()`` is the declared Content-Length, so the upstream request
+    keeps a Content-Length instead of switching to chunked encoding.
+    """
+
+    def __init__(self, stream, length):
+        self.stream = stream
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        remaining = self.length
+        while remaining > 0:
+            chunk = self.stream.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
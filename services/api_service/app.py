@@ -1,61 +1,119 @@
 from flask import Flask, request, jsonify, session
 from flask_cors import CORS
-import requests
 import os
+import requests
 from dotenv import load_dotenv
-import logging
+import sys
 from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from logging_config import setup_logging
+from json_provider import install_json
+from metrics import instrument_app
+from response_cache import WRITE_METHODS, CachedResponse, ResponseCache
+from resilience import REQUEST_DEADLINE, CircuitOpenError, DeadlineExceeded, install_deadline
+from upstream_client import get_client
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+instrument_app(app)
+# Task lists relayed from task_service are re-encoded with orjson when it is installed
+install_json(app)
+# Every request gets REQUEST_DEADLINE seconds; upstream calls keep to what is left
+install_deadline(app, default=REQUEST_DEADLINE)
 app.secret_key = os.urandom(24)  # Thêm secret key cho session
 
 # Cấu hình logging
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+logger = setup_logging('api_service')
 
 # Service URLs
 TASK_SERVICE_URL = os.getenv('TASK_SERVICE_URL', 'http://localhost:5001')
 USER_SERVICE_URL = os.getenv('USER_SERVICE_URL', 'http://localhost:5002')
 
+# One pooled keep-alive session per upstream, shared by all request threads
+task_service = get_client('task_service', TASK_SERVICE_URL)
+user_service = get_client('user_service', USER_SERVICE_URL)
+
+def error_response(e):
+    """The response for an exception raised while handling a request."""
+    if isinstance(e, CircuitOpenError):
+        return jsonify({"error": "Service unavailable"}), 503, {'Retry-After': str(e.retry_after)}
+    if isinstance(e, (DeadlineExceeded, requests.Timeout)):
+        return jsonify({"error": "Upstream service timed out"}), 504
+    if isinstance(e, requests.ConnectionError):
+        return jsonify({"error": "Upstream service unavailable"}), 502
+    return jsonify({"error": str(e)}), 500
+
+# Short-lived upstream GET responses per session user, dropped on that
+# user's writes (before they are forwarded and again after they return)
+response_cache = ResponseCache('api_service')
+
+@app.before_request
+def invalidate_before_write():
+    if request.method in WRITE_METHODS and 'user_id' in session:
+        response_cache.invalidate(session['user_id'])
+
+@app.after_request
+def invalidate_after_write(response):
+    if request.method in WRITE_METHODS and 'user_id' in session:
+        response_cache.invalidate(session['user_id'])
+    return response
+
+def cached_get(client, path):
+    """GET ``path`` from ``client`` through the session user's response cache."""
+    identity = session.get('user_id')
+    if identity is None or not response_cache.enabled:
+        return client.get(path)
+    key = (client.name, path)
+    generation = response_cache.generation(identity)
+    entry = response_cache.lookup(identity, key)
+    if entry is not None and not entry.revalidate:
+        return CachedResponse(entry)
+    response = client.get(path, headers={'If-None-Match': entry.etag} if entry is not None else None)
+    if entry is not None:
+        response_cache.revalidation(response.status_code == 304)
+        if response.status_code == 304:
+            return CachedResponse(entry)
+    response_cache.store(identity, key, generation, response.status_code, response.headers.items(), response.content)
+    return response
+
 @app.route('/api/login', methods=['POST'])
 def login():
     try:
         data = request.json
-        response = requests.post(f'{USER_SERVICE_URL}/login', json=data)
+        response = user_service.post('/login', json=data)
         if response.status_code == 200:
             session['user_id'] = data.get('email')
             return jsonify(response.json()), 200
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Login error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Login error: %s", e)
+        return error_response(e)
 
 @app.route('/api/register', methods=['POST'])
 def register():
     try:
         data = request.json
-        response = requests.post(f'{USER_SERVICE_URL}/register', json=data)
+        response = user_service.post('/register', json=data)
         if response.status_code == 201:
             session['user_id'] = data.get('email')
             return jsonify(response.json()), 201
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Registration error: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Registration error: %s", e)
+        return error_response(e)
 
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
     if 'user_id' not in session:
         return jsonify({"error": "Unauthorized"}), 401
     try:
-        response = requests.get(f'{TASK_SERVICE_URL}/tasks')
+        response = cached_get(task_service, '/tasks')
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Error getting tasks: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error getting tasks: %s", e)
+        return error_response(e)
 
 @app.route('/api/tasks', methods=['POST'])
 def create_task():
@@ -64,11 +122,11 @@ def create_task():
     try:
         data = request.json
         data['user_id'] = session['user_id']
-        response = requests.post(f'{TASK_SERVICE_URL}/tasks', json=data)
+        response = task_service.post('/tasks', json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Error creating task: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error creating task: %s", e)
+        return error_response(e)
 
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
 def update_task(task_id):
@@ -77,44 +135,44 @@ def update_task(task_id):
     try:
         data = request.json
         data['user_id'] = session['user_id']
-        response = requests.put(f'{TASK_SERVICE_URL}/tasks/{task_id}', json=data)
+        response = task_service.put(f'/tasks/{task_id}', json=data)
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Error updating task: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error updating task: %s", e)
+        return error_response(e)
 
 @app.route('/api/tasks/<int:task_id>', methods=['DELETE'])
 def delete_task(task_id):
     if 'user_id' not in session:
         return jsonify({"error": "Unauthorized"}), 401
     try:
-        response = requests.delete(f'{TASK_SERVICE_URL}/tasks/{task_id}')
+        response = task_service.delete(f'/tasks/{task_id}')
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Error deleting task: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error deleting task: %s", e)
+        return error_response(e)
 
 @app.route('/api/users', methods=['GET'])
 def get_users():
     if 'user_id' not in session:
         return jsonify({"error": "Unauthorized"}), 401
     try:
-        response = requests.get(f'{USER_SERVICE_URL}/users')
+        response = cached_get(user_service, '/users')
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Error getting users: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error getting users: %s", e)
+        return error_response(e)
 
 @app.route('/api/users', methods=['POST'])
 def create_user():
     try:
-        response = requests.post(f'{USER_SERVICE_URL}/users', json=request.json)
+        response = user_service.post('/users', json=request.json)
         if response.status_code == 201:
             session['user_id'] = request.json.get('email')
         return jsonify(response.json()), response.status_code
     except Exception as e:
-        logger.error(f"Error creating user: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error creating user: %s", e)
+        return error_response(e)
 
 @app.route('/api/logout', methods=['POST'])
 def logout():
@@ -3,14 +3,23 @@ from flask_cors import CORS
 from datetime import datetime, timedelta
 import jwt
 import os
+import sys
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from werkzeug.security import generate_password_hash, check_password_hash
 
+# Before the shared modules, which read their settings at import time
 load_dotenv()
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from internal_auth import trusted_identity
+from metrics import instrument_app
+from password_hashing import HashPoolFull, PasswordHasher
+from token_cache import TokenVerifier
+
 app = Flask(__name__)
 CORS(app)
+# Request metrics, the token cache's jwt_cache_* and the password_hash_* metrics, at /metrics
+instrument_app(app)
 
 # MongoDB connection
 client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
@@ -22,6 +31,17 @@ JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = 'HS256'
 JWT_EXP_DELTA_SECONDS = 3600
 
+# Remembers tokens already verified until they expire
+token_verifier = TokenVerifier(JWT_SECRET, [JWT_ALGORITHM], name='auth-service')
+
+# Hashes passwords in worker processes; a burst of logins gets 503s instead of every thread
+password_hasher = PasswordHasher()
+
+@app.errorhandler(HashPoolFull)
+def hashing_busy(e):
+    return (jsonify({'error': 'Too many sign-ins right now, try again shortly'}), 503,
+            {'Retry-After': str(e.retry_after)})
+
 @app.route('/auth/register', methods=['POST'])
 def register():
     data = request.get_json()
@@ -31,7 +51,7 @@ def register():
         
     user = {
         'email': data['email'],
-        'password': generate_password_hash(data['password']),
+        'password': password_hasher.generate(data['password']),
         'name': data['name'],
         'created_at': datetime.utcnow()
     }
@@ -44,7 +64,7 @@ def login():
     data = request.get_json()
     user = users.find_one({'email': data['email']})
     
-    if not user or not check_password_hash(user['password'], data['password']):
+    if not user or not password_hasher.check(user['password'], data['password']):
         return jsonify({'error': 'Invalid credentials'}), 401
         
     payload = {
@@ -63,7 +83,8 @@ def verify_token():
         return jsonify({'error': 'No token provided'}), 401
         
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        # Fast path: the gateway already verified this token and signed for it
+        payload = trusted_identity(request.headers, token) or token_verifier.verify(token)
         return jsonify({'user_id': payload['user_id'], 'email': payload['email']})
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token has expired'}), 401
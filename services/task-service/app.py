@@ -1,15 +1,27 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, json
 from flask_cors import CORS
 from datetime import datetime
 import os
+import sys
 from dotenv import load_dotenv
 from pymongo import MongoClient
-import jwt
 
+# Before the shared modules, which read their settings at import time
 load_dotenv()
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from internal_auth import trusted_identity
+from json_provider import install_json
+from metrics import instrument_app
+from pagination import encode_cursor, id_after, page_args, wants_ndjson
+from token_cache import TokenVerifier
+
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])
+# Request metrics and the token cache's jwt_cache_* gauges, at /metrics
+instrument_app(app)
+# Documents are returned as read; ObjectIds are encoded without a pass to str() them
+install_json(app)
 
 # MongoDB connection
 client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
@@ -20,13 +32,27 @@ tasks = db['tasks']
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = 'HS256'
 
+# Remembers tokens already verified until they expire
+token_verifier = TokenVerifier(JWT_SECRET, [JWT_ALGORITHM], name='task-service')
+
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
+
 def verify_token(token):
+    # Fast path: the gateway already verified this token and signed for it
+    payload = trusted_identity(request.headers, token)
+    if payload is not None:
+        return payload
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = token_verifier.verify(token)
         return payload
     except:
         return None
 
+def stream_ndjson(cursor):
+    # One document per line, written as the cursor yields them
+    for task in cursor:
+        yield json.dumps(task) + '\n'
+
 @app.route('/tasks', methods=['GET'])
 def get_tasks():
     token = request.headers.get('Authorization')
@@ -37,10 +63,36 @@ def get_tasks():
     if not payload:
         return jsonify({'error': 'Invalid token'}), 401
         
-    user_tasks = list(tasks.find({'user_id': payload['user_id']}))
-    for task in user_tasks:
-        task['_id'] = str(task['_id'])
-    return jsonify(user_tasks)
+    try:
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Pages are ordered by _id, which is also the cursor key
+    query = {'user_id': payload['user_id']}
+    if after is not None:
+        query = {'$and': [query, id_after(after[0])]}
+    cursor = tasks.find(query)
+    if limit or after is not None:
+        cursor = cursor.sort('_id', 1)
+
+    if wants_ndjson(request):
+        if limit:
+            cursor = cursor.limit(limit)
+        return Response(stream_with_context(stream_ndjson(cursor.batch_size(STREAM_BATCH_SIZE))),
+                        mimetype='application/x-ndjson')
+
+    if limit:
+        cursor = cursor.limit(limit + 1)
+    user_tasks = list(cursor)
+    next_cursor = None
+    if limit and len(user_tasks) > limit:
+        user_tasks = user_tasks[:limit]
+        next_cursor = encode_cursor([str(user_tasks[-1]['_id'])])
+    response = jsonify(user_tasks)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 @app.route('/tasks', methods=['POST'])
 def create_task():
@@ -61,8 +113,7 @@ def create_task():
         'created_at': datetime.utcnow()
     }
     
-    result = tasks.insert_one(task)
-    task['_id'] = str(result.inserted_id)
+    tasks.insert_one(task)
     return jsonify(task), 201
 
 @app.route('/tasks/<task_id>', methods=['PUT'])
@@ -88,7 +139,6 @@ def update_task(task_id):
     
     tasks.update_one({'_id': task_id}, {'$set': update_data})
     task.update(update_data)
-    task['_id'] = str(task['_id'])
     return jsonify(task)
 
 @app.route('/tasks/<task_id>', methods=['DELETE'])
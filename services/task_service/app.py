@@ -1,19 +1,36 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, json
 from flask_cors import CORS
 from datetime import datetime
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient, ReadPreference, WriteConcern
-import jwt
+from pymongo import MongoClient, ReadPreference, ReturnDocument, WriteConcern, DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, ExecutionTimeout
+from bson import ObjectId
+import hashlib
 import sys
+import re
 import logging
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from logging_config import setup_logging
+from metrics import instrument_app, mongo_command_listener
+from resilience import DEADLINE_EXCEEDED, current_deadline, install_deadline, time_left
+from token_cache import TokenVerifier
+from internal_auth import trusted_identity
+from json_provider import install_json
+from mongo_schema import ensure_indexes
+from date_views import in_bounds, range_from_args
+from pagination import encode_cursor, id_after, page_args, wants_ndjson
+from task_ids import new_task_id
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor', 'ETag', 'X-Task-Version'])
+instrument_app(app)
+# ObjectIds and datetimes in responses are encoded as they are, without a pass to str() them
+install_json(app)
+# Requests that arrive past the caller's X-Deadline-Ms get a 504 unprocessed
+install_deadline(app)
 
 # Setup logging
 logger = setup_logging('task_service')
@@ -22,23 +39,126 @@ logger = setup_logging('task_service')
 client = MongoClient(
     os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
     readPreference=ReadPreference.SECONDARY_PREFERRED,
-    writeConcern=WriteConcern(w='majority')
+    writeConcern=WriteConcern(w='majority'),
+    event_listeners=[mongo_command_listener()]
 )
 db = client['todo_app']
 tasks = db['tasks']
+# {_id: user_id, version, floor}; bumped in the same transaction as every
+# write to the user's tasks, so a version is never visible before its writes
+# (on a replica set; a standalone mongod has no transactions, see _in_transaction).
+# Read from the primary. Readers that pair a version with tasks read both in
+# one causally consistent session: the task query waits, on a secondary, until
+# that secondary has caught up with the version just read.
+task_versions = db.get_collection('task_versions', read_preference=ReadPreference.PRIMARY)
+# {user_id, task_id, version} for deleted tasks, read by /tasks/changes
+task_tombstones = db.get_collection('task_tombstones', read_preference=ReadPreference.PRIMARY)
+MAX_TOMBSTONES = int(os.getenv('MAX_TOMBSTONES', '1000'))
+# Most operations accepted by one POST /tasks/batch
+MAX_BATCH_OPS = int(os.getenv('MAX_BATCH_OPS', '1000'))
+# POST /tasks/bulk: most operations per request, and per bulk_write unless
+# the request asks for another batch size
+MAX_BULK_OPS = int(os.getenv('MAX_BULK_OPS', '100000'))
+BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '1000'))
+
+# Indexes behind every query below (listings, date views, search, changes)
+ensure_indexes(db, ('tasks', 'task_tombstones'), logger)
+
+# Documents fetched per round trip when streaming NDJSON
+STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', '500'))
 
 # JWT configuration
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = 'HS256'
+# Remembers tokens already verified until they expire
+token_verifier = TokenVerifier(JWT_SECRET, [JWT_ALGORITHM], name='task_service')
 
 def verify_token(token):
+    # Fast path: the gateway already verified this token and signed for it
+    payload = trusted_identity(request.headers, token)
+    if payload is not None:
+        return payload
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        payload = token_verifier.verify(token)
         return payload
     except Exception as e:
-        logger.error(f"Token verification failed: {str(e)}")
+        logger.error("Token verification failed: %s", e)
         return None
 
+def _within_deadline(cursor):
+    # Mongo stops the query itself once the caller has stopped waiting for it
+    left = time_left(current_deadline())
+    return cursor if left is None else cursor.max_time_ms(max(1, int(left * 1000)))
+
+def _deadline_exceeded():
+    DEADLINE_EXCEEDED.labels('mongodb').inc()
+    return jsonify({'error': 'Deadline exceeded'}), 504
+
+def _object_id(value):
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+def get_version(user_id, session=None):
+    doc = task_versions.find_one({'_id': user_id}, {'version': 1}, session=session)
+    return doc['version'] if doc else 0
+
+def bump_version(user_id, session=None):
+    doc = task_versions.find_one_and_update(
+        {'_id': user_id}, {'$inc': {'version': 1}},
+        upsert=True, return_document=ReturnDocument.AFTER, session=session)
+    return doc['version']
+
+_transactions = None
+
+def _supports_transactions():
+    # Only replica set members and mongos take transactions; a standalone
+    # mongod (the default MONGODB_URI) rejects them. Asked on the first write.
+    global _transactions
+    if _transactions is None:
+        hello = client.admin.command('hello')
+        _transactions = 'setName' in hello or hello.get('msg') == 'isdbgrid'
+        if not _transactions:
+            logger.warning("MongoDB is standalone: writes and their version bumps are not atomic")
+    return _transactions
+
+def _in_transaction(write):
+    # write(session) and its version bump commit together. Two writers for one
+    # user conflict on the version document; with_transaction retries the loser.
+    # Standalone, write(None) runs its steps one by one instead.
+    if not _supports_transactions():
+        return write(None)
+    with client.start_session() as mongo_session:
+        return mongo_session.with_transaction(write)
+
+def add_tombstones(user_id, task_ids, version, session=None):
+    task_tombstones.bulk_write([
+        UpdateOne({'user_id': user_id, 'task_id': task_id}, {'$set': {'version': version}}, upsert=True)
+        for task_id in task_ids
+    ], session=session)
+
+def compact_tombstones(user_id):
+    # Keep the newest MAX_TOMBSTONES; clients synced before the newest
+    # dropped one can no longer catch up and must resync
+    oldest_kept = list(task_tombstones.find({'user_id': user_id}, {'version': 1})
+                       .sort('version', -1).skip(MAX_TOMBSTONES).limit(1))
+    if oldest_kept:
+        floor = oldest_kept[0]['version']
+        task_tombstones.delete_many({'user_id': user_id, 'version': {'$lte': floor}})
+        task_versions.update_one({'_id': user_id}, {'$max': {'floor': floor}})
+
+def _etag(user_id, version):
+    # Strong validator for this user's listing at this version and query
+    digest = hashlib.sha1(f"{user_id}|{version}|{request.query_string.decode()}".encode()).hexdigest()
+    return f"{version}-{digest[:16]}"
+
+def _ndjson(cursor, mongo_session):
+    # One document per line, written as the cursor yields them; the session
+    # the cursor reads in ends with the stream
+    try:
+        for task in cursor:
+            yield json.dumps(task) + '\n'
+    finally:
+        mongo_session.end_session()
+
 @app.route('/tasks', methods=['GET'])
 def get_tasks():
     logger.info("GET /tasks request received")
@@ -53,13 +173,180 @@ def get_tasks():
         return jsonify({'error': 'Invalid token'}), 401
         
     try:
-        user_tasks = list(tasks.find({'user_id': payload['user_id']}))
-        for task in user_tasks:
-            task['_id'] = str(task['_id'])
-        logger.info(f"Retrieved {len(user_tasks)} tasks for user {payload['user_id']}")
-        return jsonify(user_tasks)
+        date_range = range_from_args(request.args)
+        limit, after = page_args(request.args)
+    except ValueError as e:
+        logger.warning("Invalid task listing requested: %s", e)
+        return jsonify({'error': str(e)}), 400
+
+    # The listing is read in the same causally consistent session as its
+    # version, so a secondary never serves a body older than its ETag
+    mongo_session = client.start_session(causal_consistency=True)
+    streaming = False
+    try:
+        version = get_version(payload['user_id'], session=mongo_session)
+        etag = _etag(payload['user_id'], version)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+
+        query = {'user_id': payload['user_id']}
+        if date_range is not None:
+            # Date views are ordered by (date, _id); that pair is the cursor key
+            lower, upper = date_range
+            date_filter = {}
+            if lower is not None:
+                date_filter['$gte'] = lower
+            if upper is not None:
+                date_filter['$lt'] = upper
+            if date_filter:
+                query['date'] = date_filter
+            if after is not None:
+                after_date = after[0]
+                query = {'$and': [query, {'$or': [
+                    {'date': {'$gt': after_date}},
+                    {'$and': [{'date': after_date}, id_after(after[1])]},
+                ]}]}
+            sort = [('date', 1), ('_id', 1)]
+            page_key = lambda task: [task.get('date'), str(task['_id'])]
+        else:
+            if after is not None:
+                query = {'$and': [query, id_after(after[0])]}
+            sort = [('_id', 1)] if (limit or after) else None
+            page_key = lambda task: [str(task['_id'])]
+
+        cursor = tasks.find(query, session=mongo_session)
+        if sort:
+            cursor = cursor.sort(sort)
+
+        if wants_ndjson(request):
+            if limit:
+                cursor = cursor.limit(limit)
+            logger.info("Streaming tasks for user %s", payload['user_id'])
+            response = Response(stream_with_context(_ndjson(cursor.batch_size(STREAM_BATCH_SIZE), mongo_session)),
+                                mimetype='application/x-ndjson')
+            response.set_etag(etag)
+            response.headers['X-Task-Version'] = str(version)
+            streaming = True
+            return response
+
+        if limit:
+            cursor = cursor.limit(limit + 1)
+        user_tasks = list(_within_deadline(cursor))
+        next_cursor = None
+        if limit and len(user_tasks) > limit:
+            user_tasks = user_tasks[:limit]
+            next_cursor = encode_cursor(page_key(user_tasks[-1]))
+        logger.info("Retrieved %s tasks for user %s", len(user_tasks), payload['user_id'])
+        response = jsonify(user_tasks)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        # Where a client starts following /tasks/changes from
+        response.headers['X-Task-Version'] = str(version)
+        return response
+    except ExecutionTimeout:
+        return _deadline_exceeded()
+    except Exception as e:
+        logger.error("Error retrieving tasks: %s", e)
+        return jsonify({'error': 'Internal server error'}), 500
+    finally:
+        if not streaming:
+            mongo_session.end_session()
+
+@app.route('/tasks/changes', methods=['GET'])
+def get_task_changes():
+    logger.info("GET /tasks/changes request received")
+    token = request.headers.get('Authorization')
+    if not token:
+        logger.warning("No token provided")
+        return jsonify({'error': 'No token provided'}), 401
+        
+    payload = verify_token(token)
+    if not payload:
+        logger.warning("Invalid token")
+        return jsonify({'error': 'Invalid token'}), 401
+
+    since = request.args.get('since', '')
+    if not since.isdigit():
+        return jsonify({'error': 'since must be a non-negative integer'}), 400
+    since = int(since)
+    try:
+        date_range = range_from_args(request.args) or (None, None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        user_id = payload['user_id']
+        changed = []
+        # Every write up to `version` is visible to the reads after it, even on a secondary
+        with client.start_session(causal_consistency=True) as mongo_session:
+            doc = task_versions.find_one({'_id': user_id}, {'version': 1, 'floor': 1}, session=mongo_session) or {}
+            version = doc.get('version', 0)
+            if since < doc.get('floor', 0) or since > version:
+                return jsonify({'error': 'Resync required', 'version': version}), 410
+
+            cursor = tasks.find({'user_id': user_id, 'version': {'$gt': since}}, session=mongo_session)
+            for task in _within_deadline(cursor):
+                # With a view, tasks moved out of its range read as deletes too
+                if in_bounds(task.get('date'), *date_range):
+                    changed.append((task['version'], {'op': 'upsert', 'id': task['_id'], 'task': task}))
+                else:
+                    changed.append((task['version'], {'op': 'delete', 'id': task['_id']}))
+            cursor = task_tombstones.find({'user_id': user_id, 'version': {'$gt': since}},
+                                          {'task_id': 1, 'version': 1, '_id': 0}, session=mongo_session)
+            for tombstone in _within_deadline(cursor):
+                changed.append((tombstone['version'], {'op': 'delete', 'id': tombstone['task_id']}))
+        changed.sort(key=lambda change: change[0])
+        return jsonify({'version': version, 'changes': [change for _, change in changed]})
+    except ExecutionTimeout:
+        return _deadline_exceeded()
+    except Exception as e:
+        logger.error("Error retrieving task changes: %s", e)
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/tasks/search', methods=['GET'])
+def search_tasks():
+    logger.info("GET /tasks/search request received")
+    token = request.headers.get('Authorization')
+    if not token:
+        logger.warning("No token provided")
+        return jsonify({'error': 'No token provided'}), 401
+        
+    payload = verify_token(token)
+    if not payload:
+        logger.warning("Invalid token")
+        return jsonify({'error': 'Invalid token'}), 401
+
+    query = request.args.get('q', '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if not query:
+        return jsonify([])
+
+    try:
+        cursor = tasks.find(
+            {'user_id': payload['user_id'], '$text': {'$search': query}},
+            {'score': {'$meta': 'textScore'}}
+        ).sort([('score', {'$meta': 'textScore'})]).limit(limit)
+        results = list(_within_deadline(cursor))
+        if not results:
+            # $text only matches whole words; fall back to a word-prefix match
+            # for the term the user is still typing
+            prefix = re.escape(query.split()[-1])
+            cursor = tasks.find(
+                {'user_id': payload['user_id'], 'text': {'$regex': rf'(^|\W){prefix}', '$options': 'i'}}
+            ).limit(limit)
+            results = list(_within_deadline(cursor))
+        return jsonify(results)
+    except ExecutionTimeout:
+        return _deadline_exceeded()
     except Exception as e:
-        logger.error(f"Error retrieving tasks: {str(e)}")
+        logger.error("Error searching tasks: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/tasks', methods=['POST'])
@@ -79,18 +366,261 @@ def create_task():
         task = request.json
         task['user_id'] = payload['user_id']
         task['created_at'] = datetime.utcnow()
-        
-        result = tasks.insert_one(task)
-        task['_id'] = str(result.inserted_id)
-        logger.info(f"Created new task for user {payload['user_id']}")
+        # Time-ordered and unique across processes, so _id order is creation order
+        task['_id'] = new_task_id()
+
+        def write(mongo_session):
+            task['version'] = bump_version(payload['user_id'], session=mongo_session)
+            tasks.insert_one(task, session=mongo_session)
+        _in_transaction(write)
+        logger.info("Created new task for user %s", payload['user_id'])
         return jsonify(task), 201
     except Exception as e:
-        logger.error(f"Error creating task: {str(e)}")
+        logger.error("Error creating task: %s", e)
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _existing_targets(ops, user_id):
+    # Every task the operations update or delete, looked up in one query
+    targets = [_object_id(str(op['id'])) for op in ops if op.get('op') in ('update', 'delete') and 'id' in op]
+    return {str(doc['_id']) for doc in tasks.find({'_id': {'$in': targets}, 'user_id': user_id}, {'_id': 1})}
+
+def _plan_task_op(op, user_id, existing, now):
+    """``(write, result)`` for one batch/bulk operation; ``write`` is None if it is invalid.
+
+    ``existing`` holds the ids of the user's tasks the operations may touch;
+    a delete removes its id, so a second delete of the same task is a 404.
+    """
+    kind, task, task_id = op.get('op'), op.get('task'), str(op.get('id', ''))
+    if kind not in ('create', 'update', 'delete'):
+        return None, {'status': 400, 'error': 'op must be create, update or delete'}
+    if kind != 'delete' and not isinstance(task, dict):
+        return None, {'status': 400, 'error': 'task is required'}
+    if kind != 'create' and task_id not in existing:
+        return None, {'status': 404, 'error': 'Task not found'}
+    if kind == 'create':
+        task = {**task, '_id': new_task_id(), 'user_id': user_id, 'created_at': now}
+        return (kind, None, task), {'status': 201, 'task': task}
+    if kind == 'update':
+        task = {key: value for key, value in task.items() if key != '_id'}
+        task.update({'user_id': user_id, 'updated_at': now})
+        return (kind, _object_id(task_id), task), {'status': 200, 'task': {**task, '_id': task_id}}
+    existing.discard(task_id)
+    return (kind, _object_id(task_id), None), {'status': 200, 'id': task_id}
+
+def _task_write(write, user_id, version):
+    # Every written task carries its batch's version for /tasks/changes
+    kind, task_id, task = write
+    if kind == 'create':
+        return InsertOne({**task, 'version': version})
+    if kind == 'update':
+        return UpdateOne({'_id': task_id, 'user_id': user_id}, {'$set': {**task, 'version': version}})
+    return DeleteOne({'_id': task_id, 'user_id': user_id})
+
+@app.route('/tasks/batch', methods=['POST'])
+def batch_tasks():
+    """Apply ``[{op: create|update|delete, id?, task?}]`` all-or-nothing.
+
+    The operations go to Mongo as one ordered ``bulk_write`` inside a
+    transaction, together with a single version bump. Each operation gets a
+    result in the same position; if any is invalid nothing is applied.
+    """
+    logger.info("POST /tasks/batch request received")
+    token = request.headers.get('Authorization')
+    if not token:
+        logger.warning("No token provided")
+        return jsonify({'error': 'No token provided'}), 401
+        
+    payload = verify_token(token)
+    if not payload:
+        logger.warning("Invalid token")
+        return jsonify({'error': 'Invalid token'}), 401
+
+    ops = request.get_json(silent=True)
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'Expected a non-empty array of operations'}), 400
+    if len(ops) > MAX_BATCH_OPS:
+        return jsonify({'error': f'At most {MAX_BATCH_OPS} operations per batch'}), 400
+    ops = [op if isinstance(op, dict) else {} for op in ops]
+
+    try:
+        user_id = payload['user_id']
+        existing = _existing_targets(ops, user_id)
+
+        planned = []
+        results = []
+        now = datetime.utcnow()
+        for op in ops:
+            write, result = _plan_task_op(op, user_id, existing, now)
+            if write is not None:
+                planned.append(write)
+            results.append(result)
+
+        if any(result['status'] >= 400 for result in results):
+            results = [result if result['status'] >= 400 else {'status': 424, 'error': 'Not applied'}
+                       for result in results]
+            return jsonify({'error': 'Batch rejected; nothing was applied', 'results': results}), 400
+
+        deleted = [str(task_id) for kind, task_id, _ in planned if kind == 'delete']
+
+        def write(mongo_session):
+            version = bump_version(user_id, session=mongo_session)
+            tasks.bulk_write([_task_write(op, user_id, version) for op in planned], ordered=True,
+                             session=mongo_session)
+            if deleted:
+                add_tombstones(user_id, deleted, version, session=mongo_session)
+            return version
+        version = _in_transaction(write)
+        if deleted:
+            compact_tombstones(user_id)
+
+        for result in results:
+            if 'task' in result:
+                result['task']['version'] = version
+        logger.info("Applied batch of %s operations for user %s", len(ops), user_id)
+        return jsonify({'version': version, 'results': results})
+    except Exception as e:
+        logger.error("Error applying task batch: %s", e)
+        return jsonify({'error': 'Internal server error'}), 500
+
+def _apply_bulk(user_id, ops, ordered, results, offset):
+    """Write one ``bulk_write`` batch of POST /tasks/bulk.
+
+    Fills ``results[offset:offset + len(ops)]`` for the operations it got to
+    and returns ``(version, failed)``. Ordered, planning stops at the first
+    invalid operation and Mongo stops at the first failed write; whatever
+    comes after is left unset (not applied).
+
+    The batch and its version bump commit in one transaction. A write error
+    aborts the transaction, so the batch is tried again without the failed
+    write (ordered: without it and everything after it). An error that names
+    no write (a write concern error) fails whatever was left of the batch.
+    On a standalone mongod there is no transaction to retry: the writes
+    without an error are already applied.
+    """
+    existing = _existing_targets(ops, user_id)
+    now = datetime.utcnow()
+    planned = []
+    failed = False
+    for position, op in enumerate(ops, offset):
+        write, result = _plan_task_op(op, user_id, existing, now)
+        if write is None:
+            results[position] = result
+            failed = True
+            if ordered:
+                break
+            continue
+        task_id = str(write[2]['_id']) if write[0] == 'create' else str(write[1])
+        planned.append((position, write, {'status': result['status'], 'id': task_id}))
+
+    errors = {}
+    pending = list(range(len(planned)))
+    version = None
+    while pending:
+        def write(mongo_session):
+            version = bump_version(user_id, session=mongo_session)
+            tasks.bulk_write([_task_write(planned[index][1], user_id, version) for index in pending],
+                             ordered=ordered, session=mongo_session)
+            deleted = [planned[index][2]['id'] for index in pending if planned[index][1][0] == 'delete']
+            if deleted:
+                add_tombstones(user_id, deleted, version, session=mongo_session)
+            return version
+        try:
+            version = _in_transaction(write)
+            break
+        except BulkWriteError as e:
+            failed = True
+            new_errors = {pending[error['index']]: error for error in e.details.get('writeErrors', [])}
+            if not _supports_transactions():
+                # Nothing was rolled back: every write without an error landed
+                errors.update(new_errors)
+                break
+            if not new_errors:
+                # No write to leave out (a write concern error): the aborted
+                # batch would fail the same way again, so all of it failed
+                concern = (e.details.get('writeConcernErrors') or [{}])[0]
+                errors.update((index, concern) for index in pending)
+                break
+            errors.update(new_errors)
+            first_error = min(errors)
+            pending = [index for index in pending
+                       if index not in errors and not (ordered and index > first_error)]
+
+    first_error = min(errors) if errors else None
+    for index, (position, write, result) in enumerate(planned):
+        if index in errors:
+            error = errors[index]
+            results[position] = {'status': 409 if error.get('code') == 11000 else 500, 'id': result['id'],
+                                 'error': error.get('errmsg', 'Write failed')}
+        elif ordered and first_error is not None and index > first_error:
+            continue
+        else:
+            results[position] = result
+    return version, failed
+
+@app.route('/tasks/bulk', methods=['POST'])
+def bulk_tasks():
+    """Apply ``{ops: [{op: create|update|delete, id?, task?}], ordered?, batch_size?}`` in bulk.
+
+    Unlike /tasks/batch this is not all-or-nothing, and takes up to
+    MAX_BULK_OPS operations. They are written ``batch_size`` at a time
+    (BULK_BATCH_SIZE by default), each batch one ``bulk_write`` committed
+    with its version bump in one transaction: a few majority round trips
+    per batch instead of two per task. Every operation gets a result in the same position. With
+    ``ordered`` (the default) the first failure stops everything after it,
+    and those come back as 424; unordered, every valid operation is tried.
+    The response is 200 if everything was applied, 207 otherwise.
+    """
+    logger.info("POST /tasks/bulk request received")
+    token = request.headers.get('Authorization')
+    if not token:
+        logger.warning("No token provided")
+        return jsonify({'error': 'No token provided'}), 401
+        
+    payload = verify_token(token)
+    if not payload:
+        logger.warning("Invalid token")
+        return jsonify({'error': 'Invalid token'}), 401
+
+    body = request.get_json(silent=True)
+    ops = body.get('ops') if isinstance(body, dict) else None
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'Expected {"ops": [...]} with at least one operation'}), 400
+    if len(ops) > MAX_BULK_OPS:
+        return jsonify({'error': f'At most {MAX_BULK_OPS} operations per request'}), 400
+    ordered = body.get('ordered', True)
+    batch_size = body.get('batch_size', BULK_BATCH_SIZE)
+    if not isinstance(ordered, bool):
+        return jsonify({'error': 'ordered must be true or false'}), 400
+    if not isinstance(batch_size, int) or isinstance(batch_size, bool) or batch_size < 1:
+        return jsonify({'error': 'batch_size must be a positive integer'}), 400
+    ops = [op if isinstance(op, dict) else {} for op in ops]
+
+    try:
+        user_id = payload['user_id']
+        results = [None] * len(ops)
+        version = None
+        any_deleted = False
+        for start in range(0, len(ops), batch_size):
+            batch_version, failed = _apply_bulk(user_id, ops[start:start + batch_size], ordered, results, start)
+            version = batch_version or version
+            any_deleted = any_deleted or any(op.get('op') == 'delete' for op in ops[start:start + batch_size])
+            if failed and ordered:
+                break
+        if any_deleted:
+            compact_tombstones(user_id)
+
+        results = [result or {'status': 424, 'error': 'Not applied'} for result in results]
+        failures = sum(result['status'] >= 400 for result in results)
+        logger.info("Applied %s of %s bulk operations for user %s", len(ops) - failures, len(ops), user_id)
+        return jsonify({'version': version, 'applied': len(ops) - failures, 'failed': failures,
+                        'results': results}), 207 if failures else 200
+    except Exception as e:
+        logger.error("Error applying bulk task operations: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/tasks/<task_id>', methods=['PUT'])
 def update_task(task_id):
-    logger.info(f"PUT /tasks/{task_id} request received")
+    logger.info("PUT /tasks/%s request received", task_id)
     token = request.headers.get('Authorization')
     if not token:
         logger.warning("No token provided")
@@ -105,25 +635,31 @@ def update_task(task_id):
         task = request.json
         task['user_id'] = payload['user_id']
         task['updated_at'] = datetime.utcnow()
-        
-        result = tasks.update_one(
-            {'_id': task_id, 'user_id': payload['user_id']},
-            {'$set': task}
-        )
-        
-        if result.modified_count == 0:
-            logger.warning(f"Task {task_id} not found for user {payload['user_id']}")
+
+        def write(mongo_session):
+            result = tasks.update_one({'_id': task_id, 'user_id': payload['user_id']}, {'$set': task},
+                                      session=mongo_session)
+            # Nothing changed, so neither may the version: that would
+            # invalidate every cached listing of this user's tasks
+            if result.matched_count == 1:
+                version = bump_version(payload['user_id'], session=mongo_session)
+                tasks.update_one({'_id': task_id}, {'$set': {'version': version}}, session=mongo_session)
+            return result
+        result = _in_transaction(write)
+
+        if result.matched_count != 1:
+            logger.warning("Task %s not found for user %s", task_id, payload['user_id'])
             return jsonify({'error': 'Task not found'}), 404
             
-        logger.info(f"Updated task {task_id} for user {payload['user_id']}")
+        logger.info("Updated task %s for user %s", task_id, payload['user_id'])
         return jsonify({'message': 'Task updated successfully'})
     except Exception as e:
-        logger.error(f"Error updating task: {str(e)}")
+        logger.error("Error updating task: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/tasks/<task_id>', methods=['DELETE'])
 def delete_task(task_id):
-    logger.info(f"DELETE /tasks/{task_id} request received")
+    logger.info("DELETE /tasks/%s request received", task_id)
     token = request.headers.get('Authorization')
     if not token:
         logger.warning("No token provided")
@@ -135,15 +671,22 @@ def delete_task(task_id):
         return jsonify({'error': 'Invalid token'}), 401
         
     try:
-        result = tasks.delete_one({'_id': task_id, 'user_id': payload['user_id']})
+        def write(mongo_session):
+            result = tasks.delete_one({'_id': task_id, 'user_id': payload['user_id']}, session=mongo_session)
+            if result.deleted_count:
+                version = bump_version(payload['user_id'], session=mongo_session)
+                add_tombstones(payload['user_id'], [task_id], version, session=mongo_session)
+            return result
+        result = _in_transaction(write)
         if result.deleted_count == 0:
-            logger.warning(f"Task {task_id} not found for user {payload['user_id']}")
+            logger.warning("Task %s not found for user %s", task_id, payload['user_id'])
             return jsonify({'error': 'Task not found'}), 404
+        compact_tombstones(payload['user_id'])
             
-        logger.info(f"Deleted task {task_id} for user {payload['user_id']}")
+        logger.info("Deleted task %s for user %s", task_id, payload['user_id'])
         return jsonify({'message': 'Task deleted successfully'})
     except Exception as e:
-        logger.error(f"Error deleting task: {str(e)}")
+        logger.error("Error deleting task: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 if __name__ == '__main__':
@@ -4,17 +4,29 @@ from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 from pymongo import MongoClient, ReadPreference, WriteConcern
-from werkzeug.security import generate_password_hash, check_password_hash
+from pymongo.errors import ExecutionTimeout
 import jwt
 import sys
 import logging
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 from logging_config import setup_logging
+from metrics import instrument_app, mongo_command_listener
+from resilience import DEADLINE_EXCEEDED, current_deadline, install_deadline, time_left
+from token_cache import TokenVerifier
+from internal_auth import trusted_identity
+from json_provider import install_json
+from mongo_schema import ensure_indexes
+from password_hashing import HashPoolFull, PasswordHasher
 
 load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
+instrument_app(app)
+# ObjectIds in responses are encoded as they are, without a pass to str() them
+install_json(app)
+# Requests that arrive past the caller's X-Deadline-Ms get a 504 unprocessed
+install_deadline(app)
 
 # Setup logging
 logger = setup_logging('user_service')
@@ -23,15 +35,27 @@ logger = setup_logging('user_service')
 client = MongoClient(
     os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'),
     readPreference=ReadPreference.SECONDARY_PREFERRED,
-    writeConcern=WriteConcern(w='majority')
+    writeConcern=WriteConcern(w='majority'),
+    event_listeners=[mongo_command_listener()]
 )
 db = client['todo_app']
 users = db['users']
+# Unique email index behind login and registration lookups
+ensure_indexes(db, ('users',), logger)
 
 # JWT configuration
 JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = 'HS256'
 JWT_EXP_DELTA_SECONDS = 3600
+# Remembers tokens already verified until they expire
+token_verifier = TokenVerifier(JWT_SECRET, [JWT_ALGORITHM], name='user_service')
+# Hashes passwords in worker processes; a burst of logins gets 503s instead of every thread
+password_hasher = PasswordHasher()
+
+def _hashing_busy(e):
+    logger.warning("Password hashing at capacity; retry in %ss", e.retry_after)
+    return (jsonify({'error': 'Too many sign-ins right now, try again shortly'}), 503,
+            {'Retry-After': str(e.retry_after)})
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -39,22 +63,24 @@ def register():
     try:
         data = request.get_json()
         
-        if users.find_one({'email': data['email']}):
-            logger.warning(f"Email {data['email']} already exists")
+        if users.find_one({'email': data['email']}, {'_id': 1}):
+            logger.warning("Email %s already exists", data['email'])
             return jsonify({'error': 'Email already exists'}), 400
             
         user = {
             'email': data['email'],
-            'password': generate_password_hash(data['password']),
+            'password': password_hasher.generate(data['password'], timeout=time_left(current_deadline())),
             'name': data['name'],
             'created_at': datetime.utcnow()
         }
         
         users.insert_one(user)
-        logger.info(f"User {data['email']} registered successfully")
+        logger.info("User %s registered successfully", data['email'])
         return jsonify({'message': 'User registered successfully'}), 201
+    except HashPoolFull as e:
+        return _hashing_busy(e)
     except Exception as e:
-        logger.error(f"Error registering user: {str(e)}")
+        logger.error("Error registering user: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/login', methods=['POST'])
@@ -62,10 +88,11 @@ def login():
     logger.info("POST /login request received")
     try:
         data = request.get_json()
-        user = users.find_one({'email': data['email']})
+        user = users.find_one({'email': data['email']}, {'email': 1, 'password': 1})
         
-        if not user or not check_password_hash(user['password'], data['password']):
-            logger.warning(f"Invalid login attempt for {data['email']}")
+        if not user or not password_hasher.check(user['password'], data['password'],
+                                                 timeout=time_left(current_deadline())):
+            logger.warning("Invalid login attempt for %s", data['email'])
             return jsonify({'error': 'Invalid credentials'}), 401
             
         payload = {
@@ -75,10 +102,12 @@ def login():
         }
         
         token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
-        logger.info(f"User {data['email']} logged in successfully")
+        logger.info("User %s logged in successfully", data['email'])
         return jsonify({'token': token})
+    except HashPoolFull as e:
+        return _hashing_busy(e)
     except Exception as e:
-        logger.error(f"Error during login: {str(e)}")
+        logger.error("Error during login: %s", e)
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/users', methods=['GET'])
@@ -90,14 +119,21 @@ def get_users():
         return jsonify({'error': 'No token provided'}), 401
         
     try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        user_list = list(users.find({}, {'password': 0}))
-        for user in user_list:
-            user['_id'] = str(user['_id'])
-        logger.info(f"Retrieved {len(user_list)} users")
+        # Fast path: the gateway already verified this token and signed for it
+        payload = trusted_identity(request.headers, token) or token_verifier.verify(token)
+        cursor = users.find({}, {'password': 0})
+        # Mongo stops the query itself once the caller has stopped waiting for it
+        left = time_left(current_deadline())
+        if left is not None:
+            cursor = cursor.max_time_ms(max(1, int(left * 1000)))
+        user_list = list(cursor)
+        logger.info("Retrieved %s users", len(user_list))
         return jsonify(user_list)
+    except ExecutionTimeout:
+        DEADLINE_EXCEEDED.labels('mongodb').inc()
+        return jsonify({'error': 'Deadline exceeded'}), 504
     except Exception as e:
-        logger.error(f"Error retrieving users: {str(e)}")
+        logger.error("Error retrieving users: %s", e)
         return jsonify({'error': 'Invalid token'}), 401
 
 if __name__ == '__main__':
@@ -2,19 +2,90 @@
 const API = {
   tasks: "/api/tasks",
   task: (id) => `/api/tasks/${id}`,
+  changes: "/api/tasks/changes",
+  search: (q) => `/api/tasks/search?q=${encodeURIComponent(q)}`,
 };
 
 let currentSection = "myDay";
 
-// Function to fetch tasks from the server
-async function fetchTasks() {
+// Function to fetch tasks from the server.
+// With a view ("myDay", "thisWeek", "thisMonth", "other") the server filters
+// by date and returns the tasks already sorted by date.
+// url -> { etag, version, tasks } from the last full load. Kept current by
+// pulling only the changes since `version`, or revalidated with If-None-Match.
+const taskListCache = new Map();
+
+function compareTasks(a, b) {
+  const left = [a.date || "", String(a.id)];
+  const right = [b.date || "", String(b.id)];
+  return left < right ? -1 : left > right ? 1 : 0;
+}
+
+// Apply the changes since the cached list's version in place. Returns false
+// when the server can't say what changed and the list must be reloaded.
+async function syncTasks(cached, params) {
+  const changesParams = new URLSearchParams(params);
+  changesParams.set("since", cached.version);
+  const response = await fetch(`${API.changes}?${changesParams}`, {
+    cache: "no-store",
+  });
+  if (!response.ok) {
+    return false;
+  }
+  const { version, changes } = await response.json();
+  if (changes.length > 0) {
+    const byId = new Map(cached.tasks.map((task) => [task.id, task]));
+    changes.forEach((change) => {
+      if (change.op === "delete") {
+        byId.delete(change.id);
+      } else {
+        byId.set(change.id, change.task);
+      }
+    });
+    cached.tasks = [...byId.values()].sort(compareTasks);
+    cached.etag = null;
+  }
+  cached.version = version;
+  return true;
+}
+
+async function fetchTasks(view = "other") {
   try {
-    const response = await fetch(API.tasks);
-    if (!response.ok) {
-      const data = await response.json();
-      throw new Error(data.error || `HTTP error! status: ${response.status}`);
+    const params = new URLSearchParams({
+      view: view,
+      today: formatDate(new Date()),
+    });
+    const url = `${API.tasks}?${params}`;
+    const cached = taskListCache.get(url);
+    let tasks;
+    if (
+      cached &&
+      cached.version !== null &&
+      Array.isArray(cached.tasks) &&
+      (await syncTasks(cached, params))
+    ) {
+      tasks = cached.tasks;
+    } else {
+      const response = await fetch(url, {
+        // We handle 304s ourselves, so keep the browser cache out of the way
+        cache: "no-store",
+        headers: cached && cached.etag ? { "If-None-Match": cached.etag } : {},
+      });
+      if (response.status === 304 && cached) {
+        tasks = cached.tasks;
+      } else {
+        if (!response.ok) {
+          const data = await response.json();
+          throw new Error(data.error || `HTTP error! status: ${response.status}`);
+        }
+        tasks = await response.json();
+        taskListCache.set(url, {
+          etag: response.headers.get("ETag"),
+          version: response.headers.get("X-Task-Version"),
+          tasks,
+        });
+      }
     }
-    const tasks = await response.json();
     console.log("Raw tasks from server:", tasks); // Debug log
 
     // If tasks is empty or not an object, return empty array
@@ -23,8 +94,13 @@ async function fetchTasks() {
       return [];
     }
 
-    // Convert tasks object to array and ensure all required fields
-    const taskArray = Object.entries(tasks)
+    // Older servers return an {id: task} object instead of a sorted list
+    const entries = Array.isArray(tasks)
+      ? tasks.map((task) => [task && task.id, task])
+      : Object.entries(tasks);
+
+    // Ensure all required fields
+    const taskArray = entries
       .map(([id, task]) => {
         if (!task || typeof task !== "object") {
           console.warn("Invalid task data:", task);
@@ -45,6 +121,16 @@ async function fetchTasks() {
   }
 }
 
+// Function to search tasks on the server (ranked, best match first)
+async function searchTasks(query) {
+  const response = await fetch(API.search(query));
+  if (!response.ok) {
+    const data = await response.json();
+    throw new Error(data.error || `HTTP error! status: ${response.status}`);
+  }
+  return await response.json();
+}
+
 // Function to add a new task
 async function addTask(task) {
   try {
@@ -211,53 +297,17 @@ function groupTasksByDate(tasks) {
 async function displayTasks(section) {
   try {
     currentSection = section;
-    const tasks = await fetchTasks();
-    console.log("Tasks to display:", tasks);
-    const todayDate = formatDate(new Date());
-
-    // Filter tasks based on the selected section
-    let filteredTasks = tasks.filter((task) => {
-      const taskDate = new Date(task.date);
-      const taskDateStr = formatDate(taskDate);
-
-      switch (section) {
-        case "myDay":
-          document.getElementById("header_title").textContent = "My Day";
-          return taskDateStr === todayDate;
-
-        case "thisWeek":
-          document.getElementById("header_title").textContent = "This Week";
-          const today = new Date();
-          const startOfWeek = getStartOfWeek(today);
-          startOfWeek.setHours(0, 0, 0, 0);
-          const endOfWeek = getEndOfWeek(today);
-          endOfWeek.setHours(23, 59, 59, 999);
-          return taskDate >= startOfWeek && taskDate <= endOfWeek;
-
-        case "thisMonth":
-          document.getElementById("header_title").textContent = "This Month";
-          const currentMonth = new Date().getMonth();
-          const currentYear = new Date().getFullYear();
-          const startOfMonth = new Date(currentYear, currentMonth, 1);
-          const endOfMonth = new Date(
-            currentYear,
-            currentMonth + 1,
-            0,
-            23,
-            59,
-            59,
-            999
-          );
-          return taskDate >= startOfMonth && taskDate <= endOfMonth;
-
-        case "other":
-          document.getElementById("header_title").textContent = "All Tasks";
-          return true;
-
-        default:
-          return false;
-      }
-    });
+    const titles = {
+      myDay: "My Day",
+      thisWeek: "This Week",
+      thisMonth: "This Month",
+      other: "All Tasks",
+    };
+    document.getElementById("header_title").textContent = titles[section];
+
+    // The server filters by the section's date range and sorts by date
+    const filteredTasks = await fetchTasks(section);
+    console.log("Tasks to display:", filteredTasks);
 
     const taskContainer = document.getElementById("TaskContainer");
     if (!taskContainer) {
@@ -270,9 +320,6 @@ async function displayTasks(section) {
       return;
     }
 
-    // Sort tasks by date
-    filteredTasks.sort((a, b) => new Date(a.date) - new Date(b.date));
-
     // Group tasks by date
     const groupedTasks = groupTasksByDate(filteredTasks);
 
@@ -586,191 +633,197 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   }
 
-  // Search functionality
+  // Search functionality (debounced, matched and ranked on the server)
+  let searchTimer = null;
+  let searchSeq = 0;
   if (searchInput) {
-    searchInput.addEventListener("input", async (event) => {
-      const searchText = event.target.value.trim().toLowerCase();
-      if (searchText === "") {
-        await displayTasks(currentSection);
+    searchInput.addEventListener("input", (event) => {
+      clearTimeout(searchTimer);
+      searchTimer = setTimeout(() => runSearch(event.target.value), 200);
+    });
+  }
+
+  async function runSearch(value) {
+    const searchText = value.trim();
+    const seq = ++searchSeq;
+    if (searchText === "") {
+      await displayTasks(currentSection);
+      return;
+    }
+
+    try {
+      console.log("Searching tasks...");
+      const filteredTasks = await searchTasks(searchText);
+      // Ignore responses to keystrokes that have since been superseded
+      if (seq !== searchSeq) {
         return;
       }
+      console.log("Tasks found:", filteredTasks.length);
 
-      try {
-        console.log("Fetching tasks for search...");
-        const tasks = await fetchTasks();
-        console.log("Tasks fetched.");
-
-        console.log("Filtering tasks...");
-        const filteredTasks = tasks.filter((task) =>
-          task.text.toLowerCase().includes(searchText)
-        );
-        console.log("Tasks filtered.");
-
-        const taskContainer = document.getElementById("TaskContainer");
-        if (!taskContainer) {
-          console.error("TaskContainer element not found!");
-          // Don't return here, still try to update if filteredTasks > 0
-        }
+      const taskContainer = document.getElementById("TaskContainer");
+      if (!taskContainer) {
+        console.error("TaskContainer element not found!");
+        // Don't return here, still try to update if filteredTasks > 0
+      }
 
-        if (filteredTasks.length === 0) {
-          if (taskContainer) {
-            taskContainer.innerHTML =
-              '<div class="no-tasks">No matching tasks found</div>';
-          }
-          return;
+      if (filteredTasks.length === 0) {
+        if (taskContainer) {
+          taskContainer.innerHTML =
+            '<div class="no-tasks">No matching tasks found</div>';
         }
+        return;
+      }
 
-        console.log("Grouping tasks...");
-        // Group and display filtered tasks
-        const groupedTasks = groupTasksByDate(filteredTasks);
-        console.log("Tasks grouped.");
-
-        let html = "";
-        Object.keys(groupedTasks)
-          .sort()
-          .forEach((date) => {
-            const tasksForDate = groupedTasks[date];
-            const readableDate = formatReadableDate(date);
-
-            html += `
-            <div class="date-group">
-              <h3 class="date-header">${readableDate}</h3>
-              ${tasksForDate
-                .map(
-                  (task) => `
-                <div class="card align" data-task-id="${task.id}" data-date="${
-                    task.date
-                  }">
-                  <input type="checkbox" name="task" id="${task.id}" ${
-                    task.completed ? "checked" : ""
-                  }>
-                  <div ${
-                    task.completed ? 'class="marker done"' : 'class="marker"'
-                  } >
-                    <span>${task.text}</span>
-                  </div>
-                  <i class="bx bx-trash-alt delete-task"></i>
-                </div>
-              `
-                )
-                .join("")}
-            </div>
-          `;
-          });
+      console.log("Grouping tasks...");
+      // Group and display filtered tasks
+      const groupedTasks = groupTasksByDate(filteredTasks);
+      console.log("Tasks grouped.");
 
-        console.log("Setting innerHTML...");
-        if (taskContainer) {
-          taskContainer.innerHTML = html;
-        }
-        console.log("innerHTML set.");
+      let html = "";
+      Object.keys(groupedTasks)
+        .sort()
+        .forEach((date) => {
+          const tasksForDate = groupedTasks[date];
+          const readableDate = formatReadableDate(date);
 
-        console.log("Removing time from search results...");
-        // Remove time from search results
-        if (taskContainer) {
-          const taskCards = taskContainer.querySelectorAll(".card");
-          taskCards.forEach((card) => {
-            const taskTime = card.querySelector(".task-time");
-            if (taskTime) {
-              taskTime.remove();
+          html += `
+          <div class="date-group">
+            <h3 class="date-header">${readableDate}</h3>
+            ${tasksForDate
+              .map(
+                (task) => `
+              <div class="card align" data-task-id="${task.id}" data-date="${
+                  task.date
+                }">
+                <input type="checkbox" name="task" id="${task.id}" ${
+                  task.completed ? "checked" : ""
+                }>
+                <div ${
+                  task.completed ? 'class="marker done"' : 'class="marker"'
+                } >
+                  <span>${task.text}</span>
+                </div>
+                <i class="bx bx-trash-alt delete-task"></i>
+              </div>
+            `
+              )
+              .join("")}
+          </div>
+        `;
+        });
+
+      console.log("Setting innerHTML...");
+      if (taskContainer) {
+        taskContainer.innerHTML = html;
+      }
+      console.log("innerHTML set.");
+
+      console.log("Removing time from search results...");
+      // Remove time from search results
+      if (taskContainer) {
+        const taskCards = taskContainer.querySelectorAll(".card");
+        taskCards.forEach((card) => {
+          const taskTime = card.querySelector(".task-time");
+          if (taskTime) {
+            taskTime.remove();
+          }
+        });
+      }
+      console.log("Time removed.");
+
+      console.log("Re-adding event listeners...");
+      // Re-add event listeners for filtered tasks (checkbox and delete)
+      // Need to re-get the container after setting innerHTML
+      const updatedTaskContainer = document.getElementById("TaskContainer");
+      if (updatedTaskContainer) {
+        updatedTaskContainer.addEventListener("click", async (event) => {
+          // Handle checkbox change
+          if (
+            event.target.type === "checkbox" &&
+            event.target.name === "task"
+          ) {
+            const taskId = event.target.id;
+            const taskCard = event.target.closest(".card");
+            const taskText =
+              taskCard.querySelector(".marker span").textContent;
+            let taskDate = taskCard.getAttribute("data-date");
+            if (!taskDate) {
+              const tasks = await fetchTasks();
+              const found = tasks.find((t) => t.id === taskId);
+              taskDate = found ? found.date : "";
             }
-          });
-        }
-        console.log("Time removed.");
-
-        console.log("Re-adding event listeners...");
-        // Re-add event listeners for filtered tasks (checkbox and delete)
-        // Need to re-get the container after setting innerHTML
-        const updatedTaskContainer = document.getElementById("TaskContainer");
-        if (updatedTaskContainer) {
-          updatedTaskContainer.addEventListener("click", async (event) => {
-            // Handle checkbox change
-            if (
-              event.target.type === "checkbox" &&
-              event.target.name === "task"
-            ) {
-              const taskId = event.target.id;
-              const taskCard = event.target.closest(".card");
-              const taskText =
-                taskCard.querySelector(".marker span").textContent;
-              let taskDate = taskCard.getAttribute("data-date");
-              if (!taskDate) {
-                const tasks = await fetchTasks();
-                const found = tasks.find((t) => t.id === taskId);
-                taskDate = found ? found.date : "";
-              }
-              const task = {
-                id: taskId,
-                text: taskText,
-                completed: event.target.checked,
-                date: taskDate,
-                user_id: sessionStorage.getItem("user_id"),
-              };
-              try {
-                await updateTask(taskId, task);
-                const marker = event.target.nextElementSibling;
-                if (marker.classList.contains("marker")) {
-                  marker.classList.toggle("done", task.completed);
-                }
-              } catch (error) {
-                console.error("Error updating task:", error);
-                swal({
-                  title: "Success!",
-                  text: "Updated",
-                  icon: "success",
-                  timer: 1500,
-                  buttons: false,
-                });
+            const task = {
+              id: taskId,
+              text: taskText,
+              completed: event.target.checked,
+              date: taskDate,
+              user_id: sessionStorage.getItem("user_id"),
+            };
+            try {
+              await updateTask(taskId, task);
+              const marker = event.target.nextElementSibling;
+              if (marker.classList.contains("marker")) {
+                marker.classList.toggle("done", task.completed);
               }
+            } catch (error) {
+              console.error("Error updating task:", error);
+              swal({
+                title: "Success!",
+                text: "Updated",
+                icon: "success",
+                timer: 1500,
+                buttons: false,
+              });
             }
+          }
+
+          // Handle delete button click
+          if (event.target.classList.contains("delete-task")) {
+            const taskCard = event.target.closest(".card");
+            const taskId = taskCard.dataset.taskId;
+            console.log("Delete button clicked for task:", taskId); // Debug log
 
-            // Handle delete button click
-            if (event.target.classList.contains("delete-task")) {
-              const taskCard = event.target.closest(".card");
-              const taskId = taskCard.dataset.taskId;
-              console.log("Delete button clicked for task:", taskId); // Debug log
-
-              try {
-                await deleteTask(taskId);
-                taskCard.remove();
-
-                // If no tasks left in the container, show "No tasks found"
-                if (updatedTaskContainer.children.length === 0) {
-                  updatedTaskContainer.innerHTML =
-                    '<div class="no-tasks">No tasks found</div>';
-                }
-
-                swal({
-                  title: "Success!",
-                  text: "Task deleted successfully",
-                  icon: "success",
-                  timer: 1500,
-                  buttons: false,
-                });
-              } catch (error) {
-                console.error("Error deleting task:", error);
-                swal({
-                  title: "Error!",
-                  text: "Failed to delete task. Please try again.",
-                  icon: "error",
-                  timer: 2000,
-                  buttons: false,
-                });
+            try {
+              await deleteTask(taskId);
+              taskCard.remove();
+
+              // If no tasks left in the container, show "No tasks found"
+              if (updatedTaskContainer.children.length === 0) {
+                updatedTaskContainer.innerHTML =
+                  '<div class="no-tasks">No tasks found</div>';
               }
+
+              swal({
+                title: "Success!",
+                text: "Task deleted successfully",
+                icon: "success",
+                timer: 1500,
+                buttons: false,
+              });
+            } catch (error) {
+              console.error("Error deleting task:", error);
+              swal({
+                title: "Error!",
+                text: "Failed to delete task. Please try again.",
+                icon: "error",
+                timer: 2000,
+                buttons: false,
+              });
             }
-          });
-        }
-        console.log("Event listeners re-added.");
-      } catch (error) {
-        console.error("Error searching tasks:", error);
-        swal({
-          title: "Error!",
-          text: "Failed to search tasks. Please try again.",
-          icon: "error",
-          timer: 2000,
-          buttons: false,
+          }
         });
       }
-    });
+      console.log("Event listeners re-added.");
+    } catch (error) {
+      console.error("Error searching tasks:", error);
+      swal({
+        title: "Error!",
+        text: "Failed to search tasks. Please try again.",
+        icon: "error",
+        timer: 2000,
+        buttons: false,
+      });
+    }
   }
 
   // Mobile menu toggle
@@ -1,4 +1,6 @@
-const CACHE_NAME = "todo-app-v1";
+const CACHE_NAME = "todo-app-v2";
+// Last 200 of each API GET, kept only to answer 304s from the server
+const API_CACHE_NAME = "todo-api-v1";
 const urlsToCache = [
   "/",
   "/static/css/style.css",
@@ -15,7 +17,51 @@ self.addEventListener("install", (event) => {
   );
 });
 
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys().then((names) =>
+      Promise.all(
+        names
+          .filter((name) => name !== CACHE_NAME && name !== API_CACHE_NAME)
+          .map((name) => caches.delete(name))
+      )
+    )
+  );
+});
+
+// API data must never be served stale: always ask the server, sending the
+// cached ETag so an unchanged task list comes back as an empty 304.
+async function revalidate(request) {
+  const cache = await caches.open(API_CACHE_NAME);
+  const cached = await cache.match(request);
+  const etag = cached && cached.headers.get("ETag");
+  const headers = new Headers(request.headers);
+  if (etag) {
+    headers.set("If-None-Match", etag);
+  }
+  const response = await fetch(request.url, {
+    headers,
+    credentials: request.credentials,
+    cache: "no-store",
+  });
+  if (response.status === 304 && cached) {
+    return cached;
+  }
+  if (response.status === 200 && response.headers.get("ETag")) {
+    cache.put(request, response.clone());
+  }
+  return response;
+}
+
 self.addEventListener("fetch", (event) => {
+  const url = new URL(event.request.url);
+  if (url.origin === self.location.origin && url.pathname.startsWith("/api/")) {
+    // The page already revalidates when it sends its own If-None-Match
+    if (event.request.method === "GET" && !event.request.headers.has("If-None-Match")) {
+      event.respondWith(revalidate(event.request));
+    }
+    return;
+  }
   event.respondWith(
     caches.match(event.request).then((response) => {
       if (response) {
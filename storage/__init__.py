@@ -0,0 +1,27 @@
+from storage.backends import create_storage
+from storage.base import Storage, TaskNotFound
+from storage.cache import CachedStorage, TaskCache
+from storage.commit_queue import QueuedStorage
+from storage.engine import open_db
+from storage.file_storage import FileStorage
+from storage.log_store import LogStore
+from storage.search import SearchIndex
+from storage.sqlite_storage import SqliteStorage
+from storage.task_store import TaskStore
+from storage.timed import TimedStorage
+
+__all__ = [
+    'CachedStorage',
+    'FileStorage',
+    'LogStore',
+    'QueuedStorage',
+    'SearchIndex',
+    'SqliteStorage',
+    'Storage',
+    'TaskCache',
+    'TaskNotFound',
+    'TaskStore',
+    'TimedStorage',
+    'create_storage',
+    'open_db',
+]
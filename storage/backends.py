@@ -0,0 +1,17 @@
+import os
+
+from storage.file_storage import FileStorage
+from storage.sqlite_storage import SqliteStorage
+
+
+def create_storage(backend=None):
+    """Build the storage selected by ``STORAGE_BACKEND`` (``file`` or ``sqlite``)."""
+    backend = backend or os.getenv('STORAGE_BACKEND', 'file')
+    if backend == 'file':
+        return FileStorage(
+            users_path=os.getenv('USERS_DB_PATH', 'users.db'),
+            task_root=os.getenv('TASK_STORE_DIR', 'task_shards'),
+        )
+    if backend == 'sqlite':
+        return SqliteStorage(os.getenv('SQLITE_PATH', 'todo.sqlite3'))
+    raise ValueError(f'Unknown storage backend: {backend}')
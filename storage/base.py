@@ -0,0 +1,106 @@
+class TaskNotFound(KeyError):
+    """A write required tasks that no longer exist; ``args[0]`` lists their ids."""
+
+
+def date_key(task):
+    return (task.get('date') or '', str(task.get('id', '')))
+
+
+def in_date_range(tasks, lower=None, upper=None, after=None, limit=None):
+    selected = sorted((task for task in tasks
+                       if (lower is None or (task.get('date') or '') >= lower)
+                       and (upper is None or (task.get('date') or '') < upper)),
+                      key=date_key)
+    if after is not None:
+        after = tuple(after)
+        selected = [task for task in selected if date_key(task) > after]
+    return selected if limit is None else selected[:limit]
+
+
+class Storage:
+    """Everything app.py needs from its database.
+
+    Users are keyed by email and stored as plain dicts (``name``, ``email``,
+    ``password``). Tasks are dicts keyed by task id and always carry the
+    owning ``user_id``; a task is only ever visible through its owner.
+    """
+
+    # Users
+
+    def get_user(self, email):
+        raise NotImplementedError
+
+    def save_user(self, email, user):
+        raise NotImplementedError
+
+    # Tasks
+
+    def get_user_tasks(self, user_id):
+        """Return ``{task_id: task}`` for every task owned by ``user_id``."""
+        raise NotImplementedError
+
+    def get_user_tasks_by_date(self, user_id, lower=None, upper=None, after=None, limit=None):
+        """Return the user's tasks with ``lower <= date < upper``, sorted by date.
+
+        Bounds are ISO date strings (see ``date_views.date_bounds``); None
+        leaves that side open. Ties are ordered by task id, so ``(date, id)``
+        (see :func:`date_key`) is a stable key: ``after`` resumes strictly
+        after such a key and ``limit`` caps the number of tasks returned.
+        """
+        return in_date_range(self.get_user_tasks(user_id).values(), lower, upper, after, limit)
+
+    def get_task(self, user_id, task_id):
+        raise NotImplementedError
+
+    def get_owner(self, task_id):
+        raise NotImplementedError
+
+    def get_version(self, user_id):
+        """Return the user's task-set version (0 if they never wrote a task).
+
+        Every save or delete bumps it, so it identifies the exact state of
+        the user's tasks, e.g. for ETags.
+        """
+        raise NotImplementedError
+
+    def get_changes(self, user_id, since):
+        """Return ``(version, changes)`` for everything written after ``since``.
+
+        ``changes`` is ``[(task_id, task)]`` in write order with one entry
+        per task: its current value, or None if it was deleted. Returns None
+        if ``since`` predates the compacted delete history (or is from the
+        future), in which case the caller must reload all tasks.
+        """
+        raise NotImplementedError
+
+    def save_task(self, user_id, task_id, task):
+        """Create or replace the task; returns the user's new version."""
+        raise NotImplementedError
+
+    def delete_task(self, user_id, task_id):
+        """Delete the task; returns the new version, or None if there was no such task."""
+        raise NotImplementedError
+
+    def write_tasks(self, user_id, writes, require=()):
+        """Apply ``{task_id: task}`` (None deletes) as one atomic write.
+
+        The user's version is bumped once for the whole batch; returns it.
+        ``require`` lists task ids the user must still own when the write is
+        applied; if any is gone, :class:`TaskNotFound` is raised and nothing
+        is written.
+        """
+        raise NotImplementedError
+
+    # Bulk import, used by storage.migrate
+
+    def import_users(self, users):
+        raise NotImplementedError
+
+    def import_tasks(self, tasks):
+        raise NotImplementedError
+
+    def is_migrated(self):
+        raise NotImplementedError
+
+    def mark_migrated(self, count):
+        raise NotImplementedError
@@ -0,0 +1,294 @@
+import bisect
+import json
+import threading
+from collections import OrderedDict
+
+from storage.base import Storage, TaskNotFound, date_key
+
+
+def _size(value):
+    return len(json.dumps(value))
+
+
+class _Entry:
+    __slots__ = ('tasks', 'sizes', 'size', 'order')
+
+    def __init__(self, tasks, sizes, size):
+        self.tasks = tasks
+        self.sizes = sizes
+        self.size = size
+        self.order = None  # sorted [(date, id)], built on first range query
+
+
+class TaskCache:
+    """Size-bounded LRU of per-user task maps.
+
+    Bounded by ``max_entries`` users and, if set, an approximate
+    ``max_bytes`` budget (JSON-encoded size). Writes update cached maps in
+    place, copy-on-write, so a map returned by :meth:`get` is never mutated
+    afterwards. Each entry also keeps a date-ordered key list for range
+    queries, built on first use and maintained by writes. Loads racing with a write are detected with a write sequence
+    number, so a stale read never lands in the cache.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # user_id -> _Entry
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._writes = OrderedDict()  # user_id -> seq of their latest write
+        self._forgotten_seq = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(user_id)
+            return entry.tasks
+
+    def get_by_date(self, user_id, lower=None, upper=None, after=None, limit=None, count=True):
+        """Tasks in ``[lower, upper)`` sorted by date, or None if not cached."""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += count
+                return None
+            self.hits += count
+            self._entries.move_to_end(user_id)
+            if entry.order is None:
+                entry.order = sorted(date_key(task) for task in entry.tasks.values())
+            tasks, order = entry.tasks, entry.order
+        start = 0 if lower is None else bisect.bisect_left(order, (lower,))
+        if after is not None:
+            start = max(start, bisect.bisect_right(order, tuple(after)))
+        end = len(order) if upper is None else bisect.bisect_left(order, (upper,))
+        if limit is not None:
+            end = min(end, start + limit)
+        return [tasks[task_id] for _, task_id in order[start:end]]
+
+    def load_token(self):
+        return self._seq
+
+    def put(self, user_id, tasks, token):
+        """Cache ``tasks`` unless ``user_id`` was written since ``token``."""
+        sizes = {task_id: _size(task) for task_id, task in tasks.items()}
+        total = sum(sizes.values())
+        with self._lock:
+            if token < self._forgotten_seq or self._writes.get(user_id, -1) > token:
+                return
+            self._drop(user_id)
+            self._entries[user_id] = _Entry(dict(tasks), sizes, total)
+            self._bytes += total
+            self._evict()
+
+    def set_task(self, user_id, task_id, task):
+        with self._lock:
+            self._record_write(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            old = entry.tasks.get(task_id)
+            size = _size(task)
+            delta = size - entry.sizes.get(task_id, 0)
+            entry.tasks = {**entry.tasks, task_id: task}
+            entry.sizes[task_id] = size
+            entry.size += delta
+            self._bytes += delta
+            if entry.order is not None:
+                order = list(entry.order)
+                if old is not None:
+                    order.remove(date_key(old))
+                bisect.insort(order, date_key(task))
+                entry.order = order
+            self._evict()
+
+    def remove_task(self, user_id, task_id):
+        with self._lock:
+            self._record_write(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None or task_id not in entry.tasks:
+                return
+            old = entry.tasks[task_id]
+            entry.tasks = {k: v for k, v in entry.tasks.items() if k != task_id}
+            size = entry.sizes.pop(task_id)
+            entry.size -= size
+            self._bytes -= size
+            if entry.order is not None:
+                entry.order = [key for key in entry.order if key != date_key(old)]
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._record_write(user_id)
+            self._drop(user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def _record_write(self, user_id):
+        self._seq += 1
+        self._writes[user_id] = self._seq
+        self._writes.move_to_end(user_id)
+        if len(self._writes) > 4 * max(self.max_entries, 1):
+            _, seq = self._writes.popitem(last=False)
+            self._forgotten_seq = seq
+
+    def _drop(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or
+                                 (self.max_bytes and self._bytes > self.max_bytes)):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+
+class CachedStorage(Storage):
+    """Read-through :class:`TaskCache` in front of another Storage.
+
+    Task maps handed out are shallow copies; the task dicts inside are shared
+    with the cache and must not be mutated by callers.
+    """
+
+    def __init__(self, storage, cache):
+        self.storage = storage
+        self.cache = cache
+        # user_id -> version; tiny, so it holds far more users than the task cache
+        self._versions = OrderedDict()
+        self._versions_max = cache.max_entries * 16
+        self._versions_lock = threading.Lock()
+
+    def _set_version(self, user_id, version):
+        with self._versions_lock:
+            if version is None:
+                self._versions.pop(user_id, None)
+                return
+            self._versions[user_id] = version
+            self._versions.move_to_end(user_id)
+            while len(self._versions) > self._versions_max:
+                self._versions.popitem(last=False)
+
+    def _load(self, user_id):
+        token = self.cache.load_token()
+        tasks = self.storage.get_user_tasks(user_id)
+        self.cache.put(user_id, tasks, token)
+        return tasks
+
+    def _tasks(self, user_id):
+        tasks = self.cache.get(user_id)
+        if tasks is None:
+            tasks = self._load(user_id)
+        return tasks
+
+    def get_user(self, email):
+        return self.storage.get_user(email)
+
+    def save_user(self, email, user):
+        self.storage.save_user(email, user)
+
+    def get_user_tasks(self, user_id):
+        return dict(self._tasks(user_id))
+
+    def get_user_tasks_by_date(self, user_id, lower=None, upper=None, after=None, limit=None):
+        tasks = self.cache.get_by_date(user_id, lower, upper, after, limit)
+        if tasks is None:
+            self._load(user_id)
+            tasks = self.cache.get_by_date(user_id, lower, upper, after, limit, count=False)
+        if tasks is None:
+            # Not cacheable right now (racing a write or over budget)
+            tasks = self.storage.get_user_tasks_by_date(user_id, lower, upper, after, limit)
+        return tasks
+
+    def get_task(self, user_id, task_id):
+        return self._tasks(user_id).get(task_id)
+
+    def get_owner(self, task_id):
+        return self.storage.get_owner(task_id)
+
+    def get_version(self, user_id):
+        version = self._versions.get(user_id)
+        if version is None:
+            version = self.storage.get_version(user_id)
+            self._set_version(user_id, version)
+        return version
+
+    def get_changes(self, user_id, since):
+        return self.storage.get_changes(user_id, since)
+
+    def save_task(self, user_id, task_id, task):
+        try:
+            version = self.storage.save_task(user_id, task_id, task)
+        except Exception:
+            self.cache.invalidate(user_id)
+            self._set_version(user_id, None)
+            raise
+        self.cache.set_task(user_id, task_id, task)
+        self._set_version(user_id, version)
+        return version
+
+    def delete_task(self, user_id, task_id):
+        try:
+            version = self.storage.delete_task(user_id, task_id)
+        except Exception:
+            self.cache.invalidate(user_id)
+            self._set_version(user_id, None)
+            raise
+        self.cache.remove_task(user_id, task_id)
+        if version is not None:
+            self._set_version(user_id, version)
+        return version
+
+    def write_tasks(self, user_id, writes, require=()):
+        try:
+            version = self.storage.write_tasks(user_id, writes, require=require)
+        except TaskNotFound:
+            # Nothing was written
+            raise
+        except Exception:
+            self.cache.invalidate(user_id)
+            self._set_version(user_id, None)
+            raise
+        if len(writes) > 64:
+            # Patching copies the entry per task; reloading once is cheaper
+            self.cache.invalidate(user_id)
+        else:
+            for task_id, task in writes.items():
+                if task is None:
+                    self.cache.remove_task(user_id, task_id)
+                else:
+                    self.cache.set_task(user_id, task_id, task)
+        self._set_version(user_id, version)
+        return version
+
+    def import_users(self, users):
+        return self.storage.import_users(users)
+
+    def import_tasks(self, tasks):
+        count = self.storage.import_tasks(tasks)
+        for user_id in {task.get('user_id') for task in tasks.values()}:
+            self.cache.invalidate(user_id)
+            self._set_version(user_id, None)
+        return count
+
+    def is_migrated(self):
+        return self.storage.is_migrated()
+
+    def mark_migrated(self, count):
+        self.storage.mark_migrated(count)
@@ -0,0 +1,213 @@
+"""Single-writer group commit in front of a :class:`Storage`.
+
+Request threads hand their task writes to one commit thread and block until
+they are durable. The thread takes everything that arrives within
+``window`` seconds (at most ``max_batch`` submissions), folds each user's
+submissions into a single :meth:`Storage.write_tasks` call and then wakes
+every caller with the resulting version. Writes therefore never interleave
+(no read-modify-write races, no lost version bumps), and a burst of
+concurrent requests costs one write per user instead of one per request.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from storage.base import Storage, TaskNotFound
+
+logger = logging.getLogger(__name__)
+
+
+class _Submission:
+    __slots__ = ('user_id', 'writes', 'require', 'queued_at', 'done', 'version', 'error')
+
+    def __init__(self, user_id, writes, require):
+        self.user_id = user_id
+        self.writes = writes
+        self.require = require
+        self.queued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.version = None
+        self.error = None
+
+
+class QueuedStorage(Storage):
+    """Serializes every task write through a group-commit queue.
+
+    Reads go straight to the wrapped storage. Wrap the outermost storage
+    (e.g. a :class:`CachedStorage`) so that cache updates happen in commit
+    order too.
+    """
+
+    def __init__(self, storage, window=0.002, max_batch=256):
+        self.storage = storage
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._submissions = 0
+        self._max_batch_size = 0
+        self._commit_seconds = 0.0
+        self._max_commit_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name='storage-commit', daemon=True)
+        self._thread.start()
+
+    # Writes
+
+    def write_tasks(self, user_id, writes, require=()):
+        """Queue ``writes`` and wait until they are committed; returns the version.
+
+        ``require`` lists task ids that must still exist when the write is
+        applied, otherwise :class:`TaskNotFound` is raised and nothing from
+        this call is written.
+        """
+        submission = _Submission(user_id, dict(writes), tuple(require))
+        self._queue.put(submission)
+        submission.done.wait()
+        if submission.error is not None:
+            raise submission.error
+        return submission.version
+
+    def save_task(self, user_id, task_id, task):
+        return self.write_tasks(user_id, {task_id: task})
+
+    def delete_task(self, user_id, task_id):
+        try:
+            return self.write_tasks(user_id, {task_id: None}, require=[task_id])
+        except TaskNotFound:
+            return None
+
+    def close(self):
+        """Commit what is queued and stop the commit thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._batches or 1
+            return {
+                'batches': self._batches,
+                'submissions': self._submissions,
+                'queued': self._queue.qsize(),
+                'avg_batch_size': round(self._submissions / batches, 2),
+                'max_batch_size': self._max_batch_size,
+                'avg_commit_ms': round(self._commit_seconds * 1000 / batches, 3),
+                'max_commit_ms': round(self._max_commit_seconds * 1000, 3),
+                'avg_wait_ms': round(self._wait_seconds * 1000 / (self._submissions or 1), 3),
+            }
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            stop = False
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    # After the window closes, still take whatever is already queued
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.exception("Group commit failed")
+                for submission in batch:
+                    if submission.version is None and submission.error is None:
+                        submission.error = e
+            finally:
+                for submission in batch:
+                    submission.done.set()
+            if stop:
+                return
+
+    def _commit(self, batch):
+        started = time.perf_counter()
+        by_user = OrderedDict()
+        for submission in batch:
+            by_user.setdefault(submission.user_id, []).append(submission)
+
+        for user_id, submissions in by_user.items():
+            pending = {}
+            accepted = []
+            for submission in submissions:
+                try:
+                    missing = [task_id for task_id in submission.require
+                               if (pending[task_id] if task_id in pending
+                                   else self.storage.get_task(user_id, task_id)) is None]
+                except Exception as e:
+                    submission.error = e
+                    continue
+                if missing:
+                    submission.error = TaskNotFound(missing)
+                    continue
+                pending.update(submission.writes)
+                accepted.append(submission)
+            if not pending:
+                continue
+            try:
+                version = self.storage.write_tasks(user_id, pending)
+            except Exception as e:
+                logger.exception("Group commit for user %s failed", user_id)
+                for submission in accepted:
+                    submission.error = e
+            else:
+                for submission in accepted:
+                    submission.version = version
+
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self._batches += 1
+            self._submissions += len(batch)
+            self._max_batch_size = max(self._max_batch_size, len(batch))
+            self._commit_seconds += finished - started
+            self._max_commit_seconds = max(self._max_commit_seconds, finished - started)
+            self._wait_seconds += sum(started - submission.queued_at for submission in batch)
+
+    # Everything else goes straight through
+
+    def get_user(self, email):
+        return self.storage.get_user(email)
+
+    def save_user(self, email, user):
+        self.storage.save_user(email, user)
+
+    def get_user_tasks(self, user_id):
+        return self.storage.get_user_tasks(user_id)
+
+    def get_user_tasks_by_date(self, user_id, lower=None, upper=None, after=None, limit=None):
+        return self.storage.get_user_tasks_by_date(user_id, lower, upper, after, limit)
+
+    def get_task(self, user_id, task_id):
+        return self.storage.get_task(user_id, task_id)
+
+    def get_owner(self, task_id):
+        return self.storage.get_owner(task_id)
+
+    def get_version(self, user_id):
+        return self.storage.get_version(user_id)
+
+    def get_changes(self, user_id, since):
+        return self.storage.get_changes(user_id, since)
+
+    def import_users(self, users):
+        return self.storage.import_users(users)
+
+    def import_tasks(self, tasks):
+        return self.storage.import_tasks(tasks)
+
+    def is_migrated(self):
+        return self.storage.is_migrated()
+
+    def mark_migrated(self, count):
+        self.storage.mark_migrated(count)
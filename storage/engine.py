@@ -0,0 +1,62 @@
+"""Selects the key/value engine behind the monolith's storage.
+
+``STORAGE_ENGINE=pupdb`` (default) keeps the original whole-file JSON
+database; ``STORAGE_ENGINE=log`` uses the append-only :class:`LogStore`.
+Both read and write the same snapshot format, so switching to ``log`` needs
+no migration.
+"""
+import json
+import os
+
+from pupdb.core import PupDB
+
+from storage.log_store import LogStore
+
+
+class BatchPupDB(PupDB):
+    """PupDB plus :meth:`update`, which writes several keys in one flush."""
+
+    def update(self, sets=None, removes=()):
+        with self.process_lock:
+            database = self._get_database()
+            database.update({str(key): val for key, val in (sets or {}).items()})
+            for key in removes:
+                database.pop(str(key), None)
+            self._flush_database(database)
+        return True
+
+
+ENGINES = {
+    'pupdb': BatchPupDB,
+    'log': lambda path: LogStore(path, fsync=os.getenv('STORAGE_FSYNC', '1') == '1'),
+}
+
+
+def open_db(path, engine=None):
+    engine = engine or os.getenv('STORAGE_ENGINE', 'pupdb')
+    try:
+        factory = ENGINES[engine]
+    except KeyError:
+        raise ValueError(f'Unknown storage engine: {engine}')
+    return factory(path)
+
+
+def close_db(db):
+    close = getattr(db, 'close', None)
+    if close is not None:
+        close()
+
+
+def write_snapshot(path, data):
+    """Atomically replace the database at ``path`` with ``data``.
+
+    Any LogStore log for ``path`` is discarded, so the caller must pass the
+    complete contents (read them through the engine first).
+    """
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(data))
+    os.replace(tmp_path, path)
+    for log_path in (f'{path}.log.compacting', f'{path}.log'):
+        if os.path.exists(log_path):
+            os.remove(log_path)
@@ -0,0 +1,62 @@
+import os
+
+from storage.base import Storage
+from storage.engine import open_db
+from storage.task_store import TaskStore
+
+MARKER_FILE = 'MIGRATED'
+
+
+class FileStorage(Storage):
+    """Users in one key/value file, tasks in per-user :class:`TaskStore` shards."""
+
+    def __init__(self, users_path='users.db', task_root='task_shards', engine=None):
+        self.users_db = open_db(users_path, engine)
+        self.tasks = TaskStore(task_root, engine=engine)
+
+    def get_user(self, email):
+        return self.users_db.get(email)
+
+    def save_user(self, email, user):
+        if not self.users_db.set(email, user):
+            raise IOError(f'Failed to write user {email}')
+
+    def get_user_tasks(self, user_id):
+        return self.tasks.get_user_tasks(user_id)
+
+    def get_task(self, user_id, task_id):
+        return self.tasks.get_task(user_id, task_id)
+
+    def get_owner(self, task_id):
+        return self.tasks.get_owner(task_id)
+
+    def get_version(self, user_id):
+        return self.tasks.get_version(user_id)
+
+    def get_changes(self, user_id, since):
+        return self.tasks.get_changes(user_id, since)
+
+    def save_task(self, user_id, task_id, task):
+        return self.tasks.save_task(user_id, task_id, task)
+
+    def delete_task(self, user_id, task_id):
+        return self.tasks.delete_task(user_id, task_id)
+
+    def write_tasks(self, user_id, writes, require=()):
+        return self.tasks.write_tasks(user_id, writes, require=require)
+
+    def import_users(self, users):
+        for email, user in users.items():
+            if self.users_db.get(email) != user:
+                self.save_user(email, user)
+        return len(users)
+
+    def import_tasks(self, tasks):
+        return self.tasks.import_tasks(tasks)
+
+    def is_migrated(self):
+        return os.path.exists(os.path.join(self.tasks.root, MARKER_FILE))
+
+    def mark_migrated(self, count):
+        with open(os.path.join(self.tasks.root, MARKER_FILE), 'w') as f:
+            f.write(f'{count}\n')
@@ -0,0 +1,266 @@
+"""Append-only log-structured key/value engine with the PupDB interface.
+
+Every ``set``/``remove``/``update`` appends one checksummed record to ``<path>.log``
+and updates an in-memory index, so a write costs one small append however
+large the dataset is. ``<path>`` itself is a snapshot in PupDB's JSON format;
+a background compactor periodically folds the log into it.
+
+Recovery on open: load the snapshot, replay ``<path>.log.compacting`` (left
+behind if we crashed mid-compaction) and then ``<path>.log``. Replay stops at
+the first torn or corrupt record and truncates the log there.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_record(op, key, value=None):
+    body = json.dumps([op, key, value], separators=(',', ':')).encode('utf-8')
+    return b'%08x\t%s\n' % (zlib.crc32(body), body)
+
+
+def _decode_record(line):
+    """Return ``(op, key, value)`` or None if the line is torn or corrupt."""
+    if not line.endswith(b'\n') or len(line) < 10 or line[8:9] != b'\t':
+        return None
+    body = line[9:-1]
+    try:
+        if int(line[:8], 16) != zlib.crc32(body):
+            return None
+        op, key, value = json.loads(body)
+    except ValueError:
+        return None
+    return op, key, value
+
+
+class LogStore:
+    """Drop-in replacement for ``PupDB`` backed by an append-only log."""
+
+    def __init__(self, db_file_path, fsync=True, compactor=None):
+        self.db_file_path = db_file_path
+        self.log_path = f'{db_file_path}.log'
+        self.compacting_path = f'{db_file_path}.log.compacting'
+        self.fsync = fsync
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._data = {}  # key -> JSON-encoded value
+        self._log_bytes = 0
+        self._snapshot_bytes = 0
+        self._closed = False
+        self._recover()
+        self._compactor = compactor if compactor is not None else default_compactor()
+        self._compactor.register(self)
+
+    def __repr__(self):
+        return str(dict(self.items()))
+
+    def __len__(self):
+        return len(self._data)
+
+    # Recovery
+
+    def _recover(self):
+        if os.path.exists(self.db_file_path):
+            with open(self.db_file_path, 'rb') as f:
+                raw = f.read()
+            self._snapshot_bytes = len(raw)
+            snapshot = json.loads(raw or b'{}')
+            self._data = {key: json.dumps(value) for key, value in snapshot.items()}
+        if os.path.exists(self.compacting_path):
+            self._replay(self.compacting_path)
+        if os.path.exists(self.log_path):
+            self._log_bytes = self._replay(self.log_path)
+
+    def _replay(self, path):
+        good_bytes = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                record = _decode_record(line)
+                if record is None:
+                    break
+                self._apply(*record)
+                good_bytes += len(line)
+        if good_bytes != os.path.getsize(path):
+            logger.warning("Truncating torn log %s at byte %d", path, good_bytes)
+            with open(path, 'r+b') as f:
+                f.truncate(good_bytes)
+        return good_bytes
+
+    def _apply(self, op, key, value):
+        if op == 'set':
+            self._data[key] = json.dumps(value)
+        elif op == 'del':
+            self._data.pop(key, None)
+        elif op == 'batch':
+            for sub_op, sub_key, sub_value in value:
+                self._apply(sub_op, sub_key, sub_value)
+
+    def _append(self, record):
+        with open(self.log_path, 'ab') as f:
+            f.write(record)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._log_bytes += len(record)
+
+    # PupDB interface
+
+    def init_db(self):
+        return True
+
+    def set(self, key, val):
+        key = str(key)
+        with self._lock:
+            self._append(_encode_record('set', key, val))
+            self._data[key] = json.dumps(val)
+        return True
+
+    def get(self, key):
+        raw = self._data.get(str(key))
+        return None if raw is None else json.loads(raw)
+
+    def remove(self, key):
+        key = str(key)
+        with self._lock:
+            if key not in self._data:
+                raise KeyError(f'Non-existent Key {key} in database')
+            self._append(_encode_record('del', key))
+            del self._data[key]
+        return True
+
+    def update(self, sets=None, removes=()):
+        """Apply several sets and removes as one atomic log record."""
+        ops = [['set', str(key), val] for key, val in (sets or {}).items()]
+        ops += [['del', str(key), None] for key in removes]
+        with self._lock:
+            self._append(_encode_record('batch', None, ops))
+            for op, key, val in ops:
+                self._apply(op, key, val)
+        return True
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def values(self):
+        return [json.loads(raw) for raw in list(self._data.values())]
+
+    def items(self):
+        return [(key, json.loads(raw)) for key, raw in list(self._data.items())]
+
+    def dumps(self):
+        return json.dumps(dict(self.items()), sort_keys=True)
+
+    def truncate_db(self):
+        with self._compact_lock, self._lock:
+            self._data = {}
+            self._write_snapshot({})
+            for path in (self.log_path, self.compacting_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._log_bytes = 0
+        return True
+
+    # Compaction
+
+    def needs_compaction(self, min_log_bytes):
+        return not self._closed and self._log_bytes >= max(min_log_bytes, self._snapshot_bytes)
+
+    def compact(self):
+        """Fold the log into a new snapshot without blocking writers for long.
+
+        The live log is rotated aside under the lock, so writes keep
+        appending to a fresh log while the snapshot is being written.
+        """
+        with self._compact_lock:
+            return self._compact()
+
+    def _compact(self):
+        with self._lock:
+            if self._closed or not os.path.exists(self.log_path):
+                return False
+            if os.path.exists(self.compacting_path):
+                # A previous compaction died half way: fold both logs in
+                with open(self.compacting_path, 'ab') as dst, open(self.log_path, 'rb') as src:
+                    dst.write(src.read())
+                os.remove(self.log_path)
+            else:
+                os.replace(self.log_path, self.compacting_path)
+            data = dict(self._data)
+            self._log_bytes = 0
+
+        self._write_snapshot(data)
+        os.remove(self.compacting_path)
+        return True
+
+    def _write_snapshot(self, data):
+        body = '{' + ', '.join(f'{json.dumps(key)}: {raw}' for key, raw in data.items()) + '}'
+        tmp_path = f'{self.db_file_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(body)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.db_file_path)
+        self._snapshot_bytes = len(body)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self._compactor.unregister(self)
+
+
+class Compactor:
+    """Single background thread compacting every open LogStore."""
+
+    def __init__(self, interval=30.0, min_log_bytes=1 << 20):
+        self.interval = interval
+        self.min_log_bytes = min_log_bytes
+        self._stores = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, store):
+        with self._lock:
+            self._stores.add(store)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-compactor', daemon=True)
+                self._thread.start()
+
+    def unregister(self, store):
+        with self._lock:
+            self._stores.discard(store)
+
+    def run_once(self):
+        with self._lock:
+            stores = list(self._stores)
+        compacted = 0
+        for store in stores:
+            if store.needs_compaction(self.min_log_bytes):
+                try:
+                    compacted += store.compact()
+                except Exception:
+                    logger.exception("Compaction of %s failed", store.db_file_path)
+        return compacted
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+
+_default_compactor = None
+
+
+def default_compactor():
+    global _default_compactor
+    if _default_compactor is None:
+        _default_compactor = Compactor(
+            interval=float(os.getenv('STORAGE_COMPACT_INTERVAL', '30')),
+            min_log_bytes=int(os.getenv('STORAGE_COMPACT_MIN_BYTES', str(1 << 20))),
+        )
+    return _default_compactor
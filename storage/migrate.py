@@ -0,0 +1,99 @@
+"""One-shot import of the legacy data files into the configured storage.
+
+Older versions kept every user's tasks under the ``tasks`` key of
+``tasks.db`` (and before that, in ``tasks.json``), and users in ``users.db``
+/ ``users.json``. Tasks already sharded by :class:`TaskStore` are picked up
+too, so this also moves data from the file backend into SQLite. Run this
+module directly, or let ``app.py`` call :func:`migrate_legacy` at startup;
+the storage remembers the import, so repeated runs are a no-op.
+"""
+import argparse
+import json
+import logging
+import os
+
+from storage.engine import close_db, open_db
+from storage.task_store import TaskStore
+
+logger = logging.getLogger(__name__)
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    return data if isinstance(data, dict) else {}
+
+
+def _load_db(path):
+    if not os.path.exists(path):
+        return {}
+    db = open_db(path)
+    try:
+        return dict(db.items())
+    finally:
+        close_db(db)
+
+
+def load_legacy_users(users_db_path='users.db', users_json_path='users.json'):
+    users = {}
+    # users.db is what the app last wrote, so it wins on conflicts
+    for source in (_load_json(users_json_path), _load_db(users_db_path)):
+        for email, user in source.items():
+            if isinstance(user, dict):
+                users[email] = {**user, 'email': email}
+    return users
+
+
+def load_legacy_tasks(tasks_db_path='tasks.db', tasks_json_path='tasks.json', task_root=None):
+    tasks = {}
+    sources = [_load_json(tasks_json_path), _load_json(tasks_db_path).get('tasks')]
+    if task_root and os.path.isdir(os.path.join(task_root, 'users')):
+        sources.append(dict(TaskStore(task_root).iter_tasks()))
+    for source in sources:
+        if isinstance(source, dict):
+            tasks.update(source)
+    tasks = {task_id: task for task_id, task in tasks.items() if isinstance(task, dict)}
+    for task_id, task in tasks.items():
+        task.setdefault('id', task_id)
+    return tasks
+
+
+def migrate_legacy(storage, tasks_db_path='tasks.db', tasks_json_path='tasks.json',
+                   users_db_path='users.db', users_json_path='users.json', task_root=None):
+    if storage.is_migrated():
+        return 0
+
+    users = load_legacy_users(users_db_path, users_json_path)
+    storage.import_users(users)
+    tasks = load_legacy_tasks(tasks_db_path, tasks_json_path, task_root)
+    count = storage.import_tasks(tasks)
+    storage.mark_migrated(count)
+    logger.info("Imported %d legacy users and %d tasks", len(users), count)
+    return count
+
+
+def main():
+    from storage.backends import create_storage
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', default=os.getenv('STORAGE_BACKEND', 'file'))
+    parser.add_argument('--tasks-db', default='tasks.db')
+    parser.add_argument('--tasks-json', default='tasks.json')
+    parser.add_argument('--users-db', default='users.db')
+    parser.add_argument('--users-json', default='users.json')
+    parser.add_argument('--task-root', default=os.getenv('TASK_STORE_DIR', 'task_shards'),
+                        help='existing task shards to import (ignored by the file backend)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    storage = create_storage(args.backend)
+    task_root = None if args.backend == 'file' else args.task_root
+    count = migrate_legacy(storage, args.tasks_db, args.tasks_json,
+                           args.users_db, args.users_json, task_root)
+    print(f'Imported {count} tasks into the {args.backend} backend')
+
+
+if __name__ == '__main__':
+    main()
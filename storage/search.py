@@ -0,0 +1,117 @@
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Lowercase, accent-folded word tokens (so "viec" finds "việc")."""
+    folded = unicodedata.normalize('NFKD', str(text or '').casefold())
+    folded = ''.join(ch for ch in folded if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(folded.replace('đ', 'd'))
+
+
+class _UserIndex:
+    __slots__ = ('postings', 'tokens', 'docs')
+
+    def __init__(self):
+        self.postings = {}  # token -> set(task_id)
+        self.tokens = []    # sorted distinct tokens, for prefix lookups
+        self.docs = {}      # task_id -> set(token)
+
+    def add(self, task_id, text):
+        self.remove(task_id)
+        tokens = set(tokenize(text))
+        self.docs[task_id] = tokens
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                bisect.insort(self.tokens, token)
+            ids.add(task_id)
+
+    def remove(self, task_id):
+        for token in self.docs.pop(task_id, ()):
+            ids = self.postings[token]
+            ids.discard(task_id)
+            if not ids:
+                del self.postings[token]
+                del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def prefixed(self, prefix):
+        start = bisect.bisect_left(self.tokens, prefix)
+        end = bisect.bisect_left(self.tokens, prefix + '\uffff')
+        return self.tokens[start:end]
+
+
+class SearchIndex:
+    """Per-user inverted index over task text with prefix matching.
+
+    A user's index is built from storage on their first search and then kept
+    current by :meth:`add` / :meth:`remove` from the write handlers; only
+    ``max_users`` indexes are kept (LRU). Every query term must match a
+    token exactly or as a prefix (the last term is usually still being
+    typed). Exact matches rank above prefix matches.
+    """
+
+    def __init__(self, max_users=1024):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, user_id, task):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                index.add(task['id'], task.get('text'))
+
+    def remove(self, user_id, task_id):
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                index.remove(task_id)
+
+    def search(self, user_id, query, limit, load_tasks):
+        """Return ``[(score, task_id)]``, best first.
+
+        ``load_tasks(user_id)`` supplies ``{task_id: task}`` when the user's
+        index has to be built.
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is None:
+                # Built under the lock so no concurrent add/remove is lost
+                index = _UserIndex()
+                for task_id, task in load_tasks(user_id).items():
+                    index.add(task_id, task.get('text'))
+                self._users[user_id] = index
+                while len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            self._users.move_to_end(user_id)
+
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for token in index.prefixed(term):
+                    weight = 2 if token == term else 1
+                    for task_id in index.postings[token]:
+                        if term_scores.get(task_id, 0) < weight:
+                            term_scores[task_id] = weight
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {task_id: score + term_scores[task_id]
+                              for task_id, score in scores.items() if task_id in term_scores}
+                if not scores:
+                    return []
+
+        # Best score first; among equals, newer (larger) ids first
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [(score, task_id) for task_id, score in ranked]
@@ -0,0 +1,211 @@
+import json
+import sqlite3
+import threading
+
+from storage.base import Storage, TaskNotFound
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    data  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id      TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    date    TEXT,
+    data    TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_user_id ON tasks (user_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_user_id_date ON tasks (user_id, date);
+CREATE TABLE IF NOT EXISTS user_versions (
+    user_id TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    floor   INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS tombstones (
+    user_id TEXT NOT NULL,
+    id      TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (user_id, id)
+);
+CREATE INDEX IF NOT EXISTS idx_tombstones_user_id_version ON tombstones (user_id, version);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Columns added after a table was first created: (table, column, definition)
+ADDED_COLUMNS = [
+    ('tasks', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+    ('user_versions', 'floor', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+
+class SqliteStorage(Storage):
+    """SQLite-backed storage in WAL mode.
+
+    WAL lets request threads read while another thread writes, and the
+    ``user_id`` / ``(user_id, date)`` indexes turn per-user lookups into index
+    range scans. Each thread gets its own connection.
+
+    Every task row records the user version that last wrote it and deletes
+    leave a tombstone, of which only the newest ``max_tombstones`` per user
+    are kept.
+    """
+
+    def __init__(self, path='todo.sqlite3', max_tombstones=1000):
+        self.path = path
+        self.max_tombstones = max_tombstones
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            for table, column, definition in ADDED_COLUMNS:
+                columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+                if column not in columns:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_id_version ON tasks (user_id, version)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get_user(self, email):
+        row = self._connect().execute(
+            'SELECT data FROM users WHERE email = ?', (email,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_user(self, email, user):
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO users (email, data) VALUES (?, ?)',
+                         (email, json.dumps(user)))
+
+    def get_user_tasks(self, user_id):
+        rows = self._connect().execute(
+            'SELECT id, data FROM tasks WHERE user_id = ?', (user_id,))
+        return {task_id: json.loads(data) for task_id, data in rows}
+
+    def get_user_tasks_by_date(self, user_id, lower=None, upper=None, after=None, limit=None):
+        query = 'SELECT data FROM tasks WHERE user_id = ?'
+        params = [user_id]
+        if lower is not None:
+            query += ' AND date >= ?'
+            params.append(lower)
+        if upper is not None:
+            query += ' AND date < ?'
+            params.append(upper)
+        if after is not None:
+            query += ' AND (date > ? OR (date = ? AND id > ?))'
+            params.extend([after[0], after[0], after[1]])
+        query += ' ORDER BY date, id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        rows = self._connect().execute(query, params)
+        return [json.loads(data) for data, in rows]
+
+    def get_task(self, user_id, task_id):
+        row = self._connect().execute(
+            'SELECT data FROM tasks WHERE id = ? AND user_id = ?', (task_id, user_id)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_owner(self, task_id):
+        row = self._connect().execute(
+            'SELECT user_id FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_version(self, user_id):
+        row = self._connect().execute(
+            'SELECT version FROM user_versions WHERE user_id = ?', (user_id,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _bump_version(conn, user_id):
+        conn.execute('INSERT INTO user_versions (user_id, version) VALUES (?, 1) '
+                     'ON CONFLICT (user_id) DO UPDATE SET version = version + 1', (user_id,))
+        return conn.execute('SELECT version FROM user_versions WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+    def get_changes(self, user_id, since):
+        conn = self._connect()
+        row = conn.execute('SELECT version, floor FROM user_versions WHERE user_id = ?', (user_id,)).fetchone()
+        version, floor = row if row else (0, 0)
+        if since < floor or since > version:
+            return None
+        changed = [(written, task_id, json.loads(data)) for task_id, data, written in conn.execute(
+            'SELECT id, data, version FROM tasks WHERE user_id = ? AND version > ?', (user_id, since))]
+        changed.extend((written, task_id, None) for task_id, written in conn.execute(
+            'SELECT id, version FROM tombstones WHERE user_id = ? AND version > ?', (user_id, since)))
+        changed.sort(key=lambda change: change[0])
+        return version, [(task_id, task) for _, task_id, task in changed]
+
+    def save_task(self, user_id, task_id, task):
+        return self.write_tasks(user_id, {task_id: task})
+
+    def delete_task(self, user_id, task_id):
+        if self.get_owner(task_id) != user_id:
+            return None
+        return self.write_tasks(user_id, {task_id: None})
+
+    def write_tasks(self, user_id, writes, require=()):
+        with self._connect() as conn:
+            # The bump takes the write lock, so the required tasks can't go
+            # before this transaction commits; raising rolls the bump back
+            version = self._bump_version(conn, user_id)
+            if require:
+                placeholders = ', '.join('?' * len(require))
+                found = {row[0] for row in conn.execute(
+                    f'SELECT id FROM tasks WHERE user_id = ? AND id IN ({placeholders})', (user_id, *require))}
+                missing = [task_id for task_id in require if task_id not in found]
+                if missing:
+                    raise TaskNotFound(missing)
+            saved = [(task_id, user_id, task.get('date'), json.dumps(task), version)
+                     for task_id, task in writes.items() if task is not None]
+            deleted = [task_id for task_id, task in writes.items() if task is None]
+            conn.executemany('INSERT OR REPLACE INTO tasks (id, user_id, date, data, version) VALUES (?, ?, ?, ?, ?)',
+                             saved)
+            conn.executemany('DELETE FROM tombstones WHERE user_id = ? AND id = ?',
+                             [(user_id, row[0]) for row in saved])
+            if deleted:
+                conn.executemany('DELETE FROM tasks WHERE id = ? AND user_id = ?',
+                                 [(task_id, user_id) for task_id in deleted])
+                conn.executemany('INSERT OR REPLACE INTO tombstones (user_id, id, version) VALUES (?, ?, ?)',
+                                 [(user_id, task_id, version) for task_id in deleted])
+                # Drop the oldest tombstones beyond the limit and raise the floor past them
+                row = conn.execute('SELECT version FROM tombstones WHERE user_id = ? '
+                                   'ORDER BY version DESC LIMIT 1 OFFSET ?',
+                                   (user_id, self.max_tombstones)).fetchone()
+                if row:
+                    conn.execute('DELETE FROM tombstones WHERE user_id = ? AND version <= ?', (user_id, row[0]))
+                    conn.execute('UPDATE user_versions SET floor = ? WHERE user_id = ?', (row[0], user_id))
+            return version
+
+    def import_users(self, users):
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO users (email, data) VALUES (?, ?)',
+                             [(email, json.dumps(user)) for email, user in users.items()])
+        return len(users)
+
+    def import_tasks(self, tasks):
+        tasks = {task_id: task for task_id, task in tasks.items() if task.get('user_id') is not None}
+        with self._connect() as conn:
+            versions = {user_id: self._bump_version(conn, user_id)
+                        for user_id in {task['user_id'] for task in tasks.values()}}
+            conn.executemany(
+                'INSERT OR REPLACE INTO tasks (id, user_id, date, data, version) VALUES (?, ?, ?, ?, ?)',
+                [(task_id, task['user_id'], task.get('date'), json.dumps(task), versions[task['user_id']])
+                 for task_id, task in tasks.items()])
+        return len(tasks)
+
+    def is_migrated(self):
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+        return row is not None
+
+    def mark_migrated(self, count):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', ?)", (str(count),))
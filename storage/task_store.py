@@ -0,0 +1,195 @@
+import hashlib
+import os
+import threading
+
+from storage.base import TaskNotFound
+from storage.engine import close_db, open_db, write_snapshot
+
+
+# Shard keys starting with this prefix hold metadata, not tasks
+META_PREFIX = '__'
+VERSION_KEY = '__version__'
+# Deletes older than this version have been compacted away
+FLOOR_KEY = '__floor__'
+# '__v:<task_id>' -> version that last wrote the task,
+# '__d:<task_id>' -> version that deleted it (a tombstone)
+WRITTEN_PREFIX = '__v:'
+DELETED_PREFIX = '__d:'
+
+
+def _is_meta(key):
+    return str(key).startswith(META_PREFIX)
+
+
+def _digest(value):
+    return hashlib.sha1(str(value).encode('utf-8')).hexdigest()
+
+
+class TaskStore:
+    """Task storage sharded per user.
+
+    Every user owns one shard file holding only their tasks (``task_id ->
+    task``), and a global ``task_id -> user_id`` index is split into
+    ``index_buckets`` small files. A read or write therefore touches the
+    caller's shard and at most one index bucket, never other users' data.
+
+    Each shard also carries a version number, bumped in the same write as
+    every change to it, and records which version last wrote each task.
+    Deletes leave a tombstone; only the newest ``max_tombstones`` are kept.
+    """
+
+    def __init__(self, root='task_shards', index_buckets=4096, engine=None, max_tombstones=1000):
+        self.root = root
+        self.engine = engine
+        self.index_buckets = index_buckets
+        self.max_tombstones = max_tombstones
+        self.users_dir = os.path.join(root, 'users')
+        self.index_dir = os.path.join(root, 'index')
+        os.makedirs(self.users_dir, exist_ok=True)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._dbs = {}
+        self._dbs_lock = threading.Lock()
+
+    def _open(self, path):
+        db = self._dbs.get(path)
+        if db is None:
+            with self._dbs_lock:
+                db = self._dbs.get(path)
+                if db is None:
+                    db = open_db(path, self.engine)
+                    self._dbs[path] = db
+        return db
+
+    def shard_path(self, user_id):
+        return os.path.join(self.users_dir, f'{_digest(user_id)}.db')
+
+    def bucket_path(self, task_id):
+        bucket = int(_digest(task_id)[:8], 16) % self.index_buckets
+        return os.path.join(self.index_dir, f'{bucket:04x}.db')
+
+    def get_user_tasks(self, user_id):
+        return {key: task for key, task in self._open(self.shard_path(user_id)).items()
+                if not _is_meta(key)}
+
+    def get_task(self, user_id, task_id):
+        if _is_meta(task_id):
+            return None
+        return self._open(self.shard_path(user_id)).get(task_id)
+
+    def get_owner(self, task_id):
+        return self._open(self.bucket_path(task_id)).get(task_id)
+
+    def get_version(self, user_id):
+        return self._open(self.shard_path(user_id)).get(VERSION_KEY) or 0
+
+    def get_changes(self, user_id, since):
+        items = dict(self._open(self.shard_path(user_id)).items())
+        version = items.get(VERSION_KEY) or 0
+        if since < (items.get(FLOOR_KEY) or 0) or since > version:
+            return None
+        changed = []
+        for key, written in items.items():
+            if key.startswith((WRITTEN_PREFIX, DELETED_PREFIX)) and written > since:
+                changed.append((written, key))
+        changed.sort()
+        return version, [(key[len(WRITTEN_PREFIX):], items.get(key[len(WRITTEN_PREFIX):]))
+                         for _, key in changed]
+
+    def save_task(self, user_id, task_id, task):
+        return self.write_tasks(user_id, {task_id: task})
+
+    def delete_task(self, user_id, task_id):
+        if _is_meta(task_id) or self._open(self.shard_path(user_id)).get(task_id) is None:
+            return None
+        return self.write_tasks(user_id, {task_id: None})
+
+    def write_tasks(self, user_id, writes, require=()):
+        """Apply ``{task_id: task}`` (None deletes) to the user's shard.
+
+        All of it lands in one shard write together with a single version
+        bump, which is returned. The index buckets are updated afterwards,
+        one write per bucket. Raises :class:`TaskNotFound`, writing nothing,
+        if a task in ``require`` is not in the shard.
+        """
+        if any(_is_meta(task_id) for task_id in writes):
+            raise ValueError('Invalid task id')
+        shard = self._open(self.shard_path(user_id))
+        missing = [task_id for task_id in require if _is_meta(task_id) or shard.get(task_id) is None]
+        if missing:
+            raise TaskNotFound(missing)
+        version = (shard.get(VERSION_KEY) or 0) + 1
+        sets = {VERSION_KEY: version}
+        removes = []
+        by_bucket = {}
+        for task_id, task in writes.items():
+            if task is None:
+                sets[DELETED_PREFIX + task_id] = version
+                removes.extend([task_id, WRITTEN_PREFIX + task_id])
+            else:
+                sets[task_id] = task
+                sets[WRITTEN_PREFIX + task_id] = version
+                removes.append(DELETED_PREFIX + task_id)
+            by_bucket.setdefault(self.bucket_path(task_id), {})[task_id] = task is not None
+        if not shard.update(sets, removes=removes):
+            raise IOError(f'Failed to write tasks for {user_id}')
+
+        for path, owned in by_bucket.items():
+            index = self._open(path)
+            index_sets = {task_id: user_id for task_id, exists in owned.items()
+                          if exists and index.get(task_id) != user_id}
+            index_removes = [task_id for task_id, exists in owned.items()
+                             if not exists and index.get(task_id) is not None]
+            if index_sets or index_removes:
+                index.update(index_sets, removes=index_removes)
+        if None in writes.values():
+            self._compact_tombstones(shard)
+        return version
+
+    def _compact_tombstones(self, shard):
+        tombstones = [key for key in shard.keys() if key.startswith(DELETED_PREFIX)]
+        if len(tombstones) <= self.max_tombstones:
+            return
+        tombstones = sorted((shard.get(key), key) for key in tombstones)
+        dropped = tombstones[:len(tombstones) - self.max_tombstones]
+        # Clients synced before the newest dropped delete can no longer catch up
+        shard.update({FLOOR_KEY: dropped[-1][0]}, removes=[key for _, key in dropped])
+
+    def iter_tasks(self):
+        """Yield ``(task_id, task)`` for every task in every shard."""
+        for name in sorted(os.listdir(self.users_dir)):
+            if name.endswith('.db'):
+                for key, task in self._open(os.path.join(self.users_dir, name)).items():
+                    if not _is_meta(key):
+                        yield key, task
+
+    def import_tasks(self, tasks):
+        """Bulk-load ``{task_id: task}`` into the shards.
+
+        Each affected shard and index bucket is rewritten exactly once, which
+        is what makes migrating a large legacy file tractable.
+        """
+        by_user = {}
+        by_bucket = {}
+        for task_id, task in tasks.items():
+            user_id = task.get('user_id')
+            if user_id is None:
+                continue
+            by_user.setdefault(user_id, {})[task_id] = task
+            by_bucket.setdefault(self.bucket_path(task_id), {})[task_id] = user_id
+
+        for user_id, user_tasks in by_user.items():
+            path = self.shard_path(user_id)
+            version = (self._open(path).get(VERSION_KEY) or 0) + 1
+            written = {WRITTEN_PREFIX + task_id: version for task_id in user_tasks}
+            self._replace(path, {**user_tasks, **written, VERSION_KEY: version})
+        for path, owners in by_bucket.items():
+            self._replace(path, owners)
+        return sum(len(user_tasks) for user_tasks in by_user.values())
+
+    def _replace(self, path, updates):
+        existing = dict(self._open(path).items())
+        with self._dbs_lock:
+            db = self._dbs.pop(path, None)
+            if db is not None:
+                close_db(db)
+            write_snapshot(path, {**existing, **updates})
@@ -0,0 +1,34 @@
+"""Per-operation timings for a :class:`Storage`, recorded in :mod:`metrics`."""
+from metrics import time_storage
+from storage.base import Storage
+
+OPERATIONS = (
+    'get_user', 'save_user', 'get_user_tasks', 'get_user_tasks_by_date', 'get_task', 'get_owner',
+    'get_version', 'get_changes', 'save_task', 'delete_task', 'write_tasks',
+    'import_users', 'import_tasks', 'is_migrated', 'mark_migrated',
+)
+
+
+class TimedStorage(Storage):
+    """Times every call into ``storage`` as ``storage_operation_duration_seconds{backend,operation}``.
+
+    Wrap the raw backend, below :class:`CachedStorage`, so that cache hits
+    don't count as storage calls.
+    """
+
+    def __init__(self, storage, backend):
+        self.storage = storage
+        self.backend = backend
+
+
+def _timed(operation):
+    def call(self, *args, **kwargs):
+        with time_storage(self.backend, operation):
+            return getattr(self.storage, operation)(*args, **kwargs)
+    call.__name__ = operation
+    call.__doc__ = getattr(Storage, operation).__doc__
+    return call
+
+
+for _operation in OPERATIONS:
+    setattr(TimedStorage, _operation, _timed(_operation))
@@ -0,0 +1,93 @@
+"""Task creation throughput: one document at a time vs ``bulk_write`` batches.
+
+Writes ``--counts`` tasks into a scratch database on ``--uri``
+(``MONGODB_URI``, else a local mongod), with ``w='majority'`` as
+task_service does, in each mode:
+
+* ``per-document``: a version bump and an ``insert_one`` per task, as
+  ``POST /tasks`` does
+* ``bulk-ordered`` / ``bulk-unordered``: a version bump and one ordered or
+  unordered ``bulk_write`` per ``--batch-size`` tasks, committed together in
+  a transaction, as ``POST /tasks/bulk`` does (needs a replica set)
+
+Reports elapsed time and tasks per second. Against a replica set every
+majority write waits for a secondary, which is where batching pays off.
+The scratch database is dropped afterwards.
+
+    python stress_test/bench_bulk_tasks.py --counts 1000,100000 --batch-size 1000
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+from pymongo import InsertOne, MongoClient, ReturnDocument, WriteConcern
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_ids import new_task_id
+
+MODES = ('per-document', 'bulk-ordered', 'bulk-unordered')
+
+
+def new_task(i, user_id):
+    return {'_id': new_task_id(), 'text': f'task {i}', 'date': '2025-01-01', 'user_id': user_id}
+
+
+def bump_version(db, user_id, session=None):
+    return db.task_versions.find_one_and_update({'_id': user_id}, {'$inc': {'version': 1}}, upsert=True,
+                                                return_document=ReturnDocument.AFTER, session=session)['version']
+
+
+def per_document(db, count, args, user_id):
+    for i in range(count):
+        task = new_task(i, user_id)
+        task['version'] = bump_version(db, user_id)
+        db.tasks.insert_one(task)
+
+
+def bulk(ordered):
+    def run(db, count, args, user_id):
+        numbers = iter(range(count))
+        while True:
+            batch = list(itertools.islice(numbers, args.batch_size))
+            if not batch:
+                return
+            def write(session):
+                version = bump_version(db, user_id, session)
+                db.tasks.bulk_write([InsertOne({**new_task(i, user_id), 'version': version}) for i in batch],
+                                    ordered=ordered, session=session)
+            with db.client.start_session() as session:
+                session.with_transaction(write)
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default='todo_app_bench_bulk')
+    parser.add_argument('--counts', default='1000,100000')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--modes', default=','.join(MODES))
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    db = client.get_database(args.db, write_concern=WriteConcern(w='majority'))
+    runners = {'per-document': per_document, 'bulk-ordered': bulk(True), 'bulk-unordered': bulk(False)}
+    try:
+        for count in (int(n) for n in args.counts.split(',')):
+            print(f'{count} tasks, batch size {args.batch_size}')
+            for mode in args.modes.split(','):
+                client.drop_database(args.db)
+                start = time.perf_counter()
+                runners[mode](db, count, args, f'bench-{mode}')
+                elapsed = time.perf_counter() - start
+                assert db.tasks.count_documents({}) == count
+                print(f'{mode:>15}: {elapsed:8.2f} s  {count / elapsed:9.0f} tasks/s')
+    finally:
+        client.drop_database(args.db)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Time to serialize a page of tasks: the old ``str()`` pass vs :mod:`json_provider`.
+
+Builds ``--tasks`` task documents as Mongo returns them (ObjectId ``_id``,
+``created_at`` datetime) and encodes them ``--repeat`` times, as ``jsonify``
+does (sorted keys, compact separators), in each mode:
+
+* ``str-pass``: ``task['_id'] = str(task['_id'])`` on every document, then
+  Flask's stock encoder with its HTTP dates, as the services used to
+* ``provider-stdlib``: :class:`json_provider.FastJSONEncoder` with orjson
+  turned off
+* ``provider-orjson``: the same encoder with orjson, if it is installed
+
+The provider modes must produce the same JSON once decoded. Reports the
+best time per payload, the payload size and the speedup over ``str-pass``.
+
+    python stress_test/bench_json.py --tasks 10000 --repeat 20
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from flask.json import JSONEncoder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_provider
+from json_provider import FastJSONEncoder
+
+
+def tasks(count):
+    start = datetime(2025, 1, 1)
+    return [{
+        '_id': ObjectId(),
+        'user_id': 'bench-user',
+        'text': f'task {i} {random.choice(("buy milk", "write report", "call bob"))}',
+        'date': (start + timedelta(days=i % 365)).date().isoformat(),
+        'completed': i % 3 == 0,
+        'created_at': start + timedelta(minutes=i),
+        'version': i,
+    } for i in range(count)]
+
+
+def encode(payload, encoder):
+    return json.dumps(payload, cls=encoder, sort_keys=True, separators=(',', ':'))
+
+
+def str_pass(payload):
+    for task in payload:
+        task['_id'] = str(task['_id'])
+    return encode(payload, JSONEncoder)
+
+
+def provider(backend):
+    def run(payload):
+        saved, json_provider.orjson = json_provider.orjson, backend
+        try:
+            return encode(payload, FastJSONEncoder)
+        finally:
+            json_provider.orjson = saved
+    return run
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    modes = [('str-pass', str_pass), ('provider-stdlib', provider(None))]
+    if json_provider.orjson is not None:
+        modes.append(('provider-orjson', provider(json_provider.orjson)))
+    else:
+        print('orjson is not installed; skipping provider-orjson')
+
+    source = tasks(args.tasks)
+    print(f'{args.tasks} tasks per payload, best of {args.repeat}')
+    expected = None
+    baseline = None
+    for name, run in modes:
+        best = float('inf')
+        for _ in range(args.repeat):
+            # Fresh documents each time, as a cursor would return them
+            payload = [dict(task) for task in source]
+            start = time.perf_counter()
+            body = run(payload)
+            best = min(best, time.perf_counter() - start)
+        if name != 'str-pass':
+            decoded = json.loads(body)
+            expected = expected or decoded
+            assert decoded == expected, f'{name} produced different JSON'
+        baseline = baseline or best
+        print(f'{name:>15}: {best * 1000:8.2f} ms/payload  {len(body.encode("utf-8")) / 1e6:6.2f} MB  '
+              f'{baseline / best:5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Per-request cost of token verification: ``jwt.decode`` vs the verified-token cache.
+
+Issues ``--users`` tokens (HS256, one-hour ``exp``, as user_service signs
+them) and verifies ``--requests`` of them, picked at random, in two ways:
+
+* ``decode``: ``jwt.decode`` on every request, as the services used to
+* ``cached``: :class:`token_cache.TokenVerifier`, which decodes each token
+  once and then answers from its cache
+
+Reports the time per verification, the hit ratio, and the CPU that
+verification takes each second at ``--rate`` requests per second.
+
+    python stress_test/bench_jwt.py --users 1000 --requests 200000 --rate 2000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from token_cache import TokenVerifier
+
+SECRET = 'bench-secret-that-is-long-enough-for-hs256'
+ALGORITHM = 'HS256'
+
+
+def issue(users):
+    exp = datetime.utcnow() + timedelta(hours=1)
+    return [jwt.encode({'user_id': f'user-{i}', 'email': f'user{i}@example.com', 'exp': exp}, SECRET,
+                       algorithm=ALGORITHM) for i in range(users)]
+
+
+def run(mode, tokens, args):
+    verifier = TokenVerifier(SECRET, [ALGORITHM], name=f'bench-{mode}')
+    if mode == 'decode':
+        verify = lambda token: jwt.decode(token, SECRET, algorithms=[ALGORITHM])
+    else:
+        verify = verifier.verify
+    sequence = [random.choice(tokens) for _ in range(args.requests)]
+    start = time.perf_counter()
+    for token in sequence:
+        verify(token)
+    elapsed = time.perf_counter() - start
+    per_call = elapsed / args.requests
+    detail = f'  hit ratio {verifier.stats()["hit_ratio"]:.4f}' if mode == 'cached' else ''
+    print(f'{mode:>6}: {per_call * 1e6:7.2f} us/verification  '
+          f'{per_call * args.rate * 1000:6.1f} ms CPU per second at {args.rate} req/s{detail}')
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000, help='distinct tokens in use')
+    parser.add_argument('--requests', type=int, default=200000)
+    parser.add_argument('--rate', type=int, default=2000, help='requests per second to cost the CPU time at')
+    args = parser.parse_args()
+
+    tokens = issue(args.users)
+    print(f'{args.requests} verifications over {args.users} tokens')
+    decode = run('decode', tokens, args)
+    cached = run('cached', tokens, args)
+    print(f'saved {(decode - cached) * 1e6:.2f} us per request ({decode / cached:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Request latency with synchronous logging vs the queued JSON pipeline.
+
+Serves a small Flask handler that logs the way the app's request paths do
+(a few debug lines with the task list, an info line) from ``--threads``
+threads through the test client, in three configurations:
+
+* ``sync``: the old setup, ``basicConfig(level=DEBUG)`` plus a
+  RotatingFileHandler, with eagerly formatted f-strings
+* ``queued``: :func:`logging_config.setup_logging` with lazy arguments at
+  its default INFO level
+* ``queued-debug``: the same at DEBUG, sampling 10% of the ``app`` debug
+  lines (``LOG_SAMPLE_RATES=app=0.1``)
+
+Each configuration runs in its own process so they don't share logging
+state. Reports p50/p99/max latency and throughput.
+
+    python stress_test/bench_logging.py --requests 5000 --threads 8
+"""
+import argparse
+import json
+import logging
+import logging.handlers
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def build_app(mode, log_dir):
+    from flask import Flask, jsonify
+
+    if mode == 'sync':
+        logging.basicConfig(level=logging.DEBUG, stream=open(os.path.join(log_dir, 'console.log'), 'w'))
+        file_handler = logging.handlers.RotatingFileHandler(os.path.join(log_dir, 'app.log'),
+                                                            maxBytes=10485760, backupCount=5)
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+        logging.getLogger().addHandler(file_handler)
+        logger = logging.getLogger('app')
+    else:
+        os.environ['LOG_DIR'] = log_dir
+        if mode == 'queued-debug':
+            os.environ['LOG_LEVEL'] = 'DEBUG'
+            os.environ['LOG_SAMPLE_RATES'] = 'app=0.1'
+        # Keep the console quiet so the terminal isn't the bottleneck
+        os.environ.setdefault('LOG_CONSOLE_LEVEL', 'CRITICAL')
+        from logging_config import setup_logging
+        logger = setup_logging('app')
+
+    app = Flask(__name__)
+    tasks = {str(i): {'id': str(i), 'text': f'task {i}', 'date': '2025-01-01', 'completed': False}
+             for i in range(50)}
+
+    @app.route('/api/tasks')
+    def get_tasks():
+        user_id = 'user@example.com'
+        if mode == 'sync':
+            logger.debug(f"Get tasks request - User ID: {user_id}")
+            logger.debug(f"Request headers: {dict(headers)}")
+            logger.debug(f"User tasks: {tasks}")
+            logger.info(f"Returning {len(tasks)} tasks")
+        else:
+            logger.debug("Get tasks request - User ID: %s", user_id)
+            logger.debug("Request headers: %s", headers)
+            logger.debug("User tasks: %s", tasks)
+            logger.info("Returning %s tasks", len(tasks))
+        return jsonify(list(tasks.values()))
+
+    headers = {'Host': 'localhost', 'User-Agent': 'bench', 'Accept': 'application/json'}
+    return app
+
+
+def run(mode, args):
+    with tempfile.TemporaryDirectory(prefix='bench_logging_') as log_dir:
+        app = build_app(mode, log_dir)
+        latencies = []
+        lock = threading.Lock()
+        per_thread = args.requests // args.threads
+
+        def worker():
+            client = app.test_client()
+            mine = []
+            for _ in range(per_thread):
+                start = time.perf_counter()
+                client.get('/api/tasks')
+                mine.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(mine)
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        dropped = 0
+        if mode != 'sync':
+            import logging_config
+            dropped = logging_config.dropped_records()
+            logging_config.shutdown_logging()
+        print(json.dumps({
+            'mode': mode,
+            'requests': len(latencies),
+            'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+            'p99_ms': round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+            'max_ms': round(latencies[-1] * 1000, 3),
+            'req_per_s': round(len(latencies) / elapsed),
+            'dropped_log_records': dropped,
+        }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--mode', choices=['sync', 'queued', 'queued-debug'])
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args)
+        return
+
+    for mode in ('sync', 'queued', 'queued-debug'):
+        out = subprocess.run([sys.executable, __file__, '--mode', mode,
+                              '--requests', str(args.requests), '--threads', str(args.threads)],
+                             capture_output=True, text=True, check=True).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(f"{result['mode']:>12}: p50 {result['p50_ms']:.3f} ms  p99 {result['p99_ms']:.3f} ms  "
+              f"max {result['max_ms']:.3f} ms  {result['req_per_s']} req/s  "
+              f"dropped {result['dropped_log_records']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Latency of a cheap request while a burst of logins hashes passwords.
+
+Starts ``--logins`` threads that each check a werkzeug password hash
+(pbkdf2-sha256, 260000 iterations, as stored in users.json), as a burst of
+``/login`` requests does, and meanwhile times a stand-in for a task read
+(a small dict lookup and JSON encode) every 10 ms from another thread.
+Each mode runs once:
+
+* ``inline``: ``check_password_hash`` in the request thread, as before
+* ``pool``: :class:`password_hashing.PasswordHasher` with ``--workers``
+  processes and room for every login in its queue
+* ``pool-bounded``: the same with ``--max-queue`` places; logins past
+  that are refused with 503 rather than queued
+
+Reports how long the burst took, how many logins were refused, and the
+median and worst latency of the task reads during the burst.
+
+    python stress_test/bench_password_hashing.py --logins 64 --workers 4 --max-queue 8
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from password_hashing import HashPoolFull, PasswordHasher
+
+TASKS = {f'task-{i}': {'text': f'task {i}', 'date': '2025-01-01', 'completed': False} for i in range(50)}
+
+
+def read_tasks():
+    return json.dumps(list(TASKS.values()))
+
+
+def run(mode, args, stored):
+    if mode == 'inline':
+        check = lambda: check_password_hash(stored, 'test123')
+    else:
+        hasher = PasswordHasher(workers=args.workers,
+                                max_queue=args.max_queue if mode == 'pool-bounded' else args.logins)
+        hasher.check(stored, 'test123')  # start the workers before timing
+        check = lambda: hasher.check(stored, 'test123')
+
+    refused = []
+    def login():
+        try:
+            check()
+        except HashPoolFull:
+            refused.append(1)
+
+    latencies = []
+    done = threading.Event()
+    def reader():
+        while not done.is_set():
+            start = time.perf_counter()
+            read_tasks()
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    watcher = threading.Thread(target=reader)
+    watcher.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=login) for _ in range(args.logins)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    watcher.join()
+    print(f'{mode:>12}: burst {elapsed:6.2f} s  refused {len(refused):3d}  '
+          f'task read p50 {statistics.median(latencies) * 1000:7.2f} ms  max {max(latencies) * 1000:7.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--max-queue', type=int, default=8)
+    parser.add_argument('--modes', default='inline,pool,pool-bounded')
+    args = parser.parse_args()
+
+    stored = generate_password_hash('test123')
+    print(f'{args.logins} concurrent logins, {args.workers} hashing workers')
+    for mode in args.modes.split(','):
+        run(mode, args, stored)
+
+
+if __name__ == '__main__':
+    main()
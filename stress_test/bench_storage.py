@@ -0,0 +1,120 @@
+"""Per-operation latency of the storage backends as the total task count grows.
+
+Each round bulk-loads ``total`` tasks spread over users of ``--per-user``
+tasks, then times get/save/delete for random users through the Storage
+interface. Backends:
+
+* ``legacy``: the original single ``tasks`` blob in one PupDB file
+  (only up to ``--legacy-max`` tasks, it grows linearly)
+* ``file``:   per-user PupDB shards (``--engine log`` for the LogStore engine)
+* ``sqlite``: SQLite in WAL mode with (user_id, date) indexes
+
+    python stress_test/bench_storage.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pupdb.core import PupDB
+from storage.engine import write_snapshot
+from storage.file_storage import FileStorage
+from storage.sqlite_storage import SqliteStorage
+
+
+def make_tasks(total, per_user):
+    tasks = {}
+    for i in range(total):
+        task_id = str(1700000000000 + i)
+        tasks[task_id] = {
+            'id': task_id,
+            'text': f'task {i}',
+            'date': f'2025-{1 + i % 12:02d}-{1 + i % 28:02d}',
+            'completed': False,
+            'user_id': f'user{i // per_user}@example.com',
+            'timestamp': 1700000000.0 + i,
+        }
+    return tasks
+
+
+def timed(fn, ops):
+    start = time.perf_counter()
+    for i in range(ops):
+        fn(i)
+    return (time.perf_counter() - start) / ops * 1000
+
+
+def bench_storage(storage, tasks, users, ops):
+    storage.import_tasks(tasks)
+    picks = [random.choice(users) for _ in range(ops)]
+
+    read_ms = timed(lambda i: storage.get_user_tasks(picks[i]), ops)
+    write_ms = timed(lambda i: storage.save_task(
+        picks[i], f'bench{i}', {'id': f'bench{i}', 'user_id': picks[i], 'text': 'x', 'date': '2025-01-01'}), ops)
+    delete_ms = timed(lambda i: storage.delete_task(picks[i], f'bench{i}'), ops)
+    return read_ms, write_ms, delete_ms
+
+
+def bench_legacy(workdir, tasks, users, ops):
+    path = os.path.join(workdir, 'legacy.db')
+    write_snapshot(path, {'tasks': tasks})
+    db = PupDB(path)
+    picks = [random.choice(users) for _ in range(ops)]
+
+    def read(i):
+        return {k: t for k, t in db.get('tasks').items() if t.get('user_id') == picks[i]}
+
+    def write(i):
+        all_tasks = db.get('tasks')
+        all_tasks[f'bench{i}'] = {'id': f'bench{i}', 'user_id': picks[i], 'text': 'x'}
+        db.set('tasks', all_tasks)
+
+    def delete(i):
+        all_tasks = db.get('tasks')
+        del all_tasks[f'bench{i}']
+        db.set('tasks', all_tasks)
+
+    return timed(read, ops), timed(write, ops), timed(delete, ops)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--backends', nargs='+', default=['legacy', 'file', 'sqlite'])
+    parser.add_argument('--per-user', type=int, default=100)
+    parser.add_argument('--ops', type=int, default=200)
+    parser.add_argument('--legacy-max', type=int, default=100000)
+    parser.add_argument('--engine', choices=['pupdb', 'log'], default='pupdb')
+    args = parser.parse_args()
+
+    print(f"{'tasks':>9} {'backend':>8} {'read ms':>9} {'write ms':>9} {'delete ms':>10}")
+    for total in args.sizes:
+        tasks = make_tasks(total, args.per_user)
+        users = sorted({t['user_id'] for t in tasks.values()})
+        for backend in args.backends:
+            workdir = tempfile.mkdtemp(prefix='bench_storage_')
+            try:
+                if backend == 'legacy':
+                    if total > args.legacy_max:
+                        continue
+                    result = bench_legacy(workdir, tasks, users, max(args.ops // 10, 5))
+                elif backend == 'file':
+                    storage = FileStorage(os.path.join(workdir, 'users.db'),
+                                          os.path.join(workdir, 'shards'), engine=args.engine)
+                    result = bench_storage(storage, tasks, users, args.ops)
+                else:
+                    storage = SqliteStorage(os.path.join(workdir, 'todo.sqlite3'))
+                    result = bench_storage(storage, tasks, users, args.ops)
+                read_ms, write_ms, delete_ms = result
+                print(f'{total:>9} {backend:>8} {read_ms:>9.3f} {write_ms:>9.3f} {delete_ms:>10.3f}')
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
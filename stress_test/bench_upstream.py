@@ -0,0 +1,110 @@
+"""Per-hop latency of upstream calls: one-off requests vs the pooled client.
+
+Starts a stand-in upstream on localhost (HTTP/1.1 with keep-alive,
+answering every request with a small JSON body) and calls it from
+``--threads`` threads in two ways:
+
+* ``fresh``: ``requests.get(url)``, as api_service and api-gateway used to,
+  which opens a new session and TCP connection per call
+* ``pooled``: :class:`upstream_client.UpstreamClient` with a pool of
+  ``--pool-size`` keep-alive connections
+
+Reports p50/p99 per call, calls per second and how many TCP connections the
+upstream accepted.
+
+    python stress_test/bench_upstream.py --calls 5000 --threads 8
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upstream_client import UpstreamClient
+
+BODY = json.dumps([{'id': str(i), 'text': f'task {i}', 'date': '2025-01-01'} for i in range(20)]).encode()
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connections = 0
+    connections_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandInHandler.connections_lock:
+            StandInHandler.connections += 1
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(mode, args, base_url):
+    client = UpstreamClient('bench', base_url, pool_size=args.pool_size)
+    latencies = []
+    lock = threading.Lock()
+    StandInHandler.connections = 0
+
+    def worker():
+        mine = []
+        for _ in range(args.calls // args.threads):
+            start = time.perf_counter()
+            if mode == 'fresh':
+                response = requests.get(f'{base_url}/tasks')
+            else:
+                response = client.get('/tasks')
+            response.json()
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    latencies.sort()
+    print(f'{mode:>6}: p50 {latencies[len(latencies) // 2] * 1000:.3f} ms  '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.3f} ms  '
+          f'{len(latencies) / elapsed:.0f} calls/s  {StandInHandler.connections} connections'
+          + (f'  pool {client.stats()}' if mode == 'pooled' else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--pool-size', type=int, default=8)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        for mode in ('fresh', 'pooled'):
+            run(mode, args, base_url)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Checks with ``explain`` that the services' hot Mongo queries use an index.
+
+Connects to ``--uri`` (``MONGODB_URI``, else a local mongod) and creates a
+scratch database (``--db``), dropped afterwards unless ``--keep``. It seeds
+``--tasks`` tasks across ``--users`` users, creates the indexes from
+:mod:`mongo_schema` as the services do at startup, and explains each query
+shape task_service and user_service send on a hot path.
+
+A query passes if no stage of its winning plan is a ``COLLSCAN``. The
+script prints the plan's stages and PASS or FAIL for each query; the exit
+status is non-zero if any failed.
+
+    python stress_test/explain_queries.py --uri mongodb://localhost:27017/
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mongo_schema import INDEXES, ensure_indexes
+
+
+def seed(db, users, count):
+    start = date(2025, 1, 1)
+    db.users.insert_many([{'email': f'user{i}@example.com', 'name': f'User {i}', 'password': 'x'}
+                          for i in range(users)])
+    db.tasks.insert_many([{
+        '_id': f'{i:016d}',
+        'user_id': f'user-{i % users}',
+        'text': f'task {i} {random.choice(("buy milk", "write report", "call bob"))}',
+        'date': (start + timedelta(days=i % 365)).isoformat(),
+        'version': i,
+    } for i in range(count)])
+    db.task_tombstones.insert_many([{'user_id': f'user-{i % users}', 'task_id': f'gone-{i}', 'version': i}
+                                    for i in range(users * 5)])
+
+
+def queries(db):
+    """(name, explain document) for each hot query shape, as the services send it."""
+    user = 'user-1'
+    find = lambda collection, spec, projection=None, sort=None, limit=0: db.command(
+        'explain', {'find': collection, 'filter': spec, 'projection': projection or {},
+                    'sort': dict(sort or []), 'limit': limit}, verbosity='queryPlanner')
+    write = lambda command, collection, key, op: db.command(
+        'explain', {command: collection, key: [op]}, verbosity='queryPlanner')
+    return [
+        ('task listing', find('tasks', {'user_id': user})),
+        ('task page after cursor', find('tasks', {'$and': [{'user_id': user}, {'_id': {'$gt': '0000000000000100'}}]},
+                                        sort=[('_id', 1)], limit=51)),
+        ('date view', find('tasks', {'user_id': user, 'date': {'$gte': '2025-03-01', '$lt': '2025-04-01'}},
+                           sort=[('date', 1), ('_id', 1)], limit=51)),
+        ('change feed', find('tasks', {'user_id': user, 'version': {'$gt': 1000}})),
+        ('tombstones since', find('task_tombstones', {'user_id': user, 'version': {'$gt': 10}},
+                                  {'task_id': 1, 'version': 1, '_id': 0})),
+        ('search', find('tasks', {'user_id': user, '$text': {'$search': 'milk'}}, limit=20)),
+        ('batch targets', find('tasks', {'_id': {'$in': ['0000000000000001', '0000000000000002']}, 'user_id': user},
+                               {'_id': 1})),
+        ('update task', write('update', 'tasks', 'updates',
+                              {'q': {'_id': '0000000000000001', 'user_id': user}, 'u': {'$set': {'done': True}}})),
+        ('delete task', write('delete', 'tasks', 'deletes', {'q': {'_id': '0000000000000001', 'user_id': user},
+                                                             'limit': 1})),
+        ('login by email', find('users', {'email': 'user1@example.com'}, {'email': 1, 'password': 1}, limit=1)),
+    ]
+
+
+def stages(plan):
+    """Every ``stage`` in an explain document, depth first."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from stages(value)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--uri', default=os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
+    parser.add_argument('--db', default='todo_app_explain')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch database')
+    args = parser.parse_args()
+
+    client = MongoClient(args.uri, serverSelectionTimeoutMS=5000)
+    client.drop_database(args.db)
+    db = client[args.db]
+    try:
+        seed(db, args.users, args.tasks)
+        failed = ensure_indexes(db, INDEXES, logging.getLogger('explain_queries'))
+        if failed:
+            print(f'could not create indexes: {failed}')
+        ok = True
+        for name, explained in queries(db):
+            plan = explained['queryPlanner']['winningPlan']
+            found = list(stages(plan))
+            passed = 'COLLSCAN' not in found
+            ok = ok and passed
+            print(f'{name:>24}: {"PASS" if passed else "FAIL"}  {" <- ".join(found)}')
+    finally:
+        if not args.keep:
+            client.drop_database(args.db)
+    sys.exit(0 if ok and not failed else 1)
+
+
+if __name__ == '__main__':
+    main()
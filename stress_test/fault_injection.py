@@ -0,0 +1,198 @@
+"""Upstream client resilience against a fault-injecting stand-in upstream.
+
+Starts a stand-in upstream on localhost whose behaviour is switched per
+scenario (a share of 503 answers, slow answers, refusing connections) and
+drives :class:`upstream_client.UpstreamClient` through it:
+
+* ``flaky``: ``--fail-rate`` of answers are 503. Idempotent GETs are retried
+  with jittered backoff, so almost all succeed; POSTs are not retried.
+* ``budget``: every answer is a 503. Retries stop once the shared retry
+  budget is spent, instead of tripling the load on the upstream.
+* ``outage``: the upstream refuses connections. The circuit breaker opens
+  after ``UPSTREAM_BREAKER_FAILURES`` failures and later calls fail in
+  microseconds instead of each waiting for a connection. Once the upstream
+  is back, the first call after the reset timeout closes it again.
+* ``deadline``: the upstream takes ``--slow`` seconds per answer, but the
+  caller only has ``--deadline``. The call gives up at the deadline, and
+  the upstream sees how much of it was left in ``X-Deadline-Ms``.
+
+Each scenario prints what happened and PASS or FAIL against what it should
+do; the exit status is non-zero if any failed.
+
+    python stress_test/fault_injection.py --calls 500 --fail-rate 0.3
+"""
+import argparse
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Short breaker reset so the outage scenario sees the breaker close again
+os.environ.setdefault('UPSTREAM_BREAKER_RESET_TIMEOUT', '0.5')
+
+import requests
+
+from resilience import (DEADLINE_HEADER, CircuitBreaker, CircuitOpenError, DeadlineExceeded, RetryBudget,
+                        deadline_after)
+from upstream_client import UpstreamClient
+
+
+class Faults:
+    fail_rate = 0.0
+    delay = 0.0
+    calls = 0
+    deadlines = []
+    lock = threading.Lock()
+
+
+class FaultyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _answer(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        with Faults.lock:
+            Faults.calls += 1
+            if DEADLINE_HEADER in self.headers:
+                Faults.deadlines.append(int(self.headers[DEADLINE_HEADER]))
+        if Faults.delay:
+            time.sleep(Faults.delay)
+        status = 503 if random.random() < Faults.fail_rate else 200
+        body = b'{"ok": true}' if status == 200 else b'{"error": "injected"}'
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            # The caller gave up on us first
+            pass
+
+    do_GET = do_POST = _answer
+
+    def log_message(self, format, *args):
+        pass
+
+
+def reset(fail_rate=0.0, delay=0.0):
+    Faults.fail_rate, Faults.delay, Faults.calls, Faults.deadlines = fail_rate, delay, 0, []
+
+
+def client(base_url, **overrides):
+    upstream = UpstreamClient('fault', base_url, read_timeout=5)
+    upstream.breaker = CircuitBreaker('fault', **overrides.get('breaker', {}))
+    upstream.retries.budget = overrides.get('budget', RetryBudget())
+    upstream.retries.backoff = 0.005
+    return upstream
+
+
+def report(name, passed, detail):
+    print(f'{name:>9}: {"PASS" if passed else "FAIL"}  {detail}')
+    return passed
+
+
+def flaky(args, base_url):
+    reset(fail_rate=args.fail_rate)
+    # Enough budget for the retries this scenario exists to show
+    upstream = client(base_url, budget=RetryBudget(ratio=1.0, min_per_second=1000),
+                      breaker={'failure_threshold': args.calls})
+    gets = sum(upstream.get('/tasks').status_code == 200 for _ in range(args.calls))
+    get_calls = Faults.calls
+    reset(fail_rate=args.fail_rate)
+    posts = sum(upstream.post('/tasks', json={}).status_code == 200 for _ in range(args.calls))
+    expected_posts = args.calls * (1 - args.fail_rate)
+    passed = gets >= args.calls * (1 - args.fail_rate ** 3) * 0.97 and Faults.calls == args.calls
+    return report('flaky', passed,
+                  f'GET {gets}/{args.calls} ok in {get_calls} upstream calls; '
+                  f'POST {posts}/{args.calls} ok (~{expected_posts:.0f} expected, never retried) '
+                  f'in {Faults.calls} upstream calls')
+
+
+def budget(args, base_url):
+    reset(fail_rate=1.0)
+    retry_budget = RetryBudget(ratio=0.1, min_per_second=0)
+    retry_budget.tokens = 0
+    upstream = client(base_url, budget=retry_budget, breaker={'failure_threshold': args.calls * 10})
+    for _ in range(args.calls):
+        upstream.get('/tasks')
+    retries = Faults.calls - args.calls
+    passed = retries <= args.calls * 0.1 + 1
+    return report('budget', passed, f'{args.calls} failing GETs caused {retries} retries '
+                                    f'(budget allows {args.calls * 0.1:.0f}; without one: {args.calls * 2})')
+
+
+def outage(args, base_url):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        dead_url = f'http://127.0.0.1:{sock.getsockname()[1]}'
+    upstream = client(dead_url)
+    upstream.retries.max_retries = 0
+    outcomes = {'refused': 0, 'open': 0}
+    fast_fail = []
+    for _ in range(args.calls):
+        start = time.perf_counter()
+        try:
+            upstream.get('/tasks')
+        except CircuitOpenError:
+            outcomes['open'] += 1
+            fast_fail.append(time.perf_counter() - start)
+        except requests.ConnectionError:
+            outcomes['refused'] += 1
+    time.sleep(upstream.breaker.reset_timeout)
+    upstream.base_url = base_url
+    reset()
+    recovered = upstream.get('/tasks').status_code == 200 and upstream.breaker.state == CircuitBreaker.CLOSED
+    fast_fail.sort()
+    p50 = fast_fail[len(fast_fail) // 2] * 1e6 if fast_fail else float('nan')
+    passed = outcomes['refused'] == upstream.breaker.failure_threshold and recovered
+    return report('outage', passed, f'{outcomes["refused"]} calls reached the dead upstream, '
+                                    f'{outcomes["open"]} refused by the open breaker (p50 {p50:.0f} us); '
+                                    f'closed again after recovery: {recovered}')
+
+
+def deadline(args, base_url):
+    reset(delay=args.slow)
+    upstream = client(base_url)
+    start = time.perf_counter()
+    try:
+        with deadline_after(args.deadline):
+            upstream.get('/tasks')
+        outcome = 'answered'
+    except DeadlineExceeded:
+        outcome = 'DeadlineExceeded'
+    elapsed = time.perf_counter() - start
+    seen = Faults.deadlines[0] if Faults.deadlines else None
+    passed = (outcome == 'DeadlineExceeded' and elapsed < args.deadline + 0.2
+              and seen is not None and seen <= args.deadline * 1000)
+    return report('deadline', passed, f'{outcome} after {elapsed * 1000:.0f} ms with a {args.deadline * 1000:.0f} ms '
+                                      f'deadline; upstream got {DEADLINE_HEADER}: {seen}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--fail-rate', type=float, default=0.3)
+    parser.add_argument('--slow', type=float, default=2.0, help='seconds the slow upstream takes')
+    parser.add_argument('--deadline', type=float, default=0.3, help='seconds the caller waits for it')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FaultyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    try:
+        results = [scenario(args, base_url) for scenario in (flaky, budget, outage, deadline)]
+    finally:
+        server.shutdown()
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""Load test of the api-gateway front ends against a slow stand-in upstream.
+
+Starts a stand-in task/auth service that answers every request after
+``--delay`` seconds, then for each gateway mode (``sync``: the threaded
+Flask app, ``async``: async_app.py) starts the gateway as its own process
+and sends ``--requests`` GET /tasks with ``--concurrency`` in flight at
+once. Reports throughput, p50/p99 latency, status codes and the gateway
+process' peak RSS and thread count.
+
+    python stress_test/load_gateway.py --concurrency 1000 --requests 10000 --delay 0.2
+
+Needs aiohttp (the async gateway's dependency) for the client and the
+stand-in upstream. Requests carry a token signed with ``JWT_SECRET``, since
+the gateway refuses unauthenticated calls to /tasks.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import aiohttp
+import jwt
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GATEWAY = os.path.join(ROOT, 'services', 'api-gateway', 'app.py')
+
+JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
+TOKEN = jwt.encode({'user_id': 'load-test', 'exp': int(time.time()) + 86400}, JWT_SECRET, algorithm='HS256')
+
+BODY = json.dumps([{'id': str(i), 'text': f'task {i}', 'date': '2025-01-01'} for i in range(20)])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_upstream(port, delay):
+    async def handler(request):
+        await asyncio.sleep(delay)
+        return web.Response(text=BODY, content_type='application/json')
+
+    app = web.Application()
+    app.router.add_route('*', '/{tail:.*}', handler)
+    web.run_app(app, host='127.0.0.1', port=port, access_log=None, print=None, backlog=4096)
+
+
+def wait_for(url, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(url, timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up')
+
+
+class ProcessSampler(threading.Thread):
+    """Peak RSS and thread count of a process, read from /proc."""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak_rss_kb = 0
+        self.peak_threads = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(0.05):
+            try:
+                with open(f'/proc/{self.pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            self.peak_rss_kb = max(self.peak_rss_kb, int(line.split()[1]))
+                        elif line.startswith('Threads:'):
+                            self.peak_threads = max(self.peak_threads, int(line.split()[1]))
+            except OSError:
+                return
+
+
+async def load(url, total, concurrency):
+    latencies, statuses = [], collections.Counter()
+    remaining = iter(range(total))
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency), timeout=timeout) as session:
+        async def worker():
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    async with session.get(url, headers={'Authorization': TOKEN}) as response:
+                        await response.read()
+                        statuses[response.status] += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def run_mode(mode, args, upstream_url):
+    port = free_port()
+    env = dict(os.environ, GATEWAY_MODE=mode, PORT=str(port), TASK_SERVICE_URL=upstream_url,
+               AUTH_SERVICE_URL=upstream_url, JWT_SECRET=JWT_SECRET, LOG_LEVEL='WARNING')
+    gateway = subprocess.Popen([sys.executable, GATEWAY], env=env, cwd=os.path.dirname(GATEWAY),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(('127.0.0.1', port))
+        sampler = ProcessSampler(gateway.pid)
+        sampler.start()
+        latencies, statuses, elapsed = asyncio.run(load(f'http://127.0.0.1:{port}/tasks',
+                                                        args.requests, args.concurrency))
+        sampler.stopped.set()
+        sampler.join()
+    finally:
+        gateway.terminate()
+        gateway.wait()
+
+    latencies.sort()
+    print(f'{mode:>5}: {len(latencies) / elapsed:.0f} req/s  '
+          f'p50 {latencies[len(latencies) // 2] * 1000:.0f} ms  '
+          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.0f} ms  '
+          f'peak RSS {sampler.peak_rss_kb / 1024:.0f} MB  peak threads {sampler.peak_threads}  '
+          f'statuses {dict(statuses)}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=1000)
+    parser.add_argument('--delay', type=float, default=0.2, help='seconds the stand-in upstream takes per request')
+    parser.add_argument('--modes', default='sync,async')
+    parser.add_argument('--serve-upstream', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_upstream:
+        serve_upstream(args.serve_upstream, args.delay)
+        return
+
+    upstream_port = free_port()
+    upstream = subprocess.Popen([sys.executable, __file__, '--serve-upstream', str(upstream_port),
+                                 '--delay', str(args.delay)])
+    try:
+        wait_for(('127.0.0.1', upstream_port))
+        print(f'{args.requests} requests, {args.concurrency} concurrent, upstream delay {args.delay * 1000:.0f} ms')
+        for mode in args.modes.split(','):
+            run_mode(mode, args, f'http://127.0.0.1:{upstream_port}')
+    finally:
+        upstream.terminate()
+        upstream.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Concurrent-writer stress test for the group-commit queue.
+
+``--threads`` writers share ``--users`` users. Each writer creates
+``--writes`` tasks, rewrites each one once and deletes every fifth, all
+through the same storage object. Afterwards the storage is reopened from
+disk and checked:
+
+* every surviving task holds its last written value and every deleted task
+  is gone (no lost updates)
+* each user's version went up by exactly one per commit (no lost version
+  bumps)
+
+``--no-queue`` runs the same load without :class:`QueuedStorage` for
+comparison.
+
+    python stress_test/stress_commit_queue.py --backend file --threads 32
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.cache import CachedStorage, TaskCache
+from storage.commit_queue import QueuedStorage
+from storage.file_storage import FileStorage
+from storage.sqlite_storage import SqliteStorage
+
+
+def open_backend(args, workdir):
+    if args.backend == 'sqlite':
+        return SqliteStorage(os.path.join(workdir, 'todo.sqlite3'))
+    return FileStorage(os.path.join(workdir, 'users.db'), os.path.join(workdir, 'shards'), engine=args.engine)
+
+
+def writer(store, n, args, acked, errors):
+    user_id = f'user{n % args.users}@example.com'
+    try:
+        for i in range(args.writes):
+            task_id = f'{n}-{i}'
+            task = {'id': task_id, 'user_id': user_id, 'text': f'task {i}', 'date': '2025-01-01'}
+            acked.append((user_id, store.save_task(user_id, task_id, task)))
+            task = {**task, 'text': f'task {i} updated', 'completed': True}
+            acked.append((user_id, store.save_task(user_id, task_id, task)))
+            if i % 5 == 0:
+                acked.append((user_id, store.delete_task(user_id, task_id)))
+    except Exception as e:
+        errors.append(e)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['file', 'sqlite'], default='file')
+    parser.add_argument('--engine', choices=['pupdb', 'log'], default='pupdb')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--users', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=100)
+    parser.add_argument('--window-ms', type=float, default=2.0)
+    parser.add_argument('--no-queue', action='store_true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='stress_commit_')
+    try:
+        store = CachedStorage(open_backend(args, workdir), TaskCache())
+        if not args.no_queue:
+            store = QueuedStorage(store, window=args.window_ms / 1000)
+        acked, errors = [], []
+        threads = [threading.Thread(target=writer, args=(store, n, args, acked, errors))
+                   for n in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if not args.no_queue:
+            store.close()
+            print('commit queue:', store.stats())
+        print(f'{len(acked)} writes from {args.threads} threads in {elapsed:.2f}s '
+              f'({len(acked) / elapsed:.0f} writes/s), {len(errors)} errors')
+
+        reopened = open_backend(args, workdir)
+        lost = 0
+        for n in range(args.threads):
+            user_id = f'user{n % args.users}@example.com'
+            tasks = reopened.get_user_tasks(user_id)
+            for i in range(args.writes):
+                task = tasks.get(f'{n}-{i}')
+                if i % 5 == 0:
+                    lost += task is not None
+                else:
+                    lost += task is None or task.get('text') != f'task {i} updated'
+
+        # Every commit bumps its user's version once. Writes grouped into
+        # one commit share its version, so each user should end at exactly
+        # one version per commit, with every version in 1..final acknowledged.
+        lost_bumps = 0
+        for user_id in {user_id for user_id, _ in acked}:
+            versions = [version for u, version in acked if u == user_id]
+            commits = len(versions) if args.no_queue else len(set(versions))
+            final = reopened.get_version(user_id)
+            lost_bumps += commits - final
+            lost_bumps += len(set(range(1, final + 1)) - set(versions))
+        print(f'lost or stale tasks: {lost}')
+        print(f'lost version bumps: {lost_bumps}')
+        sys.exit(1 if lost or errors or lost_bumps else 0)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
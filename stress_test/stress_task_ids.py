@@ -0,0 +1,68 @@
+"""Multi-process uniqueness check for the task id generator.
+
+Starts ``--processes`` processes that together issue ``--rate`` ids per
+second for ``--seconds`` seconds (or as fast as they can with ``--rate 0``),
+each claiming its own worker id the way app workers do. Fails if any id is
+issued twice, if a process's ids ever go backwards, or if ids are not
+19-digit strings.
+
+    python stress_test/stress_task_ids.py --processes 8 --rate 100000 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_ids import id_time, new_task_id
+
+
+def generate(rate, seconds, results):
+    ids = []
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+        # Pace in small bursts to hold the target rate
+        due = int((now - start) * rate) if rate else len(ids) + 1000
+        for _ in range(due - len(ids)):
+            ids.append(new_task_id())
+        if rate:
+            time.sleep(0.001)
+    ordered = all(len(a) == len(b) == 19 and a < b for a, b in zip(ids, ids[1:]))
+    results.put((os.getpid(), ordered, ids))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--rate', type=int, default=100000, help='ids per second across all processes; 0 = unthrottled')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=generate, args=(args.rate // args.processes, args.seconds, results))
+             for _ in range(args.processes)]
+    for proc in procs:
+        proc.start()
+    collected = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    all_ids = [task_id for _, _, ids in collected for task_id in ids]
+    duplicates = len(all_ids) - len(set(all_ids))
+    unordered = [pid for pid, ordered, _ in collected if not ordered]
+    workers = {int(ids[0]) >> 12 & 0x3FF for _, _, ids in collected if ids}
+    print(f'{len(all_ids)} ids from {args.processes} processes in {args.seconds}s '
+          f'({len(all_ids) / args.seconds:.0f}/s), {len(workers)} distinct workers')
+    print(f'first {min(all_ids)} ({id_time(min(all_ids)).isoformat()}), last {max(all_ids)}')
+    print(f'duplicates: {duplicates}, processes with out-of-order ids: {len(unordered)}')
+    sys.exit(1 if duplicates or unordered else 0)
+
+
+if __name__ == '__main__':
+    main()
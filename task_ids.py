@@ -0,0 +1,110 @@
+"""Snowflake-style task ids: unique across processes, ordered by creation time.
+
+An id packs, from the most significant bit down::
+
+    1 | 40-bit milliseconds since EPOCH_MS | 10-bit worker | 12-bit sequence
+
+and is handed out as a decimal string. The leading marker bit keeps every id
+exactly 19 digits long, so ids sort the same as strings and as numbers, and
+they all sort after the 13-digit millisecond ids issued before. They are
+strings because JavaScript numbers can't hold 63 bits.
+
+Each process claims its own worker id: ``TASK_ID_WORKER`` if set (required
+when several hosts share one database), otherwise the first free lock file
+in ``TASK_ID_LOCK_DIR``, so processes on one host never share a worker.
+A worker issues up to 4096 ids per millisecond; beyond that, or if the
+clock steps back, it keeps counting from its last timestamp instead of
+waiting.
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from filelock import FileLock, Timeout
+
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+_TIME_SHIFT = WORKER_BITS + SEQUENCE_BITS
+_MARKER = 1 << 62
+
+# Worker lock files stay held for the life of the process
+_claims = []
+
+
+def claim_worker_id(lock_dir=None):
+    worker = os.getenv('TASK_ID_WORKER')
+    if worker is not None:
+        worker = int(worker)
+        if not 0 <= worker <= MAX_WORKER:
+            raise ValueError(f'TASK_ID_WORKER must be between 0 and {MAX_WORKER}')
+        return worker
+
+    lock_dir = lock_dir or os.getenv('TASK_ID_LOCK_DIR') or os.path.join(tempfile.gettempdir(), 'task-id-workers')
+    os.makedirs(lock_dir, exist_ok=True)
+    # Spread hosts over the id space in case TASK_ID_WORKER was forgotten
+    offset = zlib.crc32(socket.gethostname().encode('utf-8'))
+    for slot in range(MAX_WORKER + 1):
+        lock = FileLock(os.path.join(lock_dir, f'{slot}.lock'))
+        try:
+            lock.acquire(timeout=0)
+        except Timeout:
+            continue
+        _claims.append(lock)
+        return (offset + slot) & MAX_WORKER
+    raise RuntimeError(f'All {MAX_WORKER + 1} task id workers in {lock_dir} are taken')
+
+
+class IdGenerator:
+    """Thread-safe generator; claims a worker id lazily and again after a fork."""
+
+    def __init__(self, worker_id=None):
+        self._worker_id = worker_id
+        self._worker = None
+        self._pid = None
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._worker = self._worker_id if self._worker_id is not None else claim_worker_id()
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now > self._last_ms:
+                self._last_ms = now
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    self._last_ms += 1
+                    self._sequence = 0
+            return str(_MARKER | self._last_ms << _TIME_SHIFT | self._worker << SEQUENCE_BITS | self._sequence)
+
+
+def id_time(task_id):
+    """Creation time of a task id (also understands the old millisecond ids)."""
+    value = int(task_id)
+    if value >= _MARKER:
+        value = ((value ^ _MARKER) >> _TIME_SHIFT) + EPOCH_MS
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def min_id_at(when):
+    """Smallest id created at or after ``when``, for id range scans by creation time."""
+    ms = int(when.timestamp() * 1000) - EPOCH_MS
+    return str(_MARKER | max(ms, 0) << _TIME_SHIFT)
+
+
+_default = IdGenerator()
+
+
+def new_task_id():
+    return _default.next_id()
@@ -0,0 +1,92 @@
+"""JWT verification with a cache of tokens already verified.
+
+A client presents the same token on every request for its whole lifetime.
+:class:`TokenVerifier` checks the signature and claims (``jwt.decode``) the
+first time and then remembers the payload, keyed by a SHA-256 digest of the
+token, until the token's ``exp``. Later requests with that token skip the
+HMAC and the JSON parsing.
+
+Only tokens that verified are cached, so a forged or expired token is
+rejected by ``jwt.decode`` every time it is presented. Tokens without an
+``exp`` are kept for ``JWT_CACHE_MAX_TTL`` seconds (300) at most. The cache
+keeps at most ``JWT_CACHE_SIZE`` tokens (10000), dropping the least
+recently used; ``JWT_CACHE_SIZE=0`` turns it off.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+from metrics import REGISTRY
+
+
+class TokenVerifier:
+    def __init__(self, secret, algorithms, name='jwt', max_entries=None, max_ttl=None):
+        self.secret = secret
+        self.algorithms = list(algorithms)
+        self.name = name
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('JWT_CACHE_SIZE', '10000'))
+        self.max_ttl = max_ttl if max_ttl is not None else float(os.getenv('JWT_CACHE_MAX_TTL', '300'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _verifiers.append(self)
+
+    def verify(self, token):
+        """The token's payload; raises ``jwt.InvalidTokenError`` (or a subclass) like ``jwt.decode``."""
+        if isinstance(token, str):
+            token = token.encode('utf-8')
+        digest = hashlib.sha256(token).digest()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                payload, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    # A copy: callers may add to the payload they get back
+                    return dict(payload)
+                del self._entries[digest]
+            self.misses += 1
+
+        payload = jwt.decode(token, self.secret, algorithms=self.algorithms)
+        if self.max_entries > 0:
+            expires = now + self.max_ttl
+            if isinstance(payload.get('exp'), (int, float)):
+                expires = min(expires, payload['exp'])
+            with self._lock:
+                self._entries[digest] = (payload, expires)
+                self._entries.move_to_end(digest)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return dict(payload)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_verifiers = []
+
+
+def _verifier_stat(key):
+    return lambda: {(verifier.name,): verifier.stats()[key] for verifier in list(_verifiers)}
+
+
+REGISTRY.gauge('jwt_cache_entries', 'Verified tokens cached.', _verifier_stat('entries'), ('verifier',))
+REGISTRY.gauge('jwt_cache_hits', 'Tokens accepted from the cache without verifying the signature again.',
+               _verifier_stat('hits'), ('verifier',))
+REGISTRY.gauge('jwt_cache_misses', 'Tokens verified with jwt.decode.', _verifier_stat('misses'), ('verifier',))
+REGISTRY.gauge('jwt_cache_hit_ratio', 'Share of tokens accepted from the cache.', _verifier_stat('hit_ratio'),
+               ('verifier',))
@@ -0,0 +1,193 @@
+"""Pooled keep-alive HTTP clients for calls to upstream services.
+
+``get_client(name, base_url)`` returns the process-wide
+:class:`UpstreamClient` for an upstream. Each client owns one
+``requests.Session`` whose connection pool is reused by every thread, so
+calls to the same upstream skip the TCP handshake after the first one. Each
+call gets a connect and a read timeout unless it passes its own.
+
+Settings come from the environment, per upstream first
+(``TASK_SERVICE_POOL_SIZE`` for upstream ``task_service``) and then
+globally:
+
+* ``UPSTREAM_POOL_SIZE`` (20): connections kept open per upstream
+* ``UPSTREAM_CONNECT_TIMEOUT`` (2) and ``UPSTREAM_READ_TIMEOUT`` (10), in seconds
+* ``UPSTREAM_KEEP_ALIVE`` (1): ``0`` closes the connection after each call
+
+A call made while all pooled connections are busy still goes out, on a
+connection that is closed afterwards. It is counted in
+``upstream_pool_saturated_calls``. Keep that counter at zero by sizing the
+pool to the number of threads making calls.
+
+Calls also go through the upstream's circuit breaker, are retried when
+idempotent and keep to the deadline of the request being handled; see
+:mod:`resilience` for those settings.
+"""
+import os
+import threading
+import time
+from http import cookiejar
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import REGISTRY, upstream_request
+from resilience import (DEADLINE_EXCEEDED, DEADLINE_HEADER, IDEMPOTENT_METHODS, RETRY_STATUSES, CircuitBreaker,
+                        DeadlineExceeded, RetryPolicy, current_deadline, deadline_header, time_left)
+
+
+def upstream_setting(name, key, default, cast):
+    """``<NAME>_<KEY>``, else ``UPSTREAM_<KEY>``, else ``default``."""
+    value = os.getenv(f'{name.upper()}_{key}', os.getenv(f'UPSTREAM_{key}'))
+    return cast(value) if value is not None else default
+
+
+class UpstreamClient:
+    def __init__(self, name, base_url, pool_size=None, connect_timeout=None, read_timeout=None, keep_alive=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size if pool_size is not None else upstream_setting(name, 'POOL_SIZE', 20, int)
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else upstream_setting(name, 'CONNECT_TIMEOUT', 2.0, float),
+            read_timeout if read_timeout is not None else upstream_setting(name, 'READ_TIMEOUT', 10.0, float),
+        )
+        self.keep_alive = keep_alive if keep_alive is not None else upstream_setting(name, 'KEEP_ALIVE', True,
+                                                                             lambda v: v == '1')
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # The session is shared by every caller: never carry one user's
+        # cookies over to the next request (per-call cookies still work)
+        self.session.cookies.set_policy(cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        # Don't pick up proxies or netrc credentials from the environment
+        self.session.trust_env = False
+        if not self.keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+        self.breaker = CircuitBreaker(name)
+        self.retries = RetryPolicy(name)
+
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.max_in_use = 0
+        self.saturated = 0
+
+    def url(self, path):
+        return f'{self.base_url}/{path.lstrip("/")}'
+
+    def request(self, method, path, **kwargs):
+        """Send ``method path`` (relative to ``base_url``); returns the ``requests`` response.
+
+        Raises :class:`resilience.CircuitOpenError` while the breaker is open
+        and :class:`resilience.DeadlineExceeded` once the deadline passed.
+        A call is retried only if its method is idempotent and its body can
+        be sent again (not a stream).
+        """
+        deadline = current_deadline()
+        retryable = method.upper() in IDEMPOTENT_METHODS and _replayable(kwargs.get('data'))
+        self.retries.budget.record_call()
+        attempt = 0
+        while True:
+            self.breaker.check()
+            try:
+                response = self._send(method, path, deadline, kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.breaker.record_failure()
+                if deadline is not None and time_left(deadline) <= 0:
+                    DEADLINE_EXCEEDED.labels(self.name).inc()
+                    raise DeadlineExceeded(f'{self.name} did not answer before the deadline') from e
+                delay = self.retries.delay(attempt, deadline) if retryable else None
+                if delay is None:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                delay = self.retries.delay(attempt, deadline) if retryable else None
+                if delay is None:
+                    return response
+                response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, method, path, deadline, kwargs):
+        kwargs = dict(kwargs)
+        timeout = kwargs.pop('timeout', self.timeout)
+        if deadline is not None:
+            left = time_left(deadline)
+            if left <= 0:
+                DEADLINE_EXCEEDED.labels(self.name).inc()
+                raise DeadlineExceeded(f'Deadline passed before calling {self.name}')
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            timeout = tuple(left if t is None else min(t, left) for t in timeout)
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), DEADLINE_HEADER: deadline_header(deadline)}
+        with self._lock:
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+            if self.in_use > self.pool_size:
+                self.saturated += 1
+        try:
+            return upstream_request(self.name, method, self.url(path), session=self.session, timeout=timeout,
+                                    **kwargs)
+        finally:
+            with self._lock:
+                self.in_use -= 1
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pool_size': self.pool_size,
+                'in_use': self.in_use,
+                'max_in_use': self.max_in_use,
+                'saturated': self.saturated,
+            }
+
+    def close(self):
+        self.session.close()
+
+
+def _replayable(data):
+    return data is None or isinstance(data, (bytes, str, dict, list, tuple))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, base_url, **settings):
+    """The shared client for upstream ``name``, created on first use."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = UpstreamClient(name, base_url, **settings)
+    return client
+
+
+def _pool_stat(key):
+    return lambda: {(name,): client.stats()[key] for name, client in list(_clients.items())}
+
+
+REGISTRY.gauge('upstream_pool_size', 'Connections kept open per upstream.', _pool_stat('pool_size'), ('upstream',))
+REGISTRY.gauge('upstream_pool_in_use', 'Upstream calls in flight.', _pool_stat('in_use'), ('upstream',))
+REGISTRY.gauge('upstream_pool_max_in_use', 'Most upstream calls in flight at once since start.',
+               _pool_stat('max_in_use'), ('upstream',))
+REGISTRY.gauge('upstream_pool_saturated_calls', 'Upstream calls made while every pooled connection was busy.',
+               _pool_stat('saturated'), ('upstream',))